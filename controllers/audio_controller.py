@@ -0,0 +1,97 @@
+from urllib.parse import parse_qs
+
+from controllers.projectos_controller import ProjectosController
+from services.auth_service import AuthService
+from services.loudness_service import LoudnessService
+from services.peaks_service import PeaksService
+from services.silencio_service import LIMIAR_PADRAO_DB, MINIMO_PADRAO_S, SilencioService
+
+
+class AudioController:
+    @staticmethod
+    def obter_picos(environ, audio_id):
+        """
+        GET /api/audio/{audio_id}/peaks?zoom=N&start=S&end=E
+        Retorna os picos (mínimo/máximo) da forma de onda da versão atual do áudio.
+        zoom=0 é a maior resolução (256 amostras por pico) e cada nível acima tem a metade dos
+        picos. start e end (em segundos) são opcionais e limitam o trecho retornado.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 200 OK: {"status": "sucesso", "zoom": 3, "niveis": 14, "taxa": 44100, "amostras_por_pico": 2048, "inicio": 0.0, "duracao": 180.5, "picos": [[-1200, 1350], ...]}
+            - 202 Accepted: {"status": "pendente", "job_url": "/api/jobs/...", "retry_after": 5}, picos desta versão ainda em cálculo
+            - 400 Bad Request: {"status": "erro", "message": "zoom deve estar entre 0 e 13"}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Áudio não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        try:
+            zoom = int(query.get("zoom", ["0"])[0])
+            inicio = float(query["start"][0]) if query.get("start", [""])[0] else None
+            fim = float(query["end"][0]) if query.get("end", [""])[0] else None
+        except ValueError:
+            return {"status": "erro", "message": "Parâmetros inválidos."}
+
+        return PeaksService.obter_picos_audio(audio_id, auth_response["user_id"], zoom, inicio, fim)
+
+    @staticmethod
+    def obter_loudness(environ, audio_id):
+        """
+        GET /api/audio/{audio_id}/loudness?blocos=1
+        Retorna a análise de loudness do arquivo (EBU R128): loudness integrada, true peak,
+        pico, LRA e RMS. Medida na primeira consulta e gravada; as seguintes não leem o áudio.
+        Com blocos=1, inclui o RMS (dBFS) de cada bloco de `bloco_rms_s` segundos.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 200 OK: {"status": "sucesso", "audio_id": 3, "integrado_lufs": -18.4, "true_peak_dbtp": -0.9, "pico_dbfs": -1.2, "lra": 7.5, "rms_dbfs": -21.3, "bloco_rms_s": 1.0}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Áudio não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        incluir_blocos = query.get("blocos", ["0"])[0] in ("1", "true")
+        return LoudnessService.obter_audio(audio_id, auth_response["user_id"], incluir_blocos)
+
+    @staticmethod
+    def obter_silencios(environ, audio_id):
+        """
+        GET /api/audio/{audio_id}/silencios?limiar=-40&minimo=0.5
+        Retorna os silêncios da versão atual do áudio: trechos com RMS abaixo de `limiar` (dBFS)
+        por pelo menos `minimo` segundos. O envelope de RMS é calculado uma vez por versão, por
+        um job; consultas com outros limiares não leem o áudio de novo.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 200 OK: {"status": "sucesso", "audio_id": 3, "limiar_db": -40.0, "minimo_s": 0.5, "duracao": 340.2, "total_silencio": 27.8, "silencios": [[12.34, 13.1], ...]}
+            - 202 Accepted: {"status": "pendente", "job_url": "/api/jobs/...", "retry_after": 5}, envelope desta versão ainda em cálculo
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Áudio não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        try:
+            limiar_db = float(query.get("limiar", [LIMIAR_PADRAO_DB])[0])
+            minimo_s = float(query.get("minimo", [MINIMO_PADRAO_S])[0])
+        except ValueError:
+            return {"status": "erro", "message": "limiar e minimo devem ser números"}
+        return SilencioService.obter_audio(audio_id, auth_response["user_id"], limiar_db, minimo_s)
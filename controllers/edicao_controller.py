@@ -9,8 +9,11 @@ from controllers.projectos_controller import ProjectosController
 from database import conectar
 from services.auth_service import AuthService
 from services.edicao_service import EdicaoAudioService
+from services.ffmpeg_service import FfmpegSaturadoError
 from services.historico_service import HistoricoService
+from services.job_service import JobService
 from services.projectos_service import ProjectosService
+from services.silencio_service import LIMIAR_PADRAO_DB, MARGEM_PADRAO_S, MINIMO_PADRAO_S
 
 UPLOAD_DIR = "uploads"
 BASE_URL = "http://localhost:8000/"
@@ -33,11 +36,13 @@ class EdicaoAudioController:
             file_name = data.get("file_name")
             inicio = int(data.get("inicio", 0))
             fim = int(data.get("fim", 0))
+            smart_render = bool(data.get("smart_render", False))
 
             if not project_id or not file_name:
                 return {"status": "erro", "message": "project_id e file_name são obrigatórios."}
 
-            return EdicaoAudioService.recortar_audio(project_id, file_name, inicio, fim, user_id)
+            return EdicaoAudioService.recortar_audio(project_id, file_name, inicio, fim, user_id, smart_render,
+                                                     bool(data.get("preview", False)))
 
         except json.JSONDecodeError:
             return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
@@ -63,13 +68,60 @@ class EdicaoAudioController:
             file1_name = data["file1"]
             file2_name = data["file2"]
 
-            return EdicaoAudioService.mesclar_audio(project_id, file1_name, file2_name, user_id)
+            return JobService.submeter(user_id, project_id, "mesclar", {
+                "project_id": project_id, "file1_name": file1_name, "file2_name": file2_name, "user_id": user_id,
+            })
 
         except json.JSONDecodeError:
             return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
         except Exception as e:
             return {"status": "erro", "message": str(e)}, 500
 
+    @staticmethod
+    def mixar_audios(environ):
+        """
+        POST /api/editar/mixar
+        Mixa qualquer número de faixas do projeto num novo áudio, cada uma com ganho, offset e pan.
+        A mixagem é feita em segundo plano; o resultado é consultado em /api/jobs/{id}.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Body:
+            {"project_id": 1, "faixas": [
+                {"file_name": "voz.mp3", "ganho_db": 0, "offset": 0, "pan": 0},
+                {"file_name": "musica.mp3", "ganho_db": -12, "offset": 2.5, "pan": -0.3}
+            ]}
+
+        Response:
+            - 202 Accepted: {"status": "pendente", "job_id": "...", "job_url": "/api/jobs/..."}
+            - 400 Bad Request: {"status": "erro", "message": "..."}
+            - 503 Service Unavailable: {"status": "ocupado", "message": "...", "retry_after": 5}
+        """
+        try:
+            request_body_size = int(environ.get('CONTENT_LENGTH', 0))
+            request_body = environ['wsgi.input'].read(request_body_size)
+            data = json.loads(request_body.decode("utf-8"))
+
+            token = ProjectosController._get_token(environ)
+            auth_response = AuthService.verificar_token(token)
+            if auth_response["status"] == "erro":
+                return {"status": "erro", "message": "Acesso negado"}
+
+            user_id = auth_response["user_id"]
+            project_id = data.get("project_id")
+            faixas = data.get("faixas")
+            if not project_id or not isinstance(faixas, list) or not faixas:
+                return {"status": "erro", "message": "project_id e faixas são obrigatórios."}
+
+            return JobService.submeter(user_id, project_id, "mixar", {
+                "project_id": project_id, "faixas": faixas, "user_id": user_id,
+            })
+
+        except json.JSONDecodeError:
+            return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
 
     @staticmethod
     def alongar_audio(environ):
@@ -87,7 +139,11 @@ class EdicaoAudioController:
             start_time = float(data.get("start_time", 0))
             end_time = float(data.get("end_time", 0))
 
-            return EdicaoAudioService.alongar_audio(project_id, file_name, start_time, end_time,user_id)
+            if not project_id or not file_name or start_time < 0 or end_time <= start_time:
+                return {"status": "erro", "message": "Parâmetros inválidos."}
+
+            return EdicaoAudioService.alongar_audio(project_id, file_name, start_time, end_time, user_id,
+                                                    bool(data.get("preview", False)))
 
         except json.JSONDecodeError:
             return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
@@ -111,8 +167,13 @@ class EdicaoAudioController:
             file_name = data.get("file_name")
             start_time = float(data.get("start_time", 0))
             end_time = float(data.get("end_time", 0))
+            smart_render = bool(data.get("smart_render", False))
             print(user_id, project_id, file_name, start_time, end_time)
-            return EdicaoAudioService.encurtar_audio(project_id, file_name, start_time, end_time,user_id)
+            if not project_id or not file_name or start_time < 0 or end_time <= start_time:
+                return {"status": "erro", "message": "Parâmetros inválidos."}
+
+            return EdicaoAudioService.encurtar_audio(project_id, file_name, start_time, end_time, user_id,
+                                                     smart_render, bool(data.get("preview", False)))
 
         except json.JSONDecodeError:
             return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
@@ -121,6 +182,55 @@ class EdicaoAudioController:
         except Exception as e:
             return {"status": "erro", "message": str(e)}
 
+    @staticmethod
+    def remover_silencios(environ):
+        """
+        POST /api/editar/remover-silencios
+        Remove de uma vez todos os silêncios do áudio (trechos abaixo de `limiar_db` por pelo
+        menos `minimo_s` segundos), deixando `margem_s` segundos de cada lado. Os silêncios
+        podem ser consultados antes em /api/audio/{id}/silencios.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Body:
+            {"project_id": 1, "file_name": "entrevista.mp3", "limiar_db": -40, "minimo_s": 0.5,
+             "margem_s": 0.1, "preview": false}
+
+        Response:
+            - 200 OK: {"status": "sucesso", "file_name": "...", "audio_url": "...", "edit_id": 12, "duracao": 312.4}
+            - 202 Accepted: {"status": "pendente", "job_url": "/api/jobs/...", "retry_after": 5}, silêncios desta
+              versão ainda em cálculo; nenhuma edição foi feita, repetir o pedido depois do Retry-After
+            - 400 Bad Request: {"status": "erro", "message": "Nenhum silêncio encontrado com esses parâmetros."}
+            - 503 Service Unavailable: {"status": "ocupado", "message": "...", "retry_after": 5}
+        """
+        try:
+            request_body_size = int(environ.get('CONTENT_LENGTH', 0))
+            request_body = environ['wsgi.input'].read(request_body_size)
+            data = json.loads(request_body.decode("utf-8"))
+
+            token = ProjectosController._get_token(environ)
+            auth_response = AuthService.verificar_token(token)
+            if auth_response["status"] == "erro":
+                return {"status": "erro", "message": "Acesso negado"}
+
+            user_id = auth_response["user_id"]
+            project_id = data.get("project_id")
+            file_name = data.get("file_name")
+            limiar_db = float(data.get("limiar_db", LIMIAR_PADRAO_DB))
+            minimo_s = float(data.get("minimo_s", MINIMO_PADRAO_S))
+            margem_s = float(data.get("margem_s", MARGEM_PADRAO_S))
+
+            return EdicaoAudioService.remover_silencios(project_id, file_name, user_id, limiar_db, minimo_s,
+                                                        margem_s, bool(data.get("preview", False)))
+
+        except json.JSONDecodeError:
+            return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
+        except FfmpegSaturadoError as e:
+            return {"status": "ocupado", "message": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
+
     @staticmethod
     def aplicar_efeito(environ):
         try:
@@ -138,14 +248,67 @@ class EdicaoAudioController:
             project_id = data.get("project_id")
             file_name = data.get("file_name")
             efeito = data.get("efeito")
+            parametros = data.get("parametros")
             print(user_id,project_id,file_name,efeito)
-            return EdicaoAudioService.aplicar_efeito(project_id, file_name, efeito, user_id)
+            return EdicaoAudioService.aplicar_efeito(project_id, file_name, efeito, user_id, parametros,
+                                                     bool(data.get("preview", False)))
 
         except json.JSONDecodeError:
             return {"status": "erro", "message": "Erro ao decodificar JSON."}
         except Exception as e:
             return {"status": "erro", "message": str(e)}
 
+    @staticmethod
+    def editar_em_lote(environ):
+        """
+        POST /api/editar/lote
+        Aplica uma lista ordenada de edições a um arquivo do projeto numa única requisição.
+        As operações são validadas juntas e o áudio resultante é codificado uma única vez.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Body ("preview": true pede uma prévia imediata e a versão completa em segundo plano):
+            {"project_id": 1, "file_name": "audio.mp3", "preview": false, "operacoes": [
+                {"operacao": "recortar", "inicio": 0, "fim": 30},
+                {"operacao": "encurtar", "start_time": 5, "end_time": 8},
+                {"operacao": "alongar", "start_time": 0, "end_time": 2},
+                {"operacao": "aplicar-efeito", "efeito": "equalizador", "parametros": {"graves_db": 3}}
+            ]}
+
+        Response:
+            - 200 OK: {"status": "sucesso", "file_name": "...", "audio_url": "...", "edit_id": 12, "duracao": 24.0}
+              (com preview: também "preview_url" e "job_url")
+            - 400 Bad Request: {"status": "erro", "message": "Operação 2: parâmetros inválidos."}
+        """
+        try:
+            request_body_size = int(environ.get('CONTENT_LENGTH', 0))
+            request_body = environ['wsgi.input'].read(request_body_size)
+            data = json.loads(request_body.decode("utf-8"))
+
+            token = ProjectosController._get_token(environ)
+            auth_response = AuthService.verificar_token(token)
+            if auth_response["status"] == "erro":
+                return {"status": "erro", "message": "Acesso negado"}
+
+            user_id = auth_response["user_id"]
+            project_id = data.get("project_id")
+            file_name = data.get("file_name")
+            operacoes = data.get("operacoes")
+
+            if not isinstance(operacoes, list):
+                return {"status": "erro", "message": "operacoes deve ser uma lista."}
+
+            return EdicaoAudioService.editar_em_lote(project_id, file_name, operacoes, user_id,
+                                                     bool(data.get("preview", False)))
+
+        except json.JSONDecodeError:
+            return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
+        except UnicodeDecodeError:
+            return {"status": "erro", "message": "Erro de codificação. Verifique se a requisição está correta."}
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
+
     @staticmethod
     def excluir_audio(environ):
         try:
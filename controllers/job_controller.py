@@ -0,0 +1,26 @@
+from controllers.projectos_controller import ProjectosController
+from services.auth_service import AuthService
+from services.job_service import JobService
+
+
+class JobController:
+    @staticmethod
+    def obter_job(environ, job_id):
+        """
+        GET /api/jobs/{job_id}
+        Consulta o estado de um job de renderização criado por um endpoint /api/editar/*.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 200 OK: {"status": "sucesso", "job": {"id": "...", "operacao": "recortar", "status": "pendente|executando|concluido|falhou", "resultado": {...}}}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Job não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        return JobService.obter_job(job_id, auth_response["user_id"])
@@ -1,8 +1,8 @@
 import json
 import mimetypes
 import os
-from email.parser import BytesParser
-from email.policy import default
+from estaticos import enviar_arquivo
+from multipart import MultipartErro, ler_multipart
 from services.projectos_service import ProjectosService
 
 class ProjectosController:
@@ -36,28 +36,23 @@ class ProjectosController:
             return {"status": "erro", "message": "Método inválido"}
 
         form_data, files, error = ProjectosController._parse_multipart_data(environ)
-        if "error" in form_data:
-            return {"status": "erro", "message": error}
-
-        titulo = form_data.get("titulo")
-        audio_file = files.get("audio")
-        print(titulo)
-        if not titulo or not audio_file:
-            return {"status": "erro", "message": "Título e áudio são obrigatórios"}
-
-        # Salvar o arquivo
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, audio_file["filename"])
+        if error:
+            return {"status": "erro", "message": error["error"]}
 
         try:
-            with open(file_path, "wb") as f:
-                f.write(audio_file["file"])
+            titulo = form_data.get("titulo")
+            audio_file = files.get("audio")
+            print(titulo)
+            if not titulo or not audio_file:
+                return {"status": "erro", "message": "Título e áudio são obrigatórios"}
 
             return ProjectosService.criar_projecto(token, titulo, audio_file)
 
         except Exception as e:
             return {"status": "erro", "message": str(e)}
+        finally:
+            for arquivo in files.values():
+                arquivo.descartar()  # Os que o serviço não salvou
 
     @staticmethod
     def obter_projecto(environ, project_id):
@@ -70,6 +65,32 @@ class ProjectosController:
         token = ProjectosController._get_token(environ)
         return ProjectosService.excluir_projeto(token, project_id)
 
+    @staticmethod
+    def definir_codec(environ, project_id):
+        """
+        PUT /api/projectos/{project_id}/codec
+        Define o codec em que os áudios do projeto são reproduzidos e baixados. As edições
+        continuam lendo do intermediário; só a entrega é codificada nesse formato.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Body:
+            {"codec": "opus"}  (mp3, aac, opus, flac ou wav)
+
+        Response:
+            - 200 OK: {"status": "sucesso", "message": "Codec atualizado", "codec_saida": "opus"}
+            - 400 Bad Request: {"status": "erro", "message": "Codec inválido. Use um de: ..."}
+        """
+        token = ProjectosController._get_token(environ)
+        try:
+            request_body_size = int(environ.get("CONTENT_LENGTH", 0))
+            data = json.loads(environ["wsgi.input"].read(request_body_size).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
+
+        return ProjectosService.definir_codec(token, project_id, data.get("codec"))
+
     @staticmethod
     def retroceder_edicao(environ, project_id, file_name):
         token = ProjectosController._get_token(environ)
@@ -79,6 +100,15 @@ class ProjectosController:
 
         return ProjectosService.retroceder_edicao(token, project_id, file_name)
 
+    @staticmethod
+    def avancar_edicao(environ, project_id, file_name):
+        token = ProjectosController._get_token(environ)
+
+        if not token:
+            return {"status": "erro", "message": "Token não fornecido"}
+
+        return ProjectosService.avancar_edicao(token, project_id, file_name)
+
     @staticmethod
     def upload_audio(environ):
         token = ProjectosController._get_token(environ)
@@ -95,13 +125,17 @@ class ProjectosController:
         if error:
             return {"status": "erro", "message": error["error"]}
 
-        project_id = post_data.get("project_id", "")  # Agora, post_data é um dicionário
-        audio_file = files.get("audio")
+        try:
+            project_id = post_data.get("project_id", "")  # Agora, post_data é um dicionário
+            audio_file = files.get("audio")
 
-        if not project_id or not audio_file:
-            return {"status": "erro", "message": "Projeto ou áudio não informado"}
+            if not project_id or not audio_file:
+                return {"status": "erro", "message": "Projeto ou áudio não informado"}
 
-        return ProjectosService.upload_audio(token, project_id, audio_file)
+            return ProjectosService.upload_audio(token, project_id, audio_file)
+        finally:
+            for arquivo in files.values():
+                arquivo.descartar()  # Os que o serviço não salvou
 
     @staticmethod
     def baixar_projecto(project_id, token):
@@ -114,29 +148,27 @@ class ProjectosController:
 
                 Response:
                     - 200 OK: Download do arquivo ZIP
+                    - 202 Accepted: {"status": "pendente", "jobs": [...]}, versões editadas ainda em
+                      renderização; tentar de novo depois do Retry-After
+                    - 503 Service Unavailable: fila de renderização cheia (com Retry-After)
                     - 400 Bad Request: {"status": "erro", "message": "Projeto não encontrado"}
                 """
         return ProjectosService.baixar_projecto(token, project_id)
 
     @staticmethod
-    def enviar_arquivo_zip(zip_file_path, project_id, start_response):
-        """Envia o arquivo ZIP como resposta HTTP."""
+    def enviar_arquivo_zip(environ, zip_file_path, project_id, start_response):
+        """Envia o arquivo ZIP como resposta HTTP, em streaming (estaticos.enviar_arquivo)."""
         if os.path.exists(zip_file_path):
             mime_type, _ = mimetypes.guess_type(zip_file_path)
             mime_type = mime_type or "application/zip"
 
-            with open(zip_file_path, "rb") as f:
-                response_data = f.read()
-
             headers = [
-                ('Content-Type', mime_type),
                 ('Content-Disposition', f'attachment; filename="projeto_{project_id}.zip"'),
                 ('Access-Control-Allow-Origin', '*'),  # Adicionar cabeçalho CORS aqui também
                 ('Access-Control-Allow-Headers', 'Content-Type, Authorization'),
                 ('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
             ]
-            start_response('200 OK', headers)
-            return [response_data]
+            return enviar_arquivo(environ, start_response, zip_file_path, mime_type, headers)
 
         start_response('400 Bad Request', [
             ('Content-Type', 'application/json'),
@@ -154,36 +186,15 @@ class ProjectosController:
 
     @staticmethod
     def _parse_multipart_data(environ):
-        """Processa multipart/form-data."""
-        content_type = environ.get("CONTENT_TYPE", "")
-        if "multipart/form-data" not in content_type:
-            return {}, {}, {"error": "Content-Type inválido"}
-
-        content_length = int(environ.get("CONTENT_LENGTH", 0))
-        body = environ["wsgi.input"].read(content_length)
-
+        """Processa multipart/form-data em streaming: os arquivos vão direto para o disco (multipart.py)."""
         try:
-            headers = f"Content-Type: {content_type}\r\n\r\n".encode() + body
-            msg = BytesParser(policy=default).parsebytes(headers)
-
-            post_data = {}
-            files = {}
-
-            for part in msg.iter_parts():
-                name = part.get_param("name", header="content-disposition")
-                filename = part.get_filename()
-
-                print(f"🔹 Nome do campo: {name}")  # Verificando os campos recebidos
-                print(f"🔹 Nome do arquivo: {filename}")  # Verificando se o arquivo está presente
+            post_data, files = ler_multipart(environ)
+        except MultipartErro as e:
+            return {}, {}, {"error": str(e)}
+        except Exception as e:
+            return {}, {}, {"error": f"Erro ao processar multipart: {str(e)}"}
 
-                if filename:
-                    files[name] = {
-                        "filename": filename,
-                        "file": part.get_payload(decode=True)
-                    }
-                else:
-                    post_data[name] = part.get_payload(decode=True).decode()
+        for name, arquivo in files.items():
+            print(f"🔹 Arquivo recebido no campo {name}: {arquivo.filename} ({arquivo.tamanho} bytes)")
 
-            return post_data, files, None  # Retorna post_data, files e erro (None se não houver erro)
-        except Exception as e:
-            return {}, {}, {"error": f"Erro ao processar multipart: {str(e)}"}
\ No newline at end of file
+        return post_data, files, None  # Retorna post_data, files e erro (None se não houver erro)
@@ -0,0 +1,140 @@
+import json
+
+from controllers.projectos_controller import ProjectosController
+from services.auth_service import AuthService
+from services.upload_service import UploadService
+
+
+class UploadController:
+    @staticmethod
+    def criar_upload(environ):
+        """
+        POST /api/uploads
+        Cria uma sessão de upload retomável, para enviar um áudio grande em trechos. Informe
+        project_id para adicionar o áudio a um projeto ou titulo para criar um projeto novo.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Body:
+            {"file_name": "gravacao.wav", "tamanho": 4294967296, "project_id": 5}
+            {"file_name": "gravacao.wav", "tamanho": 4294967296, "titulo": "Sessão de ensaio"}
+
+        Response:
+            - 201 Created: {"status": "sucesso", "upload_id": "...", "upload_url": "/api/uploads/{upload_id}", "offset": 0, "tamanho": 4294967296}
+            - 400 Bad Request: {"status": "erro", "message": "Tamanho inválido"}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 429 Too Many Requests: {"status": "limite", "message": "Limite de 5 uploads em andamento; finalize ou cancele um deles"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        try:
+            request_body_size = int(environ.get("CONTENT_LENGTH", 0))
+            data = json.loads(environ["wsgi.input"].read(request_body_size).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            return {"status": "erro", "message": "Erro ao decodificar JSON. Verifique o formato da requisição."}
+
+        return UploadService.criar_sessao(auth_response["user_id"], data.get("file_name"), data.get("tamanho"),
+                                          data.get("project_id"), data.get("titulo"))
+
+    @staticmethod
+    def obter_upload(environ, upload_id):
+        """
+        GET /api/uploads/{upload_id}
+        Consulta quantos bytes do upload o servidor já recebeu. Depois de uma conexão
+        interrompida, o envio continua a partir de `offset`.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 200 OK: {"status": "sucesso", "upload_id": "...", "file_name": "gravacao.wav", "offset": 1048576, "tamanho": 4294967296}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Upload não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        return UploadService.obter_sessao(upload_id, auth_response["user_id"])
+
+    @staticmethod
+    def enviar_trecho(environ, upload_id):
+        """
+        PATCH /api/uploads/{upload_id}
+        Envia o próximo trecho do arquivo. O corpo são os bytes do trecho e Upload-Offset é a
+        posição dele no arquivo, que precisa ser igual ao que o servidor já recebeu.
+
+        Headers:
+            - Authorization: Bearer <token>
+            - Upload-Offset: 1048576
+            - Content-Type: application/offset+octet-stream
+
+        Response:
+            - 200 OK: {"status": "sucesso", "upload_id": "...", "offset": 2097152, "tamanho": 4294967296, "completo": false}
+            - 400 Bad Request: {"status": "erro", "message": "O trecho passa do tamanho declarado do upload"}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Upload não encontrado"}
+            - 409 Conflict: {"status": "conflito", "message": "Upload-Offset diferente do recebido até agora", "offset": 1048576}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        try:
+            offset = int(environ.get("HTTP_UPLOAD_OFFSET", ""))
+            tamanho = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            return {"status": "erro", "message": "Upload-Offset inválido ou ausente"}
+
+        return UploadService.enviar_trecho(upload_id, auth_response["user_id"], offset,
+                                           environ["wsgi.input"], tamanho)
+
+    @staticmethod
+    def finalizar_upload(environ, upload_id):
+        """
+        POST /api/uploads/{upload_id}/finalizar
+        Conclui um upload que já recebeu todos os bytes: o áudio é adicionado ao projeto (ou o
+        projeto é criado) como num upload comum.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 201 Created: {"status": "sucesso", "message": "Áudio salvo com sucesso", "file_path": "uploads/gravacao.wav"}
+            - 400 Bad Request: {"status": "erro", "message": "Upload incompleto: 1048576 de 4294967296 bytes", "offset": 1048576}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Upload não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        return UploadService.finalizar(upload_id, auth_response["user_id"], token)
+
+    @staticmethod
+    def cancelar_upload(environ, upload_id):
+        """
+        DELETE /api/uploads/{upload_id}
+        Cancela o upload e apaga o que já foi recebido.
+
+        Headers:
+            - Authorization: Bearer <token>
+
+        Response:
+            - 200 OK: {"status": "sucesso", "message": "Upload cancelado"}
+            - 401 Unauthorized: {"status": "erro", "message": "Acesso negado"}
+            - 404 Not Found: {"status": "erro", "message": "Upload não encontrado"}
+        """
+        token = ProjectosController._get_token(environ)
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        return UploadService.cancelar(upload_id, auth_response["user_id"])
@@ -39,6 +39,7 @@ def criar_tabelas():
             file_name VARCHAR(255) NOT NULL,
             file_path TEXT NOT NULL,
             duration DECIMAL(10,2) NOT NULL,
+            head_edit_id BIGINT DEFAULT NULL,  -- Versão atual (nó de audio_edits); NULL = original
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             PRIMARY KEY (id),
             UNIQUE KEY unique_file_name (file_name)  -- 🔹 Coloque o UNIQUE aqui
@@ -48,16 +49,55 @@ def criar_tabelas():
         CREATE TABLE IF NOT EXISTS audio_edits (
             id BIGINT NOT NULL AUTO_INCREMENT,
             audio_id BIGINT DEFAULT NULL,
-            edit_type ENUM('cortar','alongar','encurtar') NOT NULL,
-            start_time DECIMAL(10,2) NOT NULL,
-            end_time DECIMAL(10,2) NOT NULL,
+            parent_id BIGINT DEFAULT NULL,  -- Edição anterior na mesma versão; NULL = aplicada ao original
+            edit_type ENUM('cortar','alongar','encurtar','efeito','silencios') NOT NULL,
+            start_time DECIMAL(10,3) DEFAULT NULL,
+            end_time DECIMAL(10,3) DEFAULT NULL,
+            parametros TEXT,
             created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
             PRIMARY KEY (id),
             KEY audio_id (audio_id),
+            KEY audio_parent (audio_id, parent_id),
             CONSTRAINT audio_edits_ibfk_1 FOREIGN KEY (audio_id) REFERENCES audio_files (id) ON DELETE CASCADE
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
         """,
         """
+        CREATE TABLE IF NOT EXISTS audio_blobs (
+            chave CHAR(64) NOT NULL,  -- Chave da versão no RenderCacheService
+            audio_id BIGINT NOT NULL,
+            edit_id BIGINT DEFAULT NULL,  -- Cabeça da versão em audio_edits
+            tamanho BIGINT NOT NULL,
+            chunks MEDIUMTEXT NOT NULL,  -- Lista JSON dos hashes dos chunks, na ordem
+            created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chave),
+            KEY audio_id (audio_id),
+            KEY edit_id (edit_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS blob_chunks (
+            hash CHAR(64) NOT NULL,
+            tamanho INT NOT NULL,
+            refs INT NOT NULL DEFAULT 0,  -- Quantas vezes o chunk aparece nas versões de audio_blobs
+            PRIMARY KEY (hash)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS audio_loudness (
+            audio_id BIGINT NOT NULL,
+            content_hash CHAR(64) NOT NULL,
+            integrado_lufs DECIMAL(6,2) DEFAULT NULL,
+            true_peak_dbtp DECIMAL(6,2) DEFAULT NULL,
+            pico_dbfs DECIMAL(6,2) DEFAULT NULL,
+            lra DECIMAL(6,2) DEFAULT NULL,
+            rms_dbfs DECIMAL(6,2) DEFAULT NULL,
+            rms_blocos MEDIUMTEXT,
+            created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (audio_id),
+            CONSTRAINT audio_loudness_ibfk_1 FOREIGN KEY (audio_id) REFERENCES audio_files (id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+        """,
+        """
         CREATE TABLE IF NOT EXISTS usuarios (
             id INT NOT NULL AUTO_INCREMENT,
             nome VARCHAR(255) NOT NULL,
@@ -75,6 +115,7 @@ def criar_tabelas():
             id BIGINT NOT NULL AUTO_INCREMENT,
             project_name VARCHAR(255) NOT NULL,
             user_id INT DEFAULT NULL,
+            codec_saida VARCHAR(16) NOT NULL DEFAULT 'mp3',  -- Formato de reprodução e download (EdlService.CODECS_SAIDA)
             created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             PRIMARY KEY (id),
@@ -137,6 +178,24 @@ def criar_tabelas():
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
         """,
         """
+        CREATE TABLE IF NOT EXISTS render_jobs (
+            id VARCHAR(36) NOT NULL,
+            user_id INT NOT NULL,
+            projeto_id BIGINT DEFAULT NULL,
+            operacao VARCHAR(50) NOT NULL,
+            parametros TEXT NOT NULL,
+            status ENUM('pendente','executando','concluido','falhou') NOT NULL DEFAULT 'pendente',
+            resultado TEXT,
+            created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            KEY user_id (user_id),
+            KEY status (status),
+            CONSTRAINT render_jobs_ibfk_1 FOREIGN KEY (user_id) REFERENCES usuarios (id) ON DELETE CASCADE,
+            CONSTRAINT render_jobs_ibfk_2 FOREIGN KEY (projeto_id) REFERENCES projectos (id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+        """,
+        """
         CREATE TABLE IF NOT EXISTS sessoes (
             id BIGINT NOT NULL AUTO_INCREMENT,
             user_id INT NOT NULL,
@@ -157,7 +216,50 @@ def criar_tabelas():
         cursor.execute(tabela)
         print("Tabela criada com sucesso!")
 
+    # Atualizar tabelas criadas por versões anteriores
+    alteracoes = [
+        "ALTER TABLE audio_edits ADD COLUMN parametros TEXT AFTER end_time",
+        "ALTER TABLE audio_edits MODIFY edit_type ENUM('cortar','alongar','encurtar','efeito','silencios') NOT NULL",
+        "ALTER TABLE audio_edits MODIFY start_time DECIMAL(10,3) DEFAULT NULL",
+        "ALTER TABLE audio_edits MODIFY end_time DECIMAL(10,3) DEFAULT NULL",
+        "ALTER TABLE projectos ADD COLUMN codec_saida VARCHAR(16) NOT NULL DEFAULT 'mp3' AFTER user_id",
+    ]
+    for alteracao in alteracoes:
+        try:
+            cursor.execute(alteracao)
+        except mysql.connector.Error as e:
+            if e.errno != 1060:  # Coluna já existe
+                raise
+
+    # Grafo de versões: as edições gravadas antes dele formam uma cadeia cuja cabeça é a última.
+    # Cada coluna é conferida à parte: se uma subida anterior parou no meio, só o que falta é feito
+    if not _coluna_existe(cursor, "audio_edits", "parent_id"):
+        cursor.execute("ALTER TABLE audio_edits ADD COLUMN parent_id BIGINT DEFAULT NULL AFTER audio_id, "
+                       "ADD KEY audio_parent (audio_id, parent_id)")
+        cursor.execute("SELECT id, audio_id FROM audio_edits ORDER BY audio_id, id")
+        pais = []
+        anterior = (None, None)  # (audio_id, id) da edição anterior
+        for edit_id, audio_id in cursor.fetchall():
+            if anterior[0] == audio_id:
+                pais.append((anterior[1], edit_id))
+            anterior = (audio_id, edit_id)
+        cursor.executemany("UPDATE audio_edits SET parent_id = %s WHERE id = %s", pais)
+        conexao.commit()
+
+    if not _coluna_existe(cursor, "audio_files", "head_edit_id"):
+        cursor.execute("ALTER TABLE audio_files ADD COLUMN head_edit_id BIGINT DEFAULT NULL AFTER duration")
+        cursor.execute("""
+            UPDATE audio_files af
+            SET head_edit_id = (SELECT MAX(ae.id) FROM audio_edits ae WHERE ae.audio_id = af.id)
+        """)
+        conexao.commit()
+
     cursor.close()
     conexao.close()
 
-
+def _coluna_existe(cursor, tabela, coluna):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (tabela, coluna))
+    return cursor.fetchone() is not None
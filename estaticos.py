@@ -0,0 +1,145 @@
+"""
+Envio de arquivos (áudios, prévias, ZIPs dos projetos) pela `application` de server.py.
+
+O arquivo nunca é lido inteiro para a memória: a resposta é o `wsgi.file_wrapper` do servidor,
+que servidor.py envia com sendfile (do cache de páginas do kernel direto para o socket) e os
+demais servidores leem em blocos de BLOCO_ENVIO. A memória por requisição não depende do
+tamanho do arquivo.
+
+Também são tratados:
+    - Range com um intervalo de bytes: 206 Partial Content (416 se o intervalo está fora do
+      arquivo). É o que o <audio> do navegador pede ao buscar um ponto do áudio;
+    - ETag e Last-Modified, com If-None-Match/If-Modified-Since (304 Not Modified) e If-Range.
+"""
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+BLOCO_ENVIO = 256 * 1024  # Bytes por leitura quando o servidor não usa sendfile
+
+
+class TrechoArquivo:
+    """Arquivo aberto limitado ao intervalo [inicio, inicio + tamanho), entregue ao wsgi.file_wrapper"""
+
+    def __init__(self, arquivo, inicio, tamanho):
+        self.arquivo = arquivo
+        self.inicio = inicio
+        self.tamanho = tamanho
+        self.restante = tamanho
+        arquivo.seek(inicio)
+
+    def read(self, tamanho=-1):
+        if tamanho is None or tamanho < 0 or tamanho > self.restante:
+            tamanho = self.restante
+        dados = self.arquivo.read(tamanho) if tamanho else b""
+        self.restante -= len(dados)
+        return dados
+
+    def fileno(self):
+        return self.arquivo.fileno()
+
+    def close(self):
+        self.arquivo.close()
+
+
+def enviar_arquivo(environ, start_response, file_path, mime_type, extras=()):
+    """
+    Responde com o arquivo, ou com o trecho pedido no cabeçalho Range, ou 304 se a cópia do
+    cliente ainda vale. `extras` são cabeçalhos acrescentados à resposta (CORS, Content-Disposition).
+    """
+    arquivo = open(file_path, "rb")
+    try:
+        stat = os.fstat(arquivo.fileno())
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = [("ETag", etag), ("Last-Modified", last_modified),
+                   ("Cache-Control", "no-cache"),  # O mesmo endereço muda de conteúdo com as edições: sempre revalidar
+                   ("Accept-Ranges", "bytes")] + list(extras)
+
+        if _nao_modificado(environ, etag, stat.st_mtime):
+            arquivo.close()
+            start_response("304 Not Modified", headers)
+            return [b""]
+
+        intervalo = _intervalo(environ, stat.st_size, etag, last_modified)
+        if intervalo is False:
+            arquivo.close()
+            start_response("416 Range Not Satisfiable", headers + [
+                ("Content-Range", f"bytes */{stat.st_size}"), ("Content-Length", "0")])
+            return [b""]
+
+        if intervalo:
+            inicio, fim = intervalo
+            status = "206 Partial Content"
+            headers.append(("Content-Range", f"bytes {inicio}-{fim}/{stat.st_size}"))
+        else:
+            inicio, fim = 0, stat.st_size - 1
+            status = "200 OK"
+
+        corpo = TrechoArquivo(arquivo, inicio, fim - inicio + 1)
+    except Exception:
+        arquivo.close()
+        raise
+
+    start_response(status, [("Content-Type", mime_type), ("Content-Length", str(corpo.tamanho))] + headers)
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    if file_wrapper:
+        return file_wrapper(corpo, BLOCO_ENVIO)
+    return _ler_blocos(corpo)
+
+
+def _ler_blocos(corpo):
+    try:
+        for dados in iter(lambda: corpo.read(BLOCO_ENVIO), b""):
+            yield dados
+    finally:
+        corpo.close()
+
+
+def _nao_modificado(environ, etag, mtime):
+    """True se o cliente já tem esta versão do arquivo (If-None-Match tem precedência)"""
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        etags = [valor.strip().removeprefix("W/") for valor in if_none_match.split(",")]
+        return "*" in etags or etag in etags
+
+    if_modified_since = environ.get("HTTP_IF_MODIFIED_SINCE")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _intervalo(environ, tamanho, etag, last_modified):
+    """
+    (inicio, fim), inclusivo, do Range pedido; None para enviar o arquivo inteiro (sem Range,
+    Range inválido, como fim antes do início, com vários intervalos ou If-Range de outra
+    versão); False se o intervalo começa depois do fim do arquivo.
+    """
+    pedido = environ.get("HTTP_RANGE", "").strip()
+    if not pedido.startswith("bytes=") or "," in pedido:
+        return None
+
+    if_range = environ.get("HTTP_IF_RANGE")
+    if if_range and if_range.strip() not in (etag, last_modified):
+        return None  # O cliente tem outra versão: o trecho não serviria, vai o arquivo inteiro
+
+    inicio, _, fim = pedido[len("bytes="):].partition("-")
+    try:
+        if not inicio.strip():  # "bytes=-N": os últimos N bytes
+            ultimos = int(fim)
+            if ultimos <= 0:
+                return False
+            return max(0, tamanho - ultimos), tamanho - 1
+        inicio = int(inicio)
+        fim = int(fim) if fim.strip() else None
+    except ValueError:
+        return None
+
+    if inicio < 0 or (fim is not None and fim < inicio):
+        return None  # Intervalo inválido (RFC 9110): ignorado, como se não houvesse Range
+    if inicio >= tamanho:
+        return False
+    return inicio, tamanho - 1 if fim is None else min(fim, tamanho - 1)
@@ -0,0 +1,210 @@
+"""
+Leitura incremental de corpos multipart/form-data (uploads de áudio).
+
+O corpo é lido do wsgi.input em blocos de BLOCO_LEITURA e nunca fica inteiro na memória:
+os campos de arquivo vão direto para um temporário em UPLOAD_TMP_DIR (no mesmo sistema de
+arquivos de UPLOAD_DIR, para serem movidos com os.replace), com o SHA-256 calculado durante
+a escrita; os campos de texto são guardados até CAMPO_TAMANHO_MAX. A memória usada não
+depende do tamanho do upload, só de BLOCO_LEITURA.
+
+Limites: o corpo inteiro até UPLOAD_TAMANHO_MAX (recusado pelo Content-Length antes de ler
+qualquer coisa), no máximo PARTES_MAX campos e cabeçalhos de parte até CABECALHO_TAMANHO_MAX.
+"""
+
+import hashlib
+import os
+import time
+import uuid
+from email.message import Message
+from email.parser import BytesHeaderParser
+from email.policy import default
+
+UPLOAD_DIR = "uploads"
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, "tmp")
+UPLOAD_TAMANHO_MAX = int(os.environ.get("UPLOAD_TAMANHO_MAX", 1024 * 1024 * 1024))  # 1 GiB
+CAMPO_TAMANHO_MAX = 1024 * 1024  # Campos de texto (título, project_id...)
+CABECALHO_TAMANHO_MAX = 16 * 1024
+PARTES_MAX = 32
+BLOCO_LEITURA = 256 * 1024
+TEMPORARIO_EXPIRACAO_HORAS = 24
+
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+
+class MultipartErro(ValueError):
+    """Corpo multipart inválido, incompleto ou acima dos limites"""
+
+
+class ArquivoEnviado:
+    """
+    Arquivo recebido num upload, ainda num temporário: um campo de formulário multipart,
+    gravado em UPLOAD_TMP_DIR, ou um upload retomável já completo (`caminho`).
+    """
+
+    def __init__(self, filename, content_type, caminho=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.sha256 = None  # Preenchido quando o arquivo termina de ser recebido, se calculado
+        self._salvo = False
+        if caminho:
+            self.caminho = caminho
+            self.tamanho = os.path.getsize(caminho)
+            self._arquivo = None
+            return
+        self.tamanho = 0
+        self.caminho = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}.tmp")
+        self._arquivo = open(self.caminho, "wb")
+        self._hash = hashlib.sha256()
+
+    def escrever(self, dados):
+        self._arquivo.write(dados)
+        self._hash.update(dados)
+        self.tamanho += len(dados)
+
+    def fechar(self):
+        self._arquivo.close()
+        self.sha256 = self._hash.hexdigest()
+
+    def salvar(self, destino):
+        """Move o arquivo recebido para `destino` (sem copiar: mesmo sistema de arquivos)"""
+        os.replace(self.caminho, destino)
+        self.caminho = destino
+        self._salvo = True
+
+    def descartar(self):
+        """Apaga o temporário, se ele não foi salvo"""
+        if self._arquivo:
+            self._arquivo.close()
+        if not self._salvo:
+            try:
+                os.remove(self.caminho)
+            except FileNotFoundError:
+                pass
+
+
+class _Fluxo:
+    """Corpo da requisição lido em blocos, com um buffer para procurar os delimitadores"""
+
+    def __init__(self, entrada, tamanho):
+        self.entrada = entrada
+        self.restante = tamanho
+        self.buffer = bytearray()
+
+    def _preencher(self):
+        if self.restante <= 0:
+            raise MultipartErro("Corpo multipart incompleto")
+        dados = self.entrada.read(min(BLOCO_LEITURA, self.restante))
+        if not dados:
+            raise MultipartErro("Corpo multipart incompleto")
+        self.restante -= len(dados)
+        self.buffer += dados
+
+    def copiar_ate(self, marcador, escrever):
+        """Passa a `escrever` tudo até `marcador`, que é consumido. Retorna quantos bytes passou"""
+        total = 0
+        while True:
+            posicao = self.buffer.find(marcador)
+            if posicao >= 0:
+                escrever(bytes(self.buffer[:posicao]))
+                del self.buffer[:posicao + len(marcador)]
+                return total + posicao
+            # O fim do buffer pode ser o começo do marcador: fica para a próxima leitura
+            seguro = len(self.buffer) - len(marcador) + 1
+            if seguro > 0:
+                escrever(bytes(self.buffer[:seguro]))
+                del self.buffer[:seguro]
+                total += seguro
+            self._preencher()
+
+    def ler_ate(self, marcador, limite, descricao):
+        """Retorna tudo até `marcador` (consumido), recusando mais que `limite` bytes"""
+        partes = []
+        tamanho = 0
+
+        def guardar(dados):
+            nonlocal tamanho
+            tamanho += len(dados)
+            if tamanho > limite:
+                raise MultipartErro(f"{descricao} maior que {limite} bytes")
+            partes.append(dados)
+
+        self.copiar_ate(marcador, guardar)
+        return b"".join(partes)
+
+    def ler(self, tamanho):
+        while len(self.buffer) < tamanho:
+            self._preencher()
+        dados = bytes(self.buffer[:tamanho])
+        del self.buffer[:tamanho]
+        return dados
+
+
+def ler_multipart(environ):
+    """
+    Lê o corpo multipart/form-data da requisição. Retorna (campos, arquivos): os valores de
+    texto por nome e um ArquivoEnviado por nome de campo de arquivo. Quem recebe os arquivos
+    deve salvá-los (ArquivoEnviado.salvar) ou descartá-los. Levanta MultipartErro.
+    """
+    cabecalho = Message()
+    cabecalho["Content-Type"] = environ.get("CONTENT_TYPE", "")
+    boundary = cabecalho.get_param("boundary")
+    if cabecalho.get_content_type() != "multipart/form-data" or not boundary:
+        raise MultipartErro("Content-Type inválido")
+
+    try:
+        tamanho = int(environ.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        raise MultipartErro("Content-Length inválido")
+    if tamanho > UPLOAD_TAMANHO_MAX:
+        raise MultipartErro(f"Upload maior que o limite de {UPLOAD_TAMANHO_MAX // (1024 * 1024)} MB")
+
+    delimitador = b"--" + boundary.encode("latin-1")
+    fluxo = _Fluxo(environ["wsgi.input"], tamanho)
+    campos = {}
+    arquivos = {}
+    partes = 0
+
+    try:
+        fluxo.copiar_ate(delimitador, lambda dados: None)  # Preâmbulo
+        while fluxo.ler(2) != b"--":  # "--" depois do delimitador: fim do corpo
+            partes += 1
+            if partes > PARTES_MAX:
+                raise MultipartErro(f"Mais de {PARTES_MAX} campos no formulário")
+
+            cabecalhos = fluxo.ler_ate(b"\r\n\r\n", CABECALHO_TAMANHO_MAX, "Cabeçalho de campo")
+            parte = BytesHeaderParser(policy=default).parsebytes(cabecalhos + b"\r\n\r\n")
+            name = parte.get_param("name", header="content-disposition")
+            filename = parte.get_filename()
+
+            if filename:
+                arquivo = ArquivoEnviado(filename, parte.get_content_type())
+                if name in arquivos:
+                    arquivos[name].descartar()
+                arquivos[name] = arquivo
+                fluxo.copiar_ate(b"\r\n" + delimitador, arquivo.escrever)
+                arquivo.fechar()
+            else:
+                valor = fluxo.ler_ate(b"\r\n" + delimitador, CAMPO_TAMANHO_MAX, f"Campo {name}")
+                campos[name] = valor.decode()
+    except Exception:
+        for arquivo in arquivos.values():
+            arquivo.descartar()
+        raise
+
+    return campos, arquivos
+
+
+def limpar_temporarios(expiracao_horas=TEMPORARIO_EXPIRACAO_HORAS):
+    """Apaga os temporários de uploads interrompidos (chamado na subida do servidor)"""
+    limite = time.time() - expiracao_horas * 3600
+    removidos = 0
+    for nome in os.listdir(UPLOAD_TMP_DIR):
+        caminho = os.path.join(UPLOAD_TMP_DIR, nome)
+        try:
+            if os.path.isfile(caminho) and os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+                removidos += 1
+        except OSError:
+            pass
+    if removidos:
+        print(f"🔹 {removidos} upload(s) interrompido(s) removido(s).")
@@ -0,0 +1,106 @@
+"""
+Tabela de rotas da `application` de server.py.
+
+Cada rota é registrada com o método HTTP e um padrão de caminho, em que os parâmetros vão
+entre chaves, com tipo opcional: "api/projectos/{project_id:int}", "uploads/{arquivo:path}".
+O padrão é compilado uma única vez, no registro.
+
+Rotas sem parâmetros ficam num dicionário indexado por (método, caminho). As demais ficam
+num dicionário indexado por (método, prefixo fixo), em que o prefixo é o começo literal do
+padrão, com até PREFIXO_SEGMENTOS segmentos ("api/projectos", "uploads"). Uma requisição
+faz no máximo algumas consultas a dicionários e testa só as poucas expressões do seu
+prefixo: o custo não cresce com o número de endpoints nem depende da ordem de registro.
+"""
+
+import re
+
+PREFIXO_SEGMENTOS = 2
+
+# Tipo do parâmetro -> (expressão do trecho no caminho, conversor)
+TIPOS = {
+    "str": (r"[^/]+", str),
+    "int": (r"[^/]+", int),  # Validado na conversão: um ID inválido responde 400, não 404
+    "path": (r".+", str),  # Pode conter "/"
+}
+
+_PARAMETRO = re.compile(r"\{(\w+)(?::(\w+))?\}")
+
+
+class ParametroInvalido(ValueError):
+    """Um parâmetro do caminho não pôde ser convertido para o tipo da rota"""
+
+
+class Roteador:
+    """Registra as rotas e encontra o handler de cada requisição"""
+
+    def __init__(self):
+        self._estaticas = {}  # (método, caminho) -> handler
+        self._dinamicas = {}  # (método, prefixo) -> [(regex, conversores, invalido, handler)]
+
+    def rota(self, metodo, padrao, invalido=None):
+        """Decorator que registra o handler em `metodo` `padrao`"""
+        def registrar(handler):
+            self.adicionar(metodo, padrao, handler, invalido)
+            return handler
+        return registrar
+
+    def adicionar(self, metodo, padrao, handler, invalido=None):
+        """
+        Registra uma rota. `invalido` é a mensagem de erro quando um parâmetro não tem o
+        tipo esperado (por padrão, "Parâmetro inválido: {nome}").
+        """
+        if not _PARAMETRO.search(padrao):
+            self._estaticas[(metodo, padrao)] = handler
+            return
+
+        regex = []
+        conversores = {}
+        fim = 0
+        for parametro in _PARAMETRO.finditer(padrao):
+            nome, tipo = parametro.group(1), parametro.group(2) or "str"
+            if tipo not in TIPOS:
+                raise ValueError(f"Tipo de parâmetro desconhecido na rota {padrao}: {tipo}")
+            expressao, conversores[nome] = TIPOS[tipo]
+            regex.append(re.escape(padrao[fim:parametro.start()]))
+            regex.append(f"(?P<{nome}>{expressao})")
+            fim = parametro.end()
+        regex.append(re.escape(padrao[fim:]))
+
+        prefixo = []
+        for segmento in padrao.split("/")[:PREFIXO_SEGMENTOS]:
+            if "{" in segmento:
+                break
+            prefixo.append(segmento)
+
+        self._dinamicas.setdefault((metodo, "/".join(prefixo)), []).append(
+            (re.compile("".join(regex)), conversores, invalido, handler))
+
+    def resolver(self, metodo, caminho):
+        """
+        Retorna (handler, parâmetros) da rota de `metodo` `caminho`, ou (None, None) se não
+        houver nenhuma. Levanta ParametroInvalido se a rota existe mas um parâmetro não
+        tem o tipo esperado.
+        """
+        handler = self._estaticas.get((metodo, caminho))
+        if handler is not None:
+            return handler, {}
+
+        segmentos = caminho.split("/", PREFIXO_SEGMENTOS)
+        for tamanho in range(min(len(segmentos) - 1, PREFIXO_SEGMENTOS), -1, -1):
+            for regex, conversores, invalido, handler in self._dinamicas.get(
+                    (metodo, "/".join(segmentos[:tamanho])), ()):
+                encontrado = regex.fullmatch(caminho)
+                if encontrado:
+                    return handler, self._converter(encontrado.groupdict(), conversores, invalido)
+
+        return None, None
+
+    @staticmethod
+    def _converter(valores, conversores, invalido):
+        parametros = {}
+        for nome, valor in valores.items():
+            try:
+                parametros[nome] = conversores[nome](valor)
+            except ValueError:
+                raise ParametroInvalido(invalido or f"Parâmetro inválido: {nome}")
+        return parametros
@@ -1,12 +1,15 @@
 """
 Servidor WSGI para gerenciar rotas e processamento de requests HTTP.
 
-Este servidor utiliza wsgiref.simple_server para rodar na porta 8000 e
-processa diferentes endpoints para autenticação, gerenciamento de usuários
-e projetos, manipulação de áudio, entre outros.
+Este servidor roda na porta 8000 e processa diferentes endpoints para
+autenticação, gerenciamento de usuários e projetos, manipulação de áudio,
+entre outros. `python server.py` atende com o pool de threads de servidor.py;
+em produção, `python servidor.py` sobe vários processos (prefork) com reload
+por SIGHUP. SERVIDOR_MODO=simples volta ao wsgiref.simple_server, uma
+requisição de cada vez, para depuração.
 
 Módulos:
-    - email.parser: Usado para analisar uploads multipart/form-data.
+    - multipart: Lê uploads multipart/form-data em streaming, gravando os arquivos direto em disco.
     - urllib.parse: Utilizado para analisar query strings.
     - wsgiref.simple_server: Fornece um servidor WSGI simples.
     - os: Fornece uma maneira de usar funcionalidades do sistema operacional.
@@ -16,14 +19,42 @@ Módulos:
     - controllers.usuario_controller: Gerencia criação e listagem de usuários.
     - services.auth_service: Fornece serviços de autenticação.
     - controllers.projectos_controller: Gerencia operações com projetos.
+    - controllers.job_controller: Consulta os jobs de renderização assíncronos.
+    - controllers.audio_controller: Picos da forma de onda, loudness e silêncios (/api/audio/{id}/peaks,
+      /loudness, /silencios).
+
+A edição é não destrutiva: recortar, alongar, encurtar, aplicar-efeito, remover-silencios e
+lote só registram a operação em audio_edits (services.edl_service) e o áudio editado é renderizado
+em segundo plano por um job; /uploads/{arquivo} serve a versão do cache e, enquanto ela não
+fica pronta, responde 202 com o job e Retry-After. Com "preview": true, a resposta também
+traz uma prévia curta em /previews/{chave}.ogg. A mesclagem e
+a mixagem, que geram um arquivo novo, respondem 202 Accepted com o id de um job executado
+por um pool de processos (services.job_service), cujo estado é consultado em
+/api/jobs/{id}. Se a fila estiver cheia, responde 503 com Retry-After. Desfazer e refazer
+(/api/undo-audio, /api/redo-audio) só movem o ponteiro da versão atual no grafo de versões.
+Os uploads são convertidos em segundo plano para um intermediário FLAC, de onde as edições
+leem; o formato entregue em /uploads é o codec de saída do projeto (/api/projectos/{id}/codec).
+A forma de onda e os silêncios (/api/audio/{id}/peaks, /silencios) de uma versão nova são
+calculados por um job a partir do PCM; até lá a consulta (e remover-silencios) responde 202
+com o job e Retry-After, assim como o ZIP do projeto enquanto alguma versão editada não
+estiver no cache.
+/uploads, /previews e o ZIP do projeto são enviados em streaming (estaticos.py), com Range
+(206 Partial Content), ETag/Last-Modified e 304 Not Modified. Os uploads multipart são lidos
+em streaming (multipart.py), com os arquivos gravados direto em disco. Gravações grandes podem
+ser enviadas em trechos retomáveis por /api/uploads (sessão, PATCH com Upload-Offset, finalizar).
 
 Funções:
-    - parse_multipart(environ): Substitui cgi.FieldStorage para lidar com uploads multipart/form-data.
-    - application(environ, start_response): Função principal WSGI que processa requests e chama os controladores apropriados.
+    - parse_multipart(environ): Substitui cgi.FieldStorage para lidar com uploads multipart/form-data
+      (multipart.ler_multipart) e formulários urlencoded.
+    - application(environ, start_response): Função principal WSGI que encontra a rota na tabela `rotas`
+      (roteador.Roteador) e chama o handler correspondente.
+    - responder(start_response, status_code, response_body, extras): Codifica a resposta JSON com os
+      cabeçalhos CORS; usado por todas as rotas.
+
+Cada rota é um handler registrado com @rotas.rota(método, padrão), cujos parâmetros tipados do
+caminho ("api/projectos/{project_id:int}") chegam já convertidos como argumentos.
 """
 
-from email.parser import BytesParser
-from email.policy import default
 from urllib.parse import parse_qs
 from urllib.parse import unquote
 from wsgiref.simple_server import make_server
@@ -32,13 +63,25 @@ import json
 import mimetypes
 
 from controllers.admin_controller import AdminController
+from controllers.audio_controller import AudioController
 from controllers.auth_controller import AuthController
 from controllers.edicao_controller import EdicaoAudioController
+from controllers.job_controller import JobController
+from controllers.upload_controller import UploadController
 from controllers.usuario_controller import UsuarioController
 from database import criar_banco, criar_tabelas
+from estaticos import enviar_arquivo
+from multipart import ler_multipart, limpar_temporarios
+from roteador import ParametroInvalido, Roteador
 from services.auth_service import AuthService
 from controllers.projectos_controller import ProjectosController
 from services.documentacao_service import DocumentacaoService
+from services.edl_service import EdlService, VersaoPendenteError
+from services.ffmpeg_service import FfmpegSaturadoError
+from services.job_service import JobService
+from services.projectos_service import ProjectosService
+from services.render_cache_service import RenderCacheService
+from services.upload_service import UploadService
 from services.usuario_service import UsuarioService
 
 UPLOAD_DIR = "uploads"  # Pasta onde os arquivos serão armazenados
@@ -51,245 +94,311 @@ def parse_multipart(environ):
     content_type = environ.get('CONTENT_TYPE', '')
 
     if 'multipart/form-data' in content_type:
-        length = int(environ.get('CONTENT_LENGTH', 0))
-        body = environ['wsgi.input'].read(length)
-        headers = {'Content-Type': content_type}
-        parsed = BytesParser(policy=default).parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
-        return parsed
+        # (campos, arquivos), com os arquivos já gravados em disco: o corpo não fica na memória
+        return ler_multipart(environ)
     else:
         return parse_qs(environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH', 0))).decode())
 
+# Cabeçalhos CORS padrão, enviados em todas as respostas
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, PUT, PATCH, DELETE, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization, Upload-Offset'),  # Adicionando Authorization
+    ('Access-Control-Expose-Headers', 'Upload-Offset, Retry-After')
+]
+
+rotas = Roteador()
+
+
+def responder(start_response, status_code, response_body, extras=()):
+    """Codifica a resposta em JSON e a envia com os cabeçalhos CORS (usado por todas as rotas)"""
+    body = json.dumps(response_body).encode("utf-8")
+    start_response(status_code, CORS_HEADERS + list(extras) + [
+        ("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+    return [body]
+
+def responder_arquivo(environ, start_response, file_path, mime_type):
+    """Envia um arquivo em streaming com os cabeçalhos CORS (com Range e 304, ver estaticos.py)"""
+    return enviar_arquivo(environ, start_response, file_path, mime_type, CORS_HEADERS)
+
+def status_resultado(response_body, sucesso='200 OK', erro='400 Bad Request'):
+    """Status HTTP de uma resposta que só distingue sucesso de erro"""
+    return sucesso if response_body.get("status") == "sucesso" else erro
+
+def status_consulta(response_body, nao_encontrado='404 Not Found', erro='400 Bad Request'):
+    """Status HTTP de uma consulta: 200, 401 (acesso negado), 404 (não encontrado) ou `erro`"""
+    if response_body.get("status") == "sucesso":
+        return '200 OK'
+    if response_body.get("message") == "Acesso negado":
+        return '401 Unauthorized'
+    if "não encontrado" in response_body.get("message", ""):
+        return nao_encontrado
+    return erro
+
+def status_edicao(response_body):
+    """Status HTTP e cabeçalhos extras da resposta de um endpoint /api/editar/*"""
+    if response_body.get("status") == "sucesso":
+        return "200 OK", []
+    if response_body.get("status") == "pendente":
+        # Com `retry_after`, o resultado fica pronto quando o job terminar e o cliente repete o pedido
+        if "retry_after" in response_body:
+            return "202 Accepted", [("Retry-After", str(response_body["retry_after"]))]
+        return "202 Accepted", []
+    if response_body.get("status") == "ocupado":
+        # Fila de renderização cheia: o cliente deve tentar de novo depois
+        return "503 Service Unavailable", [("Retry-After", str(response_body.get("retry_after", 5)))]
+    return "400 Bad Request", []
+
 def application(environ, start_response):
     path = environ.get('PATH_INFO', '').lstrip('/')
     method = environ['REQUEST_METHOD']
 
-    # Cabeçalhos CORS padrão
-    cors_headers = [
-        ('Access-Control-Allow-Origin', '*'),
-        ('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS'),
-        ('Access-Control-Allow-Headers', 'Content-Type, Authorization')  # Adicionando Authorization
-    ]
-
     # Responder requisições OPTIONS
     if method == 'OPTIONS':
-        start_response('200 OK', [('Content-Type', 'text/plain')] + cors_headers)
+        start_response('200 OK', [('Content-Type', 'text/plain')] + CORS_HEADERS)
         return [b'']
-    # Servindo arquivos estáticos da pasta "uploads"
-    if path.startswith("uploads/"):
-        decoded_path = unquote(path.replace("uploads/", ""))  # 🔹 Decodificar a URL
-        file_path = os.path.join(UPLOAD_DIR, decoded_path)
-
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            mime_type, _ = mimetypes.guess_type(file_path)
-            mime_type = mime_type or "application/octet-stream"
-
-            with open(file_path, "rb") as f:
-                response_body = f.read()
-
-            start_response('200 OK', [('Content-Type', mime_type)] + cors_headers)
-            return [response_body]
-
-        start_response('404 Not Found', [('Content-Type', 'application/json')] + cors_headers)
-        return [json.dumps({"status": "erro", "message": "Arquivo não encontrado"}).encode("utf-8")]
-    if path == 'api/admin/usuarios' and method == 'GET':
-        response_body = AdminController.listar_usuarios(environ)
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response('200 OK', headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == 'api/admin/historico' and method == 'GET':
-        response_body = AdminController.listar_historico(environ)
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response('200 OK', headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == 'api/admin/logins' and method == 'GET':
-        response_body = AdminController.listar_logins(environ)
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response('200 OK', headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == 'api/auth/login' and method == 'POST':
-        response_body = AuthController.login(environ)
-        status_code = '200 OK' if response_body.get("status") == "sucesso" else '401 Unauthorized'
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == 'api/auth/logout' and method == 'POST':
-        response_body = AuthController.logout(environ)
-        status_code = '200 OK' if response_body.get("status") == "sucesso" else '400 Bad Request'
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == 'api/usuarios' and method == 'GET':
-        headers = environ.get('HTTP_AUTHORIZATION', '').split("Bearer ")
-        token = headers[1] if len(headers) > 1 else None
-
-        auth_response = AuthService.verificar_token(token)
-        if auth_response["status"] == "erro":
-            start_response('401 Unauthorized', cors_headers + [('Content-Type', 'application/json')])
-            return [json.dumps(auth_response).encode("utf-8")]
-
-        start_response('200 OK', cors_headers + [('Content-Type', 'application/json')])
-        return [json.dumps({"status": "sucesso", "usuarios": ["Admin", "User1"]}).encode("utf-8")]
-
-    if path == 'api/usuarios' and method == 'POST':
-        response_body = UsuarioController.criar_usuario(environ)
-        status_code = '201 CREATED' if response_body.get("status") == "sucesso" else '401 Unauthorized'
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == 'api/projectos' and method == 'GET':
-        response_body = ProjectosController.listar_projectos(environ)
-
-        # Definir status de resposta com base no retorno
-        status_code = '200 OK' if response_body.get("status") == "sucesso" else '401 Unauthorized'
-
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response(status_code, headers)
-
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path.startswith('api/undo-audio/') and method == 'GET':
-        try:
-            parts = path.split('/')
-            if len(parts) < 4:  # Garante que temos /api/undo-audio/{project_id}/{file_name}
-                raise ValueError("Parâmetros insuficientes")
-
-            project_id = int(parts[2])  # Captura o ID do projeto
-            file_name = "/".join(parts[3:])  # Captura o nome do arquivo (podendo ter '/')
-
-            response_body = ProjectosController.retroceder_edicao(environ, project_id, file_name)
-            status_code = '200 OK' if response_body.get("status") == "sucesso" else '400 Bad Request'
-            headers = cors_headers + [('Content-Type', 'application/json')]
-            start_response(status_code, headers)
-            return [json.dumps(response_body).encode("utf-8")]
-
-        except ValueError:
-            start_response('400 Bad Request', cors_headers + [('Content-Type', 'application/json')])
-            return [json.dumps({"status": "erro", "message": "ID do projeto inválido ou parâmetros ausentes"}).encode(
-                "utf-8")]
-
-    if path == 'api/projectos' and method == 'POST':
-        response_body = ProjectosController.criar_projecto(environ)
-        status_code = '201 Created' if response_body.get("status") == "sucesso" else '400 Bad Request'
-        headers = cors_headers + [('Content-Type', 'application/json')]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path.startswith('api/projectos/') and method == 'GET':
-        try:
-            project_id = int(path.split('/')[-1])
-            response_body = ProjectosController.obter_projecto(environ, project_id)
-            status_code = '200 OK' if response_body.get("status") == "sucesso" else '404 Not Found'
-            headers = cors_headers + [('Content-Type', 'application/json')]
-            start_response(status_code, headers)
-            return [json.dumps(response_body).encode("utf-8")]
-        except ValueError:
-            start_response('400 Bad Request', cors_headers + [('Content-Type', 'application/json')])
-            return [json.dumps({"status": "erro", "message": "ID do projeto inválido"}).encode("utf-8")]
-
-    if path.startswith('api/projectos/') and method == 'DELETE':
-        try:
-            project_id = int(path.split('/')[-1])
-            response_body = ProjectosController.excluir_projeto(environ, project_id)
-            status_code = '200 OK' if response_body.get("status") == "sucesso" else '400 Bad Request'
-            headers = cors_headers + [('Content-Type', 'application/json')]
-            start_response(status_code, headers)
-            return [json.dumps(response_body).encode("utf-8")]
-        except ValueError:
-            start_response('400 Bad Request', cors_headers + [('Content-Type', 'application/json')])
-            return [json.dumps({"status": "erro", "message": "ID do projeto inválido"}).encode("utf-8")]
-
-    if path == "api/upload-audio" and method == "POST":
-        response_body = ProjectosController.upload_audio(environ)
-        status_code = "201 Created" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path.startswith('api/baixar-projecto/') and method == 'GET':
-        try:
-            project_id = int(path.split('/')[-1])
-            headers = environ.get('HTTP_AUTHORIZATION', '').split("Bearer ")
-            token = headers[1] if len(headers) > 1 else None
-
-            response = ProjectosController.baixar_projecto(project_id, token)
-
-            if response["status"] == "sucesso":
-                return ProjectosController.enviar_arquivo_zip(response["zip_file_path"], project_id, start_response)
-
-            start_response('400 Bad Request', cors_headers + [('Content-Type', 'application/json')])
-            return [json.dumps(response).encode("utf-8")]
-
-        except ValueError:
-            start_response('400 Bad Request', cors_headers + [('Content-Type', 'application/json')])
-            return [json.dumps({"status": "erro", "message": "ID do projeto inválido"}).encode("utf-8")]
 
-    if path == "api/editar/recortar" and method == "POST":
-        response_body = EdicaoAudioController.recortar_audio(environ)
-        status_code = "200 OK" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == "api/editar/mesclar" and method == "POST":
-        response_body = EdicaoAudioController.mesclar_audio(environ)
+    try:
+        handler, parametros = rotas.resolver(method, path)
+    except ParametroInvalido as e:
+        return responder(start_response, '400 Bad Request', {"status": "erro", "message": str(e)})
+
+    if handler is None:
+        # Resposta para rota não encontrada
+        return responder(start_response, '404 Not Found', {"status": "erro", "message": "Rota não encontrada"})
+
+    try:
+        return handler(environ, start_response, **parametros)
+    except FfmpegSaturadoError as e:
+        # Todos os slots do FFmpeg ocupados: o cliente deve tentar de novo depois
+        return responder(start_response, '503 Service Unavailable', {"status": "erro", "message": str(e)},
+                         [("Retry-After", str(e.retry_after))])
+
+# Servindo arquivos estáticos da pasta "uploads"
+@rotas.rota('GET', 'uploads/{arquivo:path}')
+def servir_upload(environ, start_response, arquivo):
+    decoded_path = unquote(arquivo)  # 🔹 Decodificar a URL
+    file_path = os.path.join(UPLOAD_DIR, decoded_path)
+
+    # Áudios com edições são servidos já editados, do cache; a versão que ainda está sendo
+    # renderizada responde 202 com o job e Retry-After (503 se a fila de jobs estiver cheia)
+    try:
+        file_path = EdlService.obter_arquivo(decoded_path) or file_path
+    except VersaoPendenteError as e:
+        if e.job["status"] == "erro":
+            return responder(start_response, '500 Internal Server Error', e.job)
+        status, _ = status_edicao(e.job)
+        return responder(start_response, status, dict(e.job, message=str(e)), [("Retry-After", str(e.retry_after))])
+    except FfmpegSaturadoError:
+        raise
+    except Exception as e:
+        return responder(start_response, '500 Internal Server Error', {"status": "erro", "message": str(e)})
+
+    if os.path.exists(file_path) and os.path.isfile(file_path):
+        mime_type, _ = mimetypes.guess_type(file_path)
+        return responder_arquivo(environ, start_response, file_path, mime_type or "application/octet-stream")
+
+    return responder(start_response, '404 Not Found', {"status": "erro", "message": "Arquivo não encontrado"})
+
+# Prévias das edições (services.edl_service.renderizar_preview), guardadas no cache de renderização
+@rotas.rota('GET', 'previews/{chave}.ogg')
+def servir_preview(environ, start_response, chave):
+    file_path = RenderCacheService.obter(chave, "ogg")
+    if file_path:
+        return responder_arquivo(environ, start_response, file_path, 'audio/ogg')
+
+    return responder(start_response, '404 Not Found', {"status": "erro", "message": "Prévia não encontrada"})
+
+@rotas.rota('GET', 'api/admin/usuarios')
+def admin_usuarios(environ, start_response):
+    return responder(start_response, '200 OK', AdminController.listar_usuarios(environ))
+
+@rotas.rota('GET', 'api/admin/historico')
+def admin_historico(environ, start_response):
+    return responder(start_response, '200 OK', AdminController.listar_historico(environ))
+
+@rotas.rota('GET', 'api/admin/logins')
+def admin_logins(environ, start_response):
+    return responder(start_response, '200 OK', AdminController.listar_logins(environ))
+
+@rotas.rota('POST', 'api/auth/login')
+def login(environ, start_response):
+    response_body = AuthController.login(environ)
+    return responder(start_response, status_resultado(response_body, erro='401 Unauthorized'), response_body)
+
+@rotas.rota('POST', 'api/auth/logout')
+def logout(environ, start_response):
+    response_body = AuthController.logout(environ)
+    return responder(start_response, status_resultado(response_body), response_body)
+
+@rotas.rota('GET', 'api/usuarios')
+def listar_usuarios(environ, start_response):
+    headers = environ.get('HTTP_AUTHORIZATION', '').split("Bearer ")
+    token = headers[1] if len(headers) > 1 else None
+
+    auth_response = AuthService.verificar_token(token)
+    if auth_response["status"] == "erro":
+        return responder(start_response, '401 Unauthorized', auth_response)
+
+    return responder(start_response, '200 OK', {"status": "sucesso", "usuarios": ["Admin", "User1"]})
+
+@rotas.rota('POST', 'api/usuarios')
+def criar_usuario(environ, start_response):
+    response_body = UsuarioController.criar_usuario(environ)
+    return responder(start_response, status_resultado(response_body, '201 CREATED', '401 Unauthorized'),
+                     response_body)
+
+@rotas.rota('GET', 'api/projectos')
+def listar_projectos(environ, start_response):
+    response_body = ProjectosController.listar_projectos(environ)
+    return responder(start_response, status_resultado(response_body, erro='401 Unauthorized'), response_body)
+
+@rotas.rota('POST', 'api/projectos')
+def criar_projecto(environ, start_response):
+    response_body = ProjectosController.criar_projecto(environ)
+    return responder(start_response, status_resultado(response_body, '201 Created'), response_body)
+
+@rotas.rota('GET', 'api/projectos/{project_id:int}', invalido="ID do projeto inválido")
+def obter_projecto(environ, start_response, project_id):
+    response_body = ProjectosController.obter_projecto(environ, project_id)
+    return responder(start_response, status_resultado(response_body, erro='404 Not Found'), response_body)
+
+@rotas.rota('DELETE', 'api/projectos/{project_id:int}', invalido="ID do projeto inválido")
+def excluir_projeto(environ, start_response, project_id):
+    response_body = ProjectosController.excluir_projeto(environ, project_id)
+    return responder(start_response, status_resultado(response_body), response_body)
+
+@rotas.rota('PUT', 'api/projectos/{project_id:int}/codec', invalido="ID do projeto inválido")
+def definir_codec(environ, start_response, project_id):
+    response_body = ProjectosController.definir_codec(environ, project_id)
+    return responder(start_response, status_resultado(response_body), response_body)
+
+@rotas.rota('GET', 'api/undo-audio/{project_id:int}/{file_name:path}', invalido="ID do projeto inválido")
+def desfazer_edicao(environ, start_response, project_id, file_name):
+    response_body = ProjectosController.retroceder_edicao(environ, project_id, file_name)
+    return responder(start_response, status_resultado(response_body), response_body)
+
+@rotas.rota('GET', 'api/redo-audio/{project_id:int}/{file_name:path}', invalido="ID do projeto inválido")
+def refazer_edicao(environ, start_response, project_id, file_name):
+    response_body = ProjectosController.avancar_edicao(environ, project_id, file_name)
+    return responder(start_response, status_resultado(response_body), response_body)
+
+@rotas.rota('POST', 'api/upload-audio')
+def upload_audio(environ, start_response):
+    response_body = ProjectosController.upload_audio(environ)
+    return responder(start_response, status_resultado(response_body, '201 Created'), response_body)
+
+@rotas.rota('GET', 'api/baixar-projecto/{project_id:int}', invalido="ID do projeto inválido")
+def baixar_projecto(environ, start_response, project_id):
+    headers = environ.get('HTTP_AUTHORIZATION', '').split("Bearer ")
+    token = headers[1] if len(headers) > 1 else None
+
+    response = ProjectosController.baixar_projecto(project_id, token)
+    if response["status"] == "sucesso":
+        return ProjectosController.enviar_arquivo_zip(environ, response["zip_file_path"], project_id, start_response)
+    if response["status"] in ("pendente", "ocupado"):
+        # Versões editadas ainda em renderização: o cliente acompanha os jobs e tenta de novo
+        status, extras = status_edicao(response)
+        return responder(start_response, status, response, extras)
+
+    return responder(start_response, '400 Bad Request', response)
+
+def responder_upload(start_response, response_body, sucesso='200 OK'):
+    """
+    Resposta de um endpoint /api/uploads: 409 se o deslocamento não confere, com Upload-Offset
+    no cabeçalho, e 429 se o usuário já tem uploads demais em andamento
+    """
+    if response_body.get("status") == "sucesso":
+        status_code = sucesso
+    elif response_body.get("status") == "conflito":
+        status_code = '409 Conflict'
+    elif response_body.get("status") == "limite":
+        status_code = '429 Too Many Requests'
+    else:
+        status_code = status_consulta(response_body)
+    extras = [("Upload-Offset", str(response_body["offset"]))] if "offset" in response_body else []
+    return responder(start_response, status_code, response_body, extras)
+
+# Uploads retomáveis (services.upload_service): sessão, trechos com PATCH e finalização
+@rotas.rota('POST', 'api/uploads')
+def criar_upload(environ, start_response):
+    return responder_upload(start_response, UploadController.criar_upload(environ), '201 Created')
+
+@rotas.rota('GET', 'api/uploads/{upload_id}')
+def obter_upload(environ, start_response, upload_id):
+    return responder_upload(start_response, UploadController.obter_upload(environ, upload_id))
+
+@rotas.rota('PATCH', 'api/uploads/{upload_id}')
+def enviar_trecho_upload(environ, start_response, upload_id):
+    return responder_upload(start_response, UploadController.enviar_trecho(environ, upload_id))
+
+@rotas.rota('POST', 'api/uploads/{upload_id}/finalizar')
+def finalizar_upload(environ, start_response, upload_id):
+    return responder_upload(start_response, UploadController.finalizar_upload(environ, upload_id), '201 Created')
+
+@rotas.rota('DELETE', 'api/uploads/{upload_id}')
+def cancelar_upload(environ, start_response, upload_id):
+    return responder_upload(start_response, UploadController.cancelar_upload(environ, upload_id))
+
+def rota_edicao(metodo):
+    """Handler de um endpoint /api/editar/*: 200, 202 (job na fila) ou 503 (fila cheia)"""
+    def handler(environ, start_response):
+        response_body = metodo(environ)
+        extras = []
         if isinstance(response_body, tuple):
             response_body, status_code = response_body  # Separando dicionário e código de status
         else:
-            status_code = "200 OK" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == "api/editar/alongar" and method == "POST":
-        response_body = EdicaoAudioController.alongar_audio(environ)
-        status_code = "200 OK" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == "api/editar/encurtar" and method == "POST":
-        response_body = EdicaoAudioController.encurtar_audio(environ)
-        status_code = "200 OK" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == "api/editar/aplicar-efeito" and method == "POST":
-        response_body = EdicaoAudioController.aplicar_efeito(environ)
-        status_code = "200 OK" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    if path == "api/audio/excluir" and method == "DELETE":
-        response_body = EdicaoAudioController.excluir_audio(environ)
-        status_code = "200 OK" if response_body.get("status") == "sucesso" else "400 Bad Request"
-        headers = cors_headers + [("Content-Type", "application/json")]
-        start_response(status_code, headers)
-        return [json.dumps(response_body).encode("utf-8")]
-
-    #documentação da API
-    if path == 'api/documentacao' and method == 'GET':
-        documentacao = gerar_documentacao()
-        start_response('200 OK', [('Content-Type', 'application/json')] + cors_headers)
-        return [json.dumps(documentacao, indent=4).encode("utf-8")]
-
-    if path == 'documentacao' and method == 'GET':
-        documentacao = gerar_documentacao()
-        html_content = DocumentacaoService.gerar_documentacao_html(documentacao)
-
-        start_response('200 OK', [('Content-Type', 'text/html')] + cors_headers)
-        return [html_content.encode("utf-8")]
-
-    # Resposta para rota não encontrada
-    start_response('404 Not Found', cors_headers + [('Content-Type', 'application/json')])
-    return [json.dumps({"status": "erro", "message": "Rota não encontrada"}).encode("utf-8")]
+            status_code, extras = status_edicao(response_body)
+        return responder(start_response, status_code, response_body, extras)
+    return handler
+
+for acao, metodo in (("recortar", EdicaoAudioController.recortar_audio),
+                     ("mesclar", EdicaoAudioController.mesclar_audio),
+                     ("mixar", EdicaoAudioController.mixar_audios),
+                     ("alongar", EdicaoAudioController.alongar_audio),
+                     ("encurtar", EdicaoAudioController.encurtar_audio),
+                     ("remover-silencios", EdicaoAudioController.remover_silencios),
+                     ("aplicar-efeito", EdicaoAudioController.aplicar_efeito),
+                     ("lote", EdicaoAudioController.editar_em_lote)):
+    rotas.adicionar('POST', f'api/editar/{acao}', rota_edicao(metodo))
+
+@rotas.rota('GET', 'api/jobs/{job_id}')
+def obter_job(environ, start_response, job_id):
+    response_body = JobController.obter_job(environ, job_id)
+    return responder(start_response, status_consulta(response_body, erro='404 Not Found'), response_body)
+
+def rota_audio(metodo):
+    """Handler de uma consulta /api/audio/{id}/*: 202 (com Retry-After) enquanto um job calcula a análise"""
+    def handler(environ, start_response, audio_id):
+        response_body = metodo(environ, audio_id)
+        if response_body.get("status") in ("pendente", "ocupado"):
+            status, extras = status_edicao(response_body)
+            return responder(start_response, status, response_body, extras)
+        return responder(start_response, status_consulta(response_body), response_body)
+    return handler
+
+for recurso, metodo in (("peaks", AudioController.obter_picos),
+                        ("loudness", AudioController.obter_loudness),
+                        ("silencios", AudioController.obter_silencios)):
+    rotas.adicionar('GET', f'api/audio/{{audio_id:int}}/{recurso}', rota_audio(metodo), "ID do áudio inválido")
+
+@rotas.rota('DELETE', 'api/audio/excluir')
+def excluir_audio(environ, start_response):
+    response_body = EdicaoAudioController.excluir_audio(environ)
+    return responder(start_response, status_resultado(response_body), response_body)
+
+#documentação da API
+@rotas.rota('GET', 'api/documentacao')
+def documentacao_json(environ, start_response):
+    body = json.dumps(gerar_documentacao(), indent=4).encode("utf-8")
+    start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))] + CORS_HEADERS)
+    return [body]
+
+@rotas.rota('GET', 'documentacao')
+def documentacao_html(environ, start_response):
+    html_content = DocumentacaoService.gerar_documentacao_html(gerar_documentacao()).encode("utf-8")
+    start_response('200 OK', [('Content-Type', 'text/html'), ('Content-Length', str(len(html_content)))] + CORS_HEADERS)
+    return [html_content]
 
 def gerar_documentacao():
     """
@@ -299,10 +408,15 @@ def gerar_documentacao():
     from controllers.projectos_controller import ProjectosController
     from controllers.auth_controller import AuthController
     from controllers.usuario_controller import UsuarioController
+    from controllers.job_controller import JobController
+    from controllers.edicao_controller import EdicaoAudioController
+    from controllers.audio_controller import AudioController
+    from controllers.upload_controller import UploadController
 
     documentacao = {}
 
-    for controller in [ProjectosController, AuthController, UsuarioController]:
+    for controller in [ProjectosController, AuthController, UsuarioController, JobController,
+                       EdicaoAudioController, AudioController, UploadController]:
         for nome, func in inspect.getmembers(controller, predicate=inspect.isfunction):
             doc = inspect.getdoc(func)
             if doc:
@@ -311,7 +425,31 @@ def gerar_documentacao():
     return documentacao
 
 
+def inicializar():
+    """Tarefas de subida, executadas uma única vez (no prefork, pelo primeiro worker, antes de criar os outros)"""
+    JobService.retomar_pendentes()  # Jobs de renderização que ficaram na fila
+    EdlService.coletar_versoes()  # Ramos de versões que ninguém mais alcança
+    limpar_temporarios()  # Uploads interrompidos
+    UploadService.limpar_expiradas()  # Sessões de upload retomável abandonadas
+    ProjectosService.agendar_intermediarios_faltantes()  # Uploads cuja conversão não chegou a rodar
+
+
+def finalizar():
+    """Chamado quando um processo do servidor encerra: espera os jobs que ele enviou"""
+    JobService.encerrar()
+
+
 if __name__ == '__main__':
-    with make_server('', 8000, application) as server:
-        print("Servidor rodando na porta 8000 com CORS habilitado...")
-        server.serve_forever()
+    if os.environ.get("SERVIDOR_MODO") == "simples":  # Um pedido de cada vez, para depuração
+        inicializar()
+        with make_server('', 8000, application) as server:
+            print("Servidor rodando na porta 8000 com CORS habilitado...")
+            server.serve_forever()
+    else:
+        import servidor  # Pool de threads com keep-alive; para prefork e reload: python servidor.py
+        inicializar()
+        print(f"Servidor rodando na porta {servidor.SERVIDOR_PORTA} com {servidor.SERVIDOR_THREADS} threads...")
+        try:
+            servidor.servir_threads(application)
+        finally:
+            finalizar()
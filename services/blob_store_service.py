@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+from database import conectar
+
+UPLOAD_DIR = "uploads"
+BLOB_DIR = os.path.join("cache", "blobs")  # Fora de uploads: /uploads serve o que estiver lá
+BLOB_STORE_MAX_BYTES = int(os.environ.get("BLOB_STORE_MAX_BYTES", 20 * 1024 ** 3))  # 20 GB por padrão
+CHUNK_MIN = 16 * 1024
+CHUNK_MAX = 256 * 1024
+MASCARA_CORTE = 0xFFFF0000  # 16 bits do hash zerados: um corte a cada ~64 KiB, em média
+JANELA_HASH = 32  # Bytes que influenciam os 32 bits baixos do gear hash
+BLOCO_LEITURA = 4 * 1024 * 1024
+
+# Tabela do gear hash: um valor pseudoaleatório fixo de 32 bits por byte
+_GEAR = np.random.default_rng(0x6A617564).integers(0, 2 ** 32, size=256, dtype=np.uint64)
+
+os.makedirs(os.path.dirname(BLOB_DIR), exist_ok=True)
+if os.path.isdir(os.path.join(UPLOAD_DIR, "blobs")) and not os.path.exists(BLOB_DIR):
+    os.replace(os.path.join(UPLOAD_DIR, "blobs"), BLOB_DIR)  # Local antigo, acessível por /uploads/blobs
+os.makedirs(BLOB_DIR, exist_ok=True)
+
+
+class BlobStoreService:
+    """
+    Armazenamento deduplicado das versões renderizadas dos áudios.
+
+    Cada versão é dividida em chunks por content-defined chunking (gear hash): os cortes
+    dependem só dos bytes em volta, então um trecho que se repete entre duas versões gera os
+    mesmos chunks mesmo deslocado. Os chunks ficam em cache/blobs, um arquivo por SHA-256,
+    e cada versão é uma lista de hashes em audio_blobs. blob_chunks conta quantas referências
+    cada chunk tem; o arquivo é apagado quando a última versão que o usa é removida. O espaço
+    ocupado cresce com o que mudou entre as versões, não com o tamanho vezes o número delas.
+
+    Toda versão guardada aqui pode ser renderizada de novo a partir do original e das edições,
+    então o espaço é limitado por BLOB_STORE_MAX_BYTES: passando dele, as versões guardadas há
+    mais tempo são removidas primeiro.
+    """
+
+    @staticmethod
+    def guardar(chave, caminho, audio_id, edit_id=None):
+        """Guarda o arquivo como a versão `chave` do áudio; não faz nada se ela já estiver guardada"""
+        if BlobStoreService.existe(chave):
+            return
+
+        hashes = []
+        tamanhos = []
+        for chunk in BlobStoreService._chunks(caminho):
+            hashes.append(hashlib.sha256(chunk).hexdigest())
+            tamanhos.append(len(chunk))
+
+        conn = conectar()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT IGNORE INTO audio_blobs (chave, audio_id, edit_id, tamanho, chunks)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (chave, audio_id, edit_id, sum(tamanhos), json.dumps(hashes)))
+            if cursor.rowcount == 0:
+                conn.rollback()  # Outro processo guardou a mesma versão
+                return
+
+            # A contagem sobe antes de gravar os arquivos e na mesma transação: uma remoção
+            # concorrente espera o lock e não apaga um chunk que esta versão vai usar
+            contagem = {}
+            for chunk_hash, tamanho in zip(hashes, tamanhos):
+                refs, _ = contagem.get(chunk_hash, (0, tamanho))
+                contagem[chunk_hash] = (refs + 1, tamanho)
+            cursor.executemany("""
+                INSERT INTO blob_chunks (hash, tamanho, refs) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE refs = refs + VALUES(refs)
+            """, [(chunk_hash, tamanho, refs) for chunk_hash, (refs, tamanho) in contagem.items()])
+
+            gravados = 0
+            with open(caminho, "rb") as f:
+                for chunk_hash, tamanho in zip(hashes, tamanhos):
+                    gravados += BlobStoreService._gravar_chunk(chunk_hash, f.read(tamanho))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        print(f"🔹 Versão {chave[:12]} guardada: {len(hashes)} chunks, {gravados} novo(s).")
+        BlobStoreService._despejar(manter=chave)
+
+    @staticmethod
+    def existe(chave):
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM audio_blobs WHERE chave = %s", (chave,))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return result is not None
+
+    @staticmethod
+    def restaurar(chave, destino):
+        """Remonta a versão `chave` em `destino`. Retorna False se ela não estiver guardada"""
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("SELECT chunks FROM audio_blobs WHERE chave = %s", (chave,))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if not result:
+            return False
+
+        try:
+            with open(destino, "wb") as f:
+                for chunk_hash in json.loads(result[0]):
+                    with open(BlobStoreService._caminho_chunk(chunk_hash), "rb") as chunk:
+                        f.write(chunk.read())
+        except FileNotFoundError:
+            print(f"Chunk da versão {chave[:12]} não encontrado; a versão será renderizada de novo.")
+            os.remove(destino)
+            return False
+        return True
+
+    @staticmethod
+    def remover_audio(audio_id):
+        """Remove todas as versões guardadas de um áudio"""
+        BlobStoreService._remover("audio_id = %s", (audio_id,))
+
+    @staticmethod
+    def remover_versoes(edit_ids):
+        """Remove as versões guardadas cuja cabeça é uma das edições `edit_ids`"""
+        for pos in range(0, len(edit_ids), 1000):
+            lote = list(edit_ids[pos:pos + 1000])
+            BlobStoreService._remover(f"edit_id IN ({', '.join(['%s'] * len(lote))})", lote)
+
+    @staticmethod
+    def _remover(condicao, valores):
+        """Apaga as versões que atendem `condicao`, desconta as referências e apaga os chunks órfãos"""
+        conn = conectar()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT chave, chunks FROM audio_blobs WHERE {condicao} FOR UPDATE", valores)
+            versoes = cursor.fetchall()
+            if not versoes:
+                conn.rollback()
+                return
+
+            contagem = {}
+            for _, chunks in versoes:
+                for chunk_hash in json.loads(chunks):
+                    contagem[chunk_hash] = contagem.get(chunk_hash, 0) + 1
+            chaves = [chave for chave, _ in versoes]
+            cursor.execute(f"DELETE FROM audio_blobs WHERE chave IN ({', '.join(['%s'] * len(chaves))})", chaves)
+            cursor.executemany("UPDATE blob_chunks SET refs = refs - %s WHERE hash = %s",
+                               [(refs, chunk_hash) for chunk_hash, refs in contagem.items()])
+
+            hashes = list(contagem)
+            orfaos = []
+            for pos in range(0, len(hashes), 1000):
+                lote = hashes[pos:pos + 1000]
+                cursor.execute(f"""
+                    SELECT hash FROM blob_chunks WHERE refs <= 0 AND hash IN ({', '.join(['%s'] * len(lote))})
+                    FOR UPDATE
+                """, lote)
+                orfaos += [linha[0] for linha in cursor.fetchall()]
+            for pos in range(0, len(orfaos), 1000):
+                lote = orfaos[pos:pos + 1000]
+                cursor.execute(f"DELETE FROM blob_chunks WHERE hash IN ({', '.join(['%s'] * len(lote))})", lote)
+
+            for chunk_hash in orfaos:
+                try:
+                    os.remove(BlobStoreService._caminho_chunk(chunk_hash))
+                except FileNotFoundError:
+                    pass
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        print(f"🔹 {len(versoes)} versão(ões) removida(s) do armazenamento, {len(orfaos)} chunk(s) apagado(s).")
+
+    @staticmethod
+    def _despejar(manter=None, lote=20):
+        """Remove as versões mais antigas (exceto `manter`) até os chunks caberem na cota"""
+        while True:
+            conn = conectar()
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(SUM(tamanho), 0) FROM blob_chunks")
+            total = int(cursor.fetchone()[0])
+            antigas = []
+            if total > BLOB_STORE_MAX_BYTES:
+                cursor.execute("SELECT chave FROM audio_blobs WHERE chave <> %s ORDER BY created_at LIMIT %s",
+                               (manter or "", lote))
+                antigas = [linha[0] for linha in cursor.fetchall()]
+            cursor.close()
+            conn.close()
+            if not antigas:
+                return
+            # Chunks compartilhados com versões que ficam não liberam espaço: confere de novo
+            BlobStoreService._remover(f"chave IN ({', '.join(['%s'] * len(antigas))})", antigas)
+
+    @staticmethod
+    def _chunks(caminho):
+        """Gera os chunks do arquivo, com cortes definidos pelo conteúdo"""
+        with open(caminho, "rb") as f:
+            pendente = b""  # Bytes lidos que ainda não formaram um chunk
+            for dados in iter(lambda: f.read(BLOCO_LEITURA), b""):
+                pendente += dados
+                inicio = 0
+                for corte in BlobStoreService._cortes(pendente):
+                    yield pendente[inicio:corte]
+                    inicio = corte
+                pendente = pendente[inicio:]
+            if pendente:
+                yield pendente
+
+    @staticmethod
+    def _cortes(dados):
+        """
+        Posições de corte em `dados`, que começa no início de um chunk, respeitando CHUNK_MIN
+        e CHUNK_MAX. O resto depois do último corte fica para a próxima leitura.
+
+        Os 32 bits baixos do gear hash (h = (h << 1) + GEAR[byte]) só dependem dos últimos
+        JANELA_HASH bytes, então o hash de todas as posições sai de somas deslocadas,
+        vetorizadas com NumPy, sem um laço em Python por byte.
+        """
+        h = _GEAR[np.frombuffer(dados, dtype=np.uint8)]
+        passo = 1
+        while passo < JANELA_HASH:  # Soma por duplicação: log2(JANELA_HASH) passadas
+            deslocado = h[:len(h) - passo] << np.uint64(passo)
+            h[passo:] += deslocado
+            passo *= 2
+        candidatos = np.flatnonzero((h & np.uint64(MASCARA_CORTE)) == 0) + 1  # Corte depois do byte
+
+        cortes = []
+        ultimo = 0
+        for candidato in candidatos:
+            while candidato - ultimo > CHUNK_MAX:
+                ultimo += CHUNK_MAX
+                cortes.append(ultimo)
+            if candidato - ultimo >= CHUNK_MIN:
+                cortes.append(int(candidato))
+                ultimo = int(candidato)
+        while len(dados) - ultimo > CHUNK_MAX:
+            ultimo += CHUNK_MAX
+            cortes.append(ultimo)
+        return cortes
+
+    @staticmethod
+    def _gravar_chunk(chunk_hash, chunk):
+        """Grava o chunk se ainda não existir. Retorna 1 se gravou, 0 se já existia"""
+        caminho = BlobStoreService._caminho_chunk(chunk_hash)
+        if os.path.exists(caminho):
+            return 0
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp_path = f"{caminho}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(chunk)
+        os.replace(tmp_path, caminho)
+        return 1
+
+    @staticmethod
+    def _caminho_chunk(chunk_hash):
+        return os.path.join(BLOB_DIR, chunk_hash[:2], chunk_hash)
@@ -0,0 +1,63 @@
+import os
+import wave
+
+from services.ffmpeg_service import FfmpegService
+from services.mp3_frame_service import Mp3FrameService
+
+
+class DuracaoService:
+    """
+    Duração dos arquivos de áudio sem abrir um processo do ffprobe.
+
+    MP3 usa o índice de frames (gravado no upload) e WAV o cabeçalho do arquivo; o ffprobe
+    fica só para os demais formatos. O resultado é guardado por (caminho, tamanho, mtime),
+    então o mesmo arquivo não é lido duas vezes enquanto não mudar.
+    """
+
+    _duracoes = {}  # (caminho, tamanho, mtime) -> duração em segundos
+
+    @staticmethod
+    def obter(file_path, audio_id=None):
+        """Duração exata do arquivo em segundos. `audio_id` permite usar o índice já gravado"""
+        chave = DuracaoService._chave(file_path)
+        if chave in DuracaoService._duracoes:
+            return DuracaoService._duracoes[chave]
+
+        duracao = DuracaoService._calcular(file_path, audio_id)
+        DuracaoService._duracoes[chave] = duracao
+        return duracao
+
+    @staticmethod
+    def registrar(file_path, duracao):
+        """Guarda uma duração já conhecida (por exemplo, contada durante a renderização)"""
+        DuracaoService._duracoes[DuracaoService._chave(file_path)] = duracao
+
+    @staticmethod
+    def _calcular(file_path, audio_id):
+        extensao = os.path.splitext(file_path)[1].lower()
+
+        if extensao == ".mp3":
+            try:
+                if audio_id is not None:
+                    indice = Mp3FrameService.carregar_indice(audio_id, file_path)
+                else:
+                    indice = Mp3FrameService.indexar(file_path)
+                if indice is not None:
+                    return indice["duracao"]
+            except Exception as e:
+                print(f"Erro ao indexar {file_path}: {e}")
+
+        if extensao == ".wav":
+            try:
+                with wave.open(file_path, "rb") as f:
+                    return f.getnframes() / f.getframerate()
+            except (wave.Error, EOFError):
+                pass  # WAV que não é PCM simples: usar o ffprobe
+
+        probe = FfmpegService.probe(file_path)
+        return float(probe["format"]["duration"])
+
+    @staticmethod
+    def _chave(file_path):
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
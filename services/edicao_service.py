@@ -1,335 +1,467 @@
+import math
 import os
 import re
+import shutil
+import tempfile
 
 import database
-import ffmpeg
 from datetime import datetime
 from database import conectar
+from services.blob_store_service import BlobStoreService
+from services.duracao_service import DuracaoService
+from services.edl_service import TMP_DIR, EdlService
+from services.efeitos_service import EFEITO_PADRAO, EfeitosService
 from services.historico_service import HistoricoService
-from services.projectos_service import ProjectosService
+from services.intermediario_service import IntermediarioService
+from services.job_service import JobService
+from services.mixagem_service import MixagemService
+from services.mp3_frame_service import Mp3FrameService
+from services.pcm_cache_service import PCM_CANAIS, PCM_TAXA, PcmCacheService
+from services.peaks_service import PeaksService
+from services.render_cache_service import RenderCacheService
+from services.silencio_service import LIMIAR_PADRAO_DB, MARGEM_PADRAO_S, MINIMO_PADRAO_S, SilencioService
 
 UPLOAD_DIR = "uploads"
 BASE_URL = "http://localhost:8000/"
 
+# Operação recebida pela API -> edit_type em audio_edits
+TIPOS_EDICAO = {
+    "recortar": "cortar",
+    "encurtar": "encurtar",
+    "alongar": "alongar",
+    "aplicar-efeito": "efeito",
+}
+
 class EdicaoAudioService:
     @staticmethod
-    def recortar_audio(project_id, file_name, inicio, fim, user_id):
-        """Realiza o recorte do áudio e salva no banco de dados"""
-
-        # Conectar ao banco para verificar se o arquivo existe no projeto
-        conn = conectar()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT file_path FROM audio_files 
-            JOIN projectos_audio_files ON audio_files.id = projectos_audio_files.audio_id 
-            WHERE projectos_audio_files.project_id = %s AND audio_files.file_name = %s
-        """, (project_id, file_name))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if not result:
-            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
-
-        file_path = result[0]
-
-        # Remover URL e ajustar caminho
-        file_path = re.sub(r'^https?://localhost:\d+/', '', file_path)
-        if not file_path.startswith(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
-
-        # Verificar se o arquivo existe no sistema
-        if not os.path.exists(file_path):
-            return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
-
-        # Gerar nome do novo arquivo com timestamp
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        file_base, file_ext = os.path.splitext(file_name)
-        file_base = re.sub(r'^\d{14}_', '', file_base)  # Remover timestamp antigo se houver
-        novo_arquivo = f"{timestamp}_{file_base}{file_ext}"
-        novo_path = os.path.join(UPLOAD_DIR, novo_arquivo)
-
-        # Verificar duração e recortar
-        duracao = fim - inicio
-        ffmpeg.input(file_path, ss=inicio, t=duracao).output(novo_path, format="mp3").run(overwrite_output=True)
-
-        # Salvar no banco de dados
-        from controllers.edicao_controller import EdicaoAudioController
-        novo_audio_id = EdicaoAudioService.salvar_audio_no_banco(novo_arquivo, novo_path, duracao)
+    def recortar_audio(project_id, file_name, inicio, fim, user_id, smart_render=False, preview=False):
+        """
+        Recorta o áudio, mantendo apenas o trecho entre `inicio` e `fim`.
+        Com `smart_render`, os frames MP3 intactos são copiados e só as bordas do corte são recodificadas.
+        """
+        if inicio < 0 or fim <= inicio:
+            return {"status": "erro", "message": "Parâmetros inválidos."}
 
-        # Associar ao projeto
-        EdicaoAudioService.associar_audio_ao_projeto(project_id, novo_audio_id)
-        HistoricoService.registrar_atividade(user_id, project_id, "edição", f"Recortou {file_name} com start_time {inicio} e end_time {fim}")
-        return {"status": "sucesso", "file_name": novo_arquivo, "file_path": novo_path}
+        return EdicaoAudioService._aplicar_edicoes(
+            project_id, file_name, user_id,
+            [{"edit_type": "cortar", "start_time": inicio, "end_time": fim,
+              "parametros": {"smart_render": smart_render}}],
+            f"Recortou {file_name} com start_time {inicio} e end_time {fim}", preview)
 
     @staticmethod
     def mesclar_audio(project_id, file1_name, file2_name, user_id):
-        """Realiza a mesclagem de dois áudios pertencentes a um projeto"""
+        """Realiza a mesclagem de dois áudios pertencentes a um projeto (como o amix: metade do volume de cada)"""
+        ganho = round(20 * math.log10(0.5), 2)
+        return EdicaoAudioService._mixar(
+            project_id, [{"file_name": file1_name, "ganho_db": ganho}, {"file_name": file2_name, "ganho_db": ganho}],
+            user_id, f"Mesclou {file1_name} com {file2_name}")
 
-        # Verificar se os áudios pertencem ao projeto do usuário
-        verificar1 = ProjectosService.verificar_audio_no_projeto(project_id, file1_name, user_id)
-        verificar2 = ProjectosService.verificar_audio_no_projeto(project_id, file2_name, user_id)
+    @staticmethod
+    def mixar_audios(project_id, faixas, user_id):
+        """
+        Mixa qualquer número de faixas do projeto num novo áudio. Cada faixa é
+        {"file_name", "ganho_db" (padrão 0), "offset" (segundos, padrão 0), "pan" (-1 a 1, padrão 0)}
+        e entra na mixagem com as suas edições aplicadas.
+        """
+        nomes = ", ".join(str(faixa.get("file_name")) for faixa in faixas if isinstance(faixa, dict)) \
+            if isinstance(faixas, list) else ""
+        return EdicaoAudioService._mixar(project_id, faixas, user_id, f"Mixou {nomes}")
 
-        if verificar1 in ["projeto_invalido", "audio_invalido"]:
-            return {"status": "erro", "message": f"O arquivo {file1_name} não pertence ao projeto {project_id}"}, 400
-        if verificar2 in ["projeto_invalido", "audio_invalido"]:
-            return {"status": "erro", "message": f"O arquivo {file2_name} não pertence ao projeto {project_id}"}, 400
+    @staticmethod
+    def _mixar(project_id, faixas, user_id, descricao):
+        if not project_id or not isinstance(faixas, list) or not faixas:
+            return {"status": "erro", "message": "project_id e faixas são obrigatórios."}
+
+        try:
+            faixas = [EdicaoAudioService._converter_faixa(faixa) for faixa in faixas]
+        except ValueError as e:
+            return {"status": "erro", "message": str(e)}
 
-        # Caminhos dos arquivos
-        file1_path = os.path.join(UPLOAD_DIR, file1_name)
-        file2_path = os.path.join(UPLOAD_DIR, file2_name)
+        # Verificar numa única consulta se todos os áudios pertencem ao projeto do usuário
+        audios = EdicaoAudioService._localizar_audios(project_id, [faixa["file_name"] for faixa in faixas], user_id)
+        faltando = sorted({faixa["file_name"] for faixa in faixas} - set(audios))
+        if faltando:
+            return {"status": "erro",
+                    "message": f"O(s) arquivo(s) {', '.join(faltando)} não pertence(m) ao projeto {project_id}"}
 
         # Remover timestamp antigo, se houver
         def remover_timestamp(nome_arquivo):
             return re.sub(r'^\d{14}_', '', nome_arquivo)
 
-        file1_name_clean = remover_timestamp(file1_name)
-        file2_name_clean = remover_timestamp(file2_name)
-
         # Gerar novo nome com timestamp atualizado
+        nomes = "_e_".join(remover_timestamp(faixa["file_name"]) for faixa in faixas)
+        if len(nomes) > 150:
+            nomes = f"mixagem_{len(faixas)}_faixas"
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        novo_arquivo = f"{timestamp}_{file1_name_clean}_e_{file2_name_clean}.mp3"
+        novo_arquivo = f"{timestamp}_{nomes}.mp3"
         novo_path = os.path.join(UPLOAD_DIR, novo_arquivo).replace("\\", "/")
-
-        # Verificar se o arquivo já existe para evitar duplicação
         file_url = f"{BASE_URL}/uploads/{novo_arquivo}"
         if os.path.exists(novo_path):
-            return {"status": "sucesso", "file_name": novo_arquivo, "file_path": file_url}
-
-        # Comando FFmpeg para mesclar os áudios
-        (
-            ffmpeg
-            .filter([ffmpeg.input(file1_path), ffmpeg.input(file2_path)], 'amix', inputs=2, duration='longest')
-            .output(novo_path, format="mp3")
-            .run(overwrite_output=True)
-        )
-
-        # Obter duração do novo áudio
-        from controllers.edicao_controller import EdicaoAudioController
-        duration = EdicaoAudioService.obter_duracao_audio(novo_path)
+            return {"status": "sucesso", "file_name": novo_arquivo, "file_path": file_url}  # Pedido repetido
+
+        # A chave usa os originais e as listas de edições: nenhuma versão editada é renderizada para isso
+        descricao_faixas = []
+        for faixa in faixas:
+            audio_id, file_path = audios[faixa["file_name"]]
+            edicoes = EdlService.listar(audio_id)
+            descricao_faixas.append([
+                [[e["edit_type"], e["start_time"], e["end_time"], e["parametros"]] for e in edicoes],
+                faixa["ganho_db"], faixa["offset"], faixa["pan"],
+            ])
+        chave = RenderCacheService.chave([audios[faixa["file_name"]][1] for faixa in faixas], "mixar", descricao_faixas)
+
+        def mixar(destino):
+            with tempfile.TemporaryDirectory(dir=TMP_DIR) as tmp_dir:
+                fontes = []
+                for i, faixa in enumerate(faixas):
+                    audio_id, file_path = audios[faixa["file_name"]]
+                    amostras, taxa = EdlService.decodificar(audio_id, file_path, os.path.join(tmp_dir, f"faixa{i}.pcm"))
+                    fontes.append((amostras, int(round(faixa["offset"] * taxa)),
+                                   MixagemService.ganhos(faixa["ganho_db"], faixa["pan"])))
+                EdlService.codificar(MixagemService.blocos(fontes, PCM_CANAIS), PCM_TAXA, PCM_CANAIS, destino)
+
+        shutil.copyfile(RenderCacheService.obter_ou_renderizar(chave, mixar), novo_path)
+
+        # Obter duração do novo áudio pelo índice de frames (sem ffprobe)
+        indice = Mp3FrameService.indexar(novo_path)
+        duration = round(indice["duracao"], 2) if indice else EdicaoAudioService.obter_duracao_audio(novo_path)
 
         # Salvar no banco de dados
         audio_id = EdicaoAudioService.salvar_audio_no_banco(novo_arquivo, novo_path, duration)
 
+        if indice and audio_id:
+            Mp3FrameService.salvar_indice(audio_id, novo_path, indice)
+
         # Associar ao projeto
         EdicaoAudioService.associar_audio_ao_projeto(project_id, audio_id)
-        HistoricoService.registrar_atividade(user_id, project_id, "edição", f"Mesclou {file1_name} com {file2_name}")
+        HistoricoService.registrar_atividade(user_id, project_id, "edição", descricao)
         return {"status": "sucesso", "file_name": novo_arquivo, "file_path": file_url}
 
     @staticmethod
-    def alongar_audio(project_id, file_name, start_time, end_time,user_id):
+    def _converter_faixa(faixa):
+        """Valida uma faixa da mixagem e preenche os valores padrão; levanta ValueError se for inválida"""
+        if not isinstance(faixa, dict) or not isinstance(faixa.get("file_name"), str):
+            raise ValueError("Cada faixa precisa de um file_name.")
+        try:
+            ganho_db = float(faixa.get("ganho_db", 0))
+            offset = float(faixa.get("offset", 0))
+            pan = float(faixa.get("pan", 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"Parâmetros inválidos na faixa {faixa['file_name']}.")
+        if not -60 <= ganho_db <= 24 or offset < 0 or not -1 <= pan <= 1:
+            raise ValueError(f"Parâmetros inválidos na faixa {faixa['file_name']}.")
+        return {"file_name": faixa["file_name"], "ganho_db": ganho_db, "offset": offset, "pan": pan}
+
+    @staticmethod
+    def alongar_audio(project_id, file_name, start_time, end_time,user_id, preview=False):
         """Duplica um trecho do áudio entre `start_time` e `end_time`, alongando a duração total"""
 
         if not project_id or not file_name or start_time < 0 or end_time <= start_time:
             return {"status": "erro", "message": "Parâmetros inválidos."}
 
-        # Verificar se o arquivo pertence ao projeto
-        conn = conectar()
-        cursor = conn.cursor()
+        return EdicaoAudioService._aplicar_edicoes(
+            project_id, file_name, user_id,
+            [{"edit_type": "alongar", "start_time": start_time, "end_time": end_time, "parametros": {}}],
+            f"Alongou {file_name} com start-time {start_time} e end-time {end_time}", preview)
 
-        cursor.execute("""
-            SELECT file_path FROM audio_files 
-            JOIN projectos_audio_files ON audio_files.id = projectos_audio_files.audio_id 
-            WHERE projectos_audio_files.project_id = %s AND audio_files.file_name = %s
-        """, (project_id, file_name))
+    @staticmethod
+    def encurtar_audio(project_id, file_name, start_time, end_time, user_id, smart_render=False, preview=False):
+        """
+        Remove um trecho de áudio entre `start_time` e `end_time`, reduzindo a duração total.
+        Com `smart_render`, os frames MP3 intactos são copiados e só as bordas do corte são recodificadas.
+        """
 
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        if not project_id or not file_name or start_time < 0 or end_time <= start_time:
+            return {"status": "erro", "message": "Parâmetros inválidos."}
 
-        if not result:
-            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
+        return EdicaoAudioService._aplicar_edicoes(
+            project_id, file_name, user_id,
+            [{"edit_type": "encurtar", "start_time": start_time, "end_time": end_time,
+              "parametros": {"smart_render": smart_render}}],
+            f"Encurtou {file_name} com start-time {start_time} e end-time {end_time}", preview)
 
-        file_path = result[0]
+    @staticmethod
+    def remover_silencios(project_id, file_name, user_id, limiar_db=LIMIAR_PADRAO_DB, minimo_s=MINIMO_PADRAO_S,
+                          margem_s=MARGEM_PADRAO_S, preview=False):
+        """
+        Remove todos os silêncios (abaixo de `limiar_db` por pelo menos `minimo_s`) da versão
+        atual, mantendo `margem_s` de cada lado. Os intervalos vêm do índice de silêncios e
+        entram como uma única edição: a versão resultante é codificada uma única vez. Se o
+        índice desta versão ainda não existe, envia o job que o calcula e retorna "pendente".
+        """
+        if not project_id or not file_name or minimo_s <= 0 or margem_s < 0 or 2 * margem_s >= minimo_s:
+            return {"status": "erro", "message": "Parâmetros inválidos."}
 
-        # Ajustar caminho do arquivo
-        file_path = re.sub(r'^https?://localhost:\d+/', '', file_path)
-        if not file_path.startswith(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+        localizado = EdicaoAudioService._localizar_audio(project_id, file_name)
+        if not localizado:
+            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
 
+        audio_id, file_path = localizado
         if not os.path.exists(file_path):
             return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
 
-        # Criar nome do novo arquivo com timestamp
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        file_base, file_ext = os.path.splitext(file_name)
-        file_base = re.sub(r'^\d{14}_', '', file_base)  # Remover timestamp antigo
-        novo_arquivo = f"{timestamp}_{file_base}{file_ext}"
-        novo_path = os.path.join(UPLOAD_DIR, novo_arquivo)
+        envelope = SilencioService.envelope(audio_id, file_path)
+        if envelope is None:
+            # O envelope desta versão é calculado por um job: o cliente repete o pedido depois
+            return SilencioService.analisar(project_id, file_name, user_id)
+        intervalos = SilencioService.detectar(envelope, limiar_db, minimo_s, margem_s)
+        if not intervalos:
+            return {"status": "erro", "message": "Nenhum silêncio encontrado com esses parâmetros."}
+
+        return EdicaoAudioService._aplicar_edicoes(
+            project_id, file_name, user_id,
+            [{"edit_type": "silencios", "start_time": None, "end_time": None,
+              "parametros": {"intervalos": intervalos, "limiar_db": limiar_db, "minimo_s": minimo_s,
+                             "margem_s": margem_s}}],
+            f"Removeu {len(intervalos)} silêncio(s) de {file_name} (limiar {limiar_db} dB)", preview)
 
-        # Criar trecho extraído
-        trecho_path = os.path.join(UPLOAD_DIR, f"trecho_{file_name}")
-        ffmpeg.input(file_path, ss=start_time, to=end_time).output(trecho_path, format="mp3").run(
-            overwrite_output=True)
+    @staticmethod
+    def aplicar_efeito(project_id, file_name, efeito, user_id, parametros=None, preview=False):
+        """
+        Aplica um efeito do registro de EfeitosService (ganho, fade-in, fade-out, normalizar,
+        normalizar-loudness, eco, reverb, equalizador, compressor) com os `parametros` do efeito
+        """
+        try:
+            edicao = EdicaoAudioService._edicao_efeito(efeito, parametros)
+        except ValueError as e:
+            return {"status": "erro", "message": str(e)}
 
-        # Concatenar o áudio original com o trecho extra
-        ffmpeg.concat(ffmpeg.input(file_path), ffmpeg.input(trecho_path), v=0, a=1).output(novo_path, format="mp3").run(
-            overwrite_output=True)
+        return EdicaoAudioService._aplicar_edicoes(
+            project_id, file_name, user_id, [edicao],
+            f"Aplicou efeito {edicao['parametros']['efeito']} no arquivo {file_name}", preview)
 
-        # Remover o arquivo temporário do trecho
-        os.remove(trecho_path)
+    @staticmethod
+    def editar_em_lote(project_id, file_name, operacoes, user_id, preview=False):
+        """
+        Aplica uma lista ordenada de operações (recortar, encurtar, alongar, aplicar-efeito) ao
+        mesmo arquivo de uma só vez: são validadas juntas, gravadas numa única transação e
+        registradas numa única entrada do histórico. Como toda a lista de edições é renderizada
+        numa única passada, a versão resultante é codificada uma única vez.
+        """
+        if not project_id or not file_name or not operacoes:
+            return {"status": "erro", "message": "project_id, file_name e operacoes são obrigatórios."}
+
+        edicoes = []
+        for i, operacao in enumerate(operacoes, start=1):
+            edicao = EdicaoAudioService._converter_operacao(operacao)
+            if edicao is None:
+                return {"status": "erro", "message": f"Operação {i}: parâmetros inválidos."}
+            edicoes.append(edicao)
+
+        nomes = ", ".join(operacao["operacao"] for operacao in operacoes)
+        return EdicaoAudioService._aplicar_edicoes(
+            project_id, file_name, user_id, edicoes, f"Editou {file_name} em lote ({nomes})", preview)
 
-        # Obter duração do novo áudio
-        from controllers.edicao_controller import EdicaoAudioController
-        duracao_novo = EdicaoAudioService.obter_duracao_audio(novo_path)
+    @staticmethod
+    def _converter_operacao(operacao):
+        """Converte uma operação da API no formato de audio_edits; None se for inválida"""
+        if not isinstance(operacao, dict) or operacao.get("operacao") not in TIPOS_EDICAO:
+            return None
 
-        # Salvar o novo áudio no banco de dados
-        novo_audio_id = EdicaoAudioService.salvar_audio_no_banco(novo_arquivo, novo_path, duracao_novo)
+        tipo = operacao["operacao"]
+        if tipo == "aplicar-efeito":
+            try:
+                return EdicaoAudioService._edicao_efeito(operacao.get("efeito"), operacao.get("parametros"))
+            except ValueError:
+                return None
 
-        # Associar ao projeto
-        EdicaoAudioService.associar_audio_ao_projeto(project_id, novo_audio_id)
-        HistoricoService.registrar_atividade(user_id, project_id, "edição", f"Alongou {file_name} com start-time {start_time} e end-time {end_time}")
-        return {"status": "sucesso", "file_name": novo_arquivo, "file_path": novo_path}
+        # Mesmos nomes de campos dos endpoints individuais
+        campos = ("inicio", "fim") if tipo == "recortar" else ("start_time", "end_time")
+        try:
+            inicio = float(operacao.get(campos[0], 0))
+            fim = float(operacao.get(campos[1], 0))
+        except (TypeError, ValueError):
+            return None
+        if inicio < 0 or fim <= inicio:
+            return None
 
-    @staticmethod
-    def encurtar_audio(project_id, file_name, start_time, end_time, user_id):
-        """Remove um trecho de áudio entre `start_time` e `end_time`, reduzindo a duração total"""
+        parametros = {} if tipo == "alongar" else {"smart_render": bool(operacao.get("smart_render", False))}
+        return {"edit_type": TIPOS_EDICAO[tipo], "start_time": inicio, "end_time": fim, "parametros": parametros}
 
-        if not project_id or not file_name or start_time < 0 or end_time <= start_time:
-            return {"status": "erro", "message": "Parâmetros inválidos."}
+    @staticmethod
+    def _edicao_efeito(efeito, parametros):
+        """Edição de efeito validada; levanta ValueError se o efeito ou os parâmetros forem inválidos"""
+        efeito = efeito or EFEITO_PADRAO
+        if parametros is not None and not isinstance(parametros, dict):
+            raise ValueError("parametros deve ser um objeto")
+        EfeitosService.validar(efeito, parametros)
+        return {"edit_type": "efeito", "start_time": None, "end_time": None,
+                "parametros": {"efeito": efeito, "parametros": parametros or {}}}
 
-        # Buscar o arquivo no banco
-        conn = conectar()
-        cursor = conn.cursor()
+    @staticmethod
+    def _aplicar_edicoes(project_id, file_name, user_id, novas, descricao, preview=False):
+        """
+        Acrescenta as edições `novas` à lista de edições do áudio em audio_edits. Nada é
+        renderizado aqui: o original fica intacto e a versão editada é renderizada por um job
+        em segundo plano (`job_url`); quando o job termina, `audio_url` já está no cache.
 
-        cursor.execute("""
-                SELECT file_path FROM audio_files 
-                JOIN projectos_audio_files ON audio_files.id = projectos_audio_files.audio_id 
-                WHERE projectos_audio_files.project_id = %s AND audio_files.file_name = %s
-            """, (project_id, file_name))
+        Com `preview`, a resposta também traz `preview_url`, uma prévia curta em volta da
+        edição, renderizada na hora, antes de as edições serem gravadas.
+        """
 
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if not result:
+        # Verificar se o arquivo pertence ao projeto
+        localizado = EdicaoAudioService._localizar_audio(project_id, file_name)
+        if not localizado:
             return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
 
-        file_path = result[0]
-
-        # Ajustar caminho do arquivo
-        file_path = re.sub(r'^https?://localhost:\d+/', '', file_path)
-        if not file_path.startswith(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+        audio_id, file_path = localizado
 
         if not os.path.exists(file_path):
             return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
 
-        # Obter duração total do áudio
-        probe = ffmpeg.probe(file_path)
-        duracao_total = float(probe['format']['duration'])
+        # Validar cada edição contra a duração da versão que ela vai editar
+        edicoes = EdlService.listar(audio_id)
+        duracao_fonte = EdlService.duracao_fonte(audio_id, file_path)
+        for i, edicao in enumerate(novas, start=1):
+            _, duracao_atual = EdlService.compilar(edicoes + novas[:i - 1], duracao_fonte)
+            erro = None
+            if edicao["start_time"] is not None and edicao["start_time"] >= duracao_atual:
+                erro = "O tempo de início é maior que a duração do áudio."
+            elif edicao["edit_type"] == "encurtar" and edicao["end_time"] > duracao_atual:
+                erro = "O tempo de fim é maior que a duração do áudio."
+            elif EdlService.compilar(edicoes + novas[:i], duracao_fonte)[1] <= 0:
+                erro = "A edição removeria todo o áudio."
+            if erro:
+                return {"status": "erro", "message": f"Operação {i}: {erro}" if len(novas) > 1 else erro}
+
+            # Ponto da versão editada onde a última edição se ouve: a emenda de um encurtar (ou a
+            # primeira de uma remoção de silêncios), o trecho acrescentado por um alongar, o
+            # início nos demais casos
+            centro = {"encurtar": edicao["start_time"], "alongar": duracao_atual}.get(edicao["edit_type"], 0.0)
+            if edicao["edit_type"] == "silencios":
+                centro = edicao["parametros"]["intervalos"][0][0]  # Primeira emenda
+
+        # A prévia é renderizada antes de gravar as edições: se o FFmpeg estiver saturado, o
+        # cliente recebe 503 e pode repetir o pedido sem que as edições sejam duplicadas
+        preview_chave = EdlService.renderizar_preview(audio_id, file_path, edicoes + novas, centro) if preview else None
+
+        for edicao, edit_id in zip(novas, EdlService.registrar_lote(audio_id, novas)):
+            edicao["id"] = edit_id
+        duracao_nova = EdlService.atualizar_duracao(audio_id, file_path, edicoes + novas)
+
+        HistoricoService.registrar_atividade(user_id, project_id, "edição", descricao)
+        resultado = {
+            "status": "sucesso",
+            "file_name": file_name,
+            "file_path": file_path,
+            "audio_url": f"{BASE_URL}uploads/{file_name}?v={novas[-1]['id']}",
+            "edit_id": novas[-1]["id"],
+            "duracao": round(duracao_nova, 2),
+        }
+
+        if preview_chave:
+            resultado["preview_url"] = f"{BASE_URL}previews/{preview_chave}.ogg"
+        job = JobService.submeter(user_id, project_id, "renderizar",
+                                  {"project_id": project_id, "file_name": file_name, "user_id": user_id})
+        if job["status"] == "pendente":
+            resultado["job_url"] = job["job_url"]  # Com a fila cheia, o job é criado quando /uploads pedir a versão
+        return resultado
 
-        if end_time > duracao_total:
-            return {"status": "erro", "message": "O tempo de fim é maior que a duração do áudio."}
+    @staticmethod
+    def renderizar_versao(project_id, file_name, user_id):
+        """Renderiza (ou encontra no cache) a versão atual do áudio; executado como job depois de cada edição"""
+        localizado = EdicaoAudioService._localizar_audio(project_id, file_name)
+        if not localizado:
+            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
 
-        # Criar novo nome de arquivo
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        file_base, file_ext = os.path.splitext(file_name)
-        file_base = re.sub(r'^\d{14}_', '', file_base)  # Remover timestamp antigo
-        novo_arquivo = f"{timestamp}_{file_base}{file_ext}"
-        novo_path = os.path.join(UPLOAD_DIR, novo_arquivo)
-
-        # Criar arquivos temporários para as partes antes e depois do corte
-        parte1 = f"{UPLOAD_DIR}/{timestamp}_parte1.mp3"
-        parte2 = f"{UPLOAD_DIR}/{timestamp}_parte2.mp3"
-
-        # Extrair a parte antes do intervalo
-        ffmpeg.input(file_path, t=start_time).output(parte1, format="mp3").run(overwrite_output=True)
-
-        # Extrair a parte depois do intervalo (se houver)
-        if end_time < duracao_total:
-            ffmpeg.input(file_path, ss=end_time).output(parte2, format="mp3").run(overwrite_output=True)
-        else:
-            parte2 = None  # Se o corte for até o final, não há segunda parte
-
-        # Concatenar as partes corretamente usando FFmpeg
-        inputs = [ffmpeg.input(parte1)]
-        if parte2:
-            inputs.append(ffmpeg.input(parte2))
-
-        (
-            ffmpeg.concat(*inputs, v=0, a=1)
-            .output(novo_path, format="mp3")
-            .run(overwrite_output=True)
-        )
-
-        # Remover arquivos temporários
-        os.remove(parte1)
-        if parte2:
-            os.remove(parte2)
-
-        # Obter nova duração
-        from controllers.edicao_controller import EdicaoAudioController
-        duracao_novo = EdicaoAudioService.obter_duracao_audio(novo_path)
+        audio_id, file_path = localizado
+        edicoes = EdlService.listar(audio_id)
+        EdlService.renderizar(audio_id, file_path, edicoes, EdlService.codec_saida(audio_id))
+        versao = f"?v={edicoes[-1]['id']}" if edicoes else ""
+        return {"status": "sucesso", "file_name": file_name, "audio_url": f"{BASE_URL}uploads/{file_name}{versao}"}
 
-        # Salvar no banco de dados
-        novo_audio_id = EdicaoAudioService.salvar_audio_no_banco(novo_arquivo, novo_path, duracao_novo)
+    @staticmethod
+    def gerar_intermediario(project_id, file_name, user_id):
+        """Converte um áudio recém-enviado para o intermediário; executado como job depois do upload"""
+        localizado = EdicaoAudioService._localizar_audio(project_id, file_name)
+        if not localizado:
+            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
 
-        # Associar ao projeto
-        EdicaoAudioService.associar_audio_ao_projeto(project_id, novo_audio_id)
-        HistoricoService.registrar_atividade(user_id, project_id, "edição", f"Encurtou {file_name} com start-time {start_time} e end-time {end_time}")
-        return {"status": "sucesso", "file_name": novo_arquivo, "file_path": novo_path}
+        _, file_path = localizado
+        IntermediarioService.gerar(file_path)
+        return {"status": "sucesso", "file_name": file_name}
 
     @staticmethod
-    def aplicar_efeito(project_id, file_name, efeito, user_id):
-        """Aplica um efeito de áudio, como reverb"""
+    def analisar_versao(project_id, file_name, user_id):
+        """
+        Calcula a pirâmide de picos e o envelope de silêncios da versão atual a partir de uma
+        única decodificação para PCM; executado como job quando /api/audio/{id}/peaks,
+        /api/audio/{id}/silencios ou /api/editar/remover-silencios pedem uma versão que ainda
+        não foi analisada
+        """
+        localizado = EdicaoAudioService._localizar_audio(project_id, file_name)
+        if not localizado:
+            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
+
+        audio_id, file_path = localizado
+        edicoes = EdlService.listar(audio_id)
+        base = PeaksService.base(audio_id, file_path, edicoes)
+        envelope = SilencioService.caminho(audio_id, file_path, edicoes)
+        if not (PeaksService.existe(base) and os.path.exists(envelope)):
+            with tempfile.TemporaryDirectory(dir=TMP_DIR) as tmp_dir:
+                amostras, taxa = EdlService.decodificar(audio_id, file_path, os.path.join(tmp_dir, "versao.pcm"),
+                                                        edicoes)
+                if not PeaksService.existe(base):
+                    PeaksService.calcular(amostras, taxa, base)
+                if not os.path.exists(envelope):
+                    SilencioService.calcular(amostras, taxa, envelope)
+                del amostras
+        return {"status": "sucesso", "file_name": file_name}
 
+    @staticmethod
+    def _localizar_audio(project_id, file_name):
+        """Busca o áudio do projeto e retorna (audio_id, caminho local), ou None se não existir"""
         conn = conectar()
         cursor = conn.cursor()
-
         cursor.execute("""
-            SELECT file_path FROM audio_files 
+            SELECT audio_files.id, audio_files.file_path FROM audio_files 
             JOIN projectos_audio_files ON audio_files.id = projectos_audio_files.audio_id 
             WHERE projectos_audio_files.project_id = %s AND audio_files.file_name = %s
         """, (project_id, file_name))
-
         result = cursor.fetchone()
         cursor.close()
         conn.close()
 
         if not result:
-            return {"status": "erro", "message": "Arquivo não encontrado para este projeto."}
+            return None
 
-        file_path = result[0]
+        audio_id, file_path = result
 
-        # Ajustar caminho
+        # Remover URL e ajustar caminho
         file_path = re.sub(r'^https?://localhost:\d+/', '', file_path)
         if not file_path.startswith(UPLOAD_DIR):
             file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
 
-        if not os.path.exists(file_path):
-            return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
-
-        # Criar novo nome do arquivo com timestamp
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        file_base, file_ext = os.path.splitext(file_name)
-        file_base = re.sub(r'^\d{14}_', '', file_base)  # Remover timestamp antigo
-        novo_arquivo = f"{timestamp}_{file_base}{file_ext}"
-        novo_path = os.path.join(UPLOAD_DIR, novo_arquivo)
-
-        # 🔥 Aplicar efeito de Reverb
-        (
-            ffmpeg
-            .input(file_path)
-            .filter("aecho", 0.8, 0.88, 60, 0.4)  # Efeito Reverb
-            .output(novo_path, format="mp3")
-            .run(overwrite_output=True)
-        )
-
-        # Obter duração do novo áudio
-        duracao_novo = EdicaoAudioService.obter_duracao_audio(novo_path)
-
-        # Salvar no banco de dados
-        novo_audio_id = EdicaoAudioService.salvar_audio_no_banco(novo_arquivo, novo_path, duracao_novo)
+        return audio_id, file_path
 
-        # Associar ao projeto
-        EdicaoAudioService.associar_audio_ao_projeto(project_id, novo_audio_id)
-
-        # Registrar no histórico de atividades
-        HistoricoService.registrar_atividade(user_id, project_id, "edição",
-                                             f"Aplicou efeito {efeito} no arquivo {file_name}")
+    @staticmethod
+    def _localizar_audios(project_id, file_names, user_id):
+        """
+        Busca numa única consulta os áudios de um projeto do usuário. Retorna
+        {file_name: (audio_id, caminho local)} só com os que foram encontrados.
+        """
+        nomes = sorted(set(file_names))
+        marcadores = ", ".join(["%s"] * len(nomes))
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT af.file_name, af.id, af.file_path FROM audio_files af
+            JOIN projectos_audio_files paf ON af.id = paf.audio_id
+            JOIN projectos p ON paf.project_id = p.id
+            WHERE paf.project_id = %s AND p.user_id = %s AND af.file_name IN ({marcadores})
+        """, (project_id, user_id, *nomes))
+        resultados = cursor.fetchall()
+        cursor.close()
+        conn.close()
 
-        return {"status": "sucesso", "file_name": novo_arquivo, "file_path": novo_path}
+        audios = {}
+        for file_name, audio_id, file_path in resultados:
+            # Remover URL e ajustar caminho
+            file_path = re.sub(r'^https?://localhost:\d+/', '', file_path)
+            if not file_path.startswith(UPLOAD_DIR):
+                file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+            audios[file_name] = (audio_id, file_path)
+        return audios
 
     @staticmethod
     def salvar_audio_no_banco(file_name, file_path, duration):
@@ -369,11 +501,9 @@ class EdicaoAudioService:
 
     @staticmethod
     def obter_duracao_audio(file_path):
-        """ Obtém a duração do áudio em segundos usando ffprobe """
+        """ Obtém a duração do áudio em segundos (índice de frames ou cabeçalho; ffprobe só em último caso) """
         try:
-            probe = ffmpeg.probe(file_path)
-            duration = float(probe['format']['duration'])
-            return round(duration, 2)
+            return round(DuracaoService.obter(file_path), 2)
         except Exception as e:
             print(f"Erro ao obter duração do áudio: {e}")
             return 0.0
@@ -409,8 +539,12 @@ class EdicaoAudioService:
 
         # Excluir o arquivo do sistema
         if os.path.exists(file_path):
+            IntermediarioService.remover(file_path)
             os.remove(file_path)
             print(f"🔹 Arquivo {file_name} removido do sistema.")
+        PcmCacheService.invalidar(audio_id)
+        Mp3FrameService.remover_indice(audio_id)
+        BlobStoreService.remover_audio(audio_id)
 
         # Remover do banco de dados
         cursor.execute("DELETE FROM projectos_audio_files WHERE audio_id = %s", (audio_id,))
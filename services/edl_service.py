@@ -0,0 +1,591 @@
+import json
+import os
+import re
+import tempfile
+from itertools import groupby
+
+import ffmpeg
+import numpy as np
+
+from database import conectar
+from services.blob_store_service import BlobStoreService
+from services.duracao_service import DuracaoService
+from services.efeitos_service import EFEITO_PADRAO, EFEITOS, EfeitosService
+from services.ffmpeg_service import RETRY_AFTER, FfmpegService
+from services.filtergraph_service import FiltergraphService
+from services.intermediario_service import IntermediarioService
+from services.job_service import JobService
+from services.loudness_service import LoudnessService
+from services.mp3_frame_service import Mp3FrameService
+from services.pcm_cache_service import PCM_CANAIS, PCM_TAXA, PcmCacheService
+from services.render_cache_service import ENCODER_PADRAO, RenderCacheService
+from services.render_paralelo_service import RenderParaleloService
+from services.smart_render_service import SmartRenderService
+
+UPLOAD_DIR = "uploads"
+BLOCO_AMOSTRAS = 256 * 1024  # Amostras por bloco entre a fonte, os efeitos e o encoder
+TMP_DIR = "cache"  # Estágios intermediários (PCM) ficam no mesmo disco dos caches
+PREVIEW_JANELA_S = 30  # Duração do trecho renderizado na prévia de uma edição
+PREVIEW_ENCODER = {"format": "ogg", "acodec": "libopus", "audio_bitrate": "32k", "ac": 1, "ar": 48000}
+CODEC_PADRAO = "mp3"
+# Codec de saída do projeto -> (extensão, configuração do encoder). Usados só na entrega
+# (reprodução e download); as edições leem do intermediário
+CODECS_SAIDA = {
+    "mp3": ("mp3", ENCODER_PADRAO),
+    "aac": ("m4a", {"format": "ipod", "acodec": "aac", "audio_bitrate": "192k"}),
+    "opus": ("ogg", {"format": "ogg", "acodec": "libopus", "audio_bitrate": "128k"}),
+    "flac": ("flac", {"format": "flac"}),
+    "wav": ("wav", {"format": "wav"}),
+}
+VERSOES_RETENCAO_DIAS = 7  # Versões fora do grafo ficam esse tempo antes de serem apagadas
+
+
+class VersaoPendenteError(Exception):
+    """A versão editada pedida ainda não foi renderizada: `job` é o job que vai renderizá-la"""
+
+    def __init__(self, job):
+        super().__init__(job.get("message", "Versão em renderização, tente novamente em instantes"))
+        self.job = job
+        self.retry_after = job.get("retry_after", RETRY_AFTER)
+
+
+class EdlService:
+    """
+    Edição não destrutiva por edit decision list (EDL).
+
+    Cada edição é uma linha em audio_edits aplicada sobre o arquivo original, que nunca é
+    alterado. O áudio editado é renderizado em segundo plano, por um job, e o resultado
+    fica no RenderCacheService, identificado pelo conteúdo do original e pela lista de
+    edições: desfazer uma edição volta a uma versão que pode já estar em cache.
+
+    As edições formam um grafo de versões: cada uma aponta para a anterior (parent_id) e
+    audio_files.head_edit_id aponta para a versão atual, cuja lista de edições é o caminho
+    do original até ela. Desfazer e refazer só movem esse ponteiro; uma edição nova sobre
+    uma versão desfeita abre um ramo. Ramos que deixam de ser alcançáveis são apagados
+    depois, por coletar_versoes.
+    """
+
+    @staticmethod
+    def registrar(audio_id, edit_type, start_time=None, end_time=None, parametros=None):
+        """Acrescenta uma edição ao final da lista do áudio e retorna o id gerado"""
+        return EdlService.registrar_lote(audio_id, [{
+            "edit_type": edit_type, "start_time": start_time, "end_time": end_time, "parametros": parametros,
+        }])[0]
+
+    @staticmethod
+    def registrar_lote(audio_id, edicoes):
+        """
+        Acrescenta várias edições à versão atual numa única transação, em cadeia, e move a
+        cabeça para a última. Retorna os ids gerados, na ordem
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+        ids = []
+        try:
+            cursor.execute("SELECT head_edit_id FROM audio_files WHERE id = %s FOR UPDATE", (audio_id,))
+            result = cursor.fetchone()
+            pai = result[0] if result else None
+            for edicao in edicoes:
+                cursor.execute("""
+                    INSERT INTO audio_edits (audio_id, parent_id, edit_type, start_time, end_time, parametros)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (audio_id, pai, edicao["edit_type"], edicao["start_time"], edicao["end_time"],
+                      json.dumps(edicao["parametros"] or {})))
+                pai = cursor.lastrowid
+                ids.append(pai)
+            cursor.execute("UPDATE audio_files SET head_edit_id = %s WHERE id = %s", (pai, audio_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        return ids
+
+    @staticmethod
+    def listar(audio_id):
+        """Retorna as edições da versão atual do áudio (do original até a cabeça), na ordem"""
+        conn = conectar()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            WITH RECURSIVE caminho AS (
+                SELECT ae.id, ae.parent_id, ae.edit_type, ae.start_time, ae.end_time, ae.parametros
+                FROM audio_edits ae JOIN audio_files af ON ae.id = af.head_edit_id
+                WHERE af.id = %s
+                UNION ALL
+                SELECT ae.id, ae.parent_id, ae.edit_type, ae.start_time, ae.end_time, ae.parametros
+                FROM audio_edits ae JOIN caminho c ON ae.id = c.parent_id
+            )
+            SELECT id, edit_type, start_time, end_time, parametros FROM caminho ORDER BY id
+        """, (audio_id,))
+        edicoes = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+        for edicao in edicoes:
+            for campo in ("start_time", "end_time"):
+                if edicao[campo] is not None:
+                    edicao[campo] = float(edicao[campo])  # DECIMAL vem como Decimal
+            edicao["parametros"] = json.loads(edicao["parametros"]) if edicao["parametros"] else {}
+        return edicoes
+
+    @staticmethod
+    def desfazer(audio_id):
+        """Move a cabeça para a versão anterior. Retorna False se a versão atual já é o original"""
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE audio_files af JOIN audio_edits ae ON ae.id = af.head_edit_id
+            SET af.head_edit_id = ae.parent_id
+            WHERE af.id = %s
+        """, (audio_id,))
+        movida = cursor.rowcount > 0
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return movida
+
+    @staticmethod
+    def refazer(audio_id):
+        """
+        Move a cabeça para a edição seguinte: o filho mais recente da versão atual (o ramo
+        em que se estava antes de desfazer, ou o último aberto). Retorna False se não houver
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT head_edit_id FROM audio_files WHERE id = %s FOR UPDATE", (audio_id,))
+            result = cursor.fetchone()
+            if not result:
+                return False
+            cursor.execute("""
+                SELECT MAX(id) FROM audio_edits WHERE audio_id = %s AND parent_id <=> %s
+            """, (audio_id, result[0]))
+            filho = cursor.fetchone()[0]
+            if filho is None:
+                return False
+            cursor.execute("UPDATE audio_files SET head_edit_id = %s WHERE id = %s", (filho, audio_id))
+            conn.commit()
+            return True
+        finally:
+            conn.rollback()  # Sem efeito depois do commit; libera o lock nos outros casos
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def coletar_versoes(retencao_dias=VERSOES_RETENCAO_DIAS):
+        """
+        Apaga as edições que não são mais alcançáveis por desfazer/refazer (nem ancestrais nem
+        descendentes da cabeça do seu áudio) e foram criadas há mais de `retencao_dias` dias.
+        Retorna quantas foram apagadas.
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT ae.id, ae.audio_id, ae.parent_id, af.head_edit_id,
+                   ae.created_at < NOW() - INTERVAL %s DAY AS antiga
+            FROM audio_edits ae JOIN audio_files af ON ae.audio_id = af.id
+            ORDER BY ae.audio_id, ae.id
+        """, (retencao_dias,))
+        linhas = cursor.fetchall()
+
+        apagar = []
+        for _, grupo in groupby(linhas, key=lambda linha: linha[1]):
+            grupo = list(grupo)
+            cabeca = grupo[0][3]
+            pais = {edit_id: parent_id for edit_id, _, parent_id, _, _ in grupo}
+            alcancaveis = set()
+            no = cabeca
+            while no is not None:  # Ancestrais (e a própria cabeça)
+                alcancaveis.add(no)
+                no = pais.get(no)
+            descendentes = {cabeca}
+            for edit_id, _, parent_id, _, _ in grupo:  # Ids crescentes: o pai vem antes do filho
+                if parent_id in descendentes:
+                    descendentes.add(edit_id)
+            alcancaveis |= descendentes if cabeca is not None else set(pais)
+            apagar += [edit_id for edit_id, _, _, _, antiga in grupo if antiga and edit_id not in alcancaveis]
+
+        for pos in range(0, len(apagar), 1000):
+            lote = apagar[pos:pos + 1000]
+            cursor.execute(f"DELETE FROM audio_edits WHERE id IN ({', '.join(['%s'] * len(lote))})", lote)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        BlobStoreService.remover_versoes(apagar)
+        if apagar:
+            print(f"🔹 {len(apagar)} edição(ões) fora do grafo de versões apagada(s).")
+        return len(apagar)
+
+    @staticmethod
+    def duracao_fonte(audio_id, file_path):
+        """Duração do arquivo original (sem edições)"""
+        return DuracaoService.obter(file_path, audio_id)
+
+    @staticmethod
+    def atualizar_duracao(audio_id, file_path, edicoes=None):
+        """Grava em audio_files.duration a duração da versão atual do áudio e a retorna"""
+        if edicoes is None:
+            edicoes = EdlService.listar(audio_id)
+        _, duracao = EdlService.compilar(edicoes, EdlService.duracao_fonte(audio_id, file_path))
+
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE audio_files SET duration = %s WHERE id = %s", (round(duracao, 2), audio_id))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return duracao
+
+    @staticmethod
+    def compilar(edicoes, duracao):
+        """
+        Converte a lista de edições em estágios de renderização (trechos, efeito), com o efeito
+        como (nome, parametros) ou None. Os trechos do primeiro estágio estão no tempo do
+        original e os de cada estágio seguinte no tempo da saída do anterior; um efeito fecha o
+        estágio atual. Retorna (estagios, duracao_final).
+        """
+        estagios = []
+        trechos = [(0.0, duracao)]
+        for edicao in edicoes:
+            inicio, fim = edicao["start_time"], edicao["end_time"]
+            if edicao["edit_type"] == "cortar":
+                trechos = EdlService._sublinha(trechos, inicio, fim)
+            elif edicao["edit_type"] == "encurtar":
+                trechos = EdlService._sublinha(trechos, 0, inicio) + EdlService._sublinha(trechos, fim, None)
+            elif edicao["edit_type"] == "alongar":
+                trechos = trechos + EdlService._sublinha(trechos, inicio, fim)
+            elif edicao["edit_type"] == "silencios":
+                # Remove de uma vez todos os intervalos (ordenados, no tempo da versão atual)
+                mantidos, pos = [], 0.0
+                for a, b in edicao["parametros"]["intervalos"]:
+                    mantidos += EdlService._sublinha(trechos, pos, a)
+                    pos = b
+                trechos = mantidos + EdlService._sublinha(trechos, pos, None)
+            elif edicao["edit_type"] == "efeito":
+                efeito = (edicao["parametros"].get("efeito") or EFEITO_PADRAO,
+                          edicao["parametros"].get("parametros") or {})
+                estagios.append((EdlService._juntar(trechos), efeito))
+                trechos = [(0.0, EdlService._duracao(trechos))]
+
+        trechos = EdlService._juntar(trechos)
+        duracao_final = EdlService._duracao(trechos)
+        # Depois de um efeito, um estágio que mantém o áudio inteiro não precisa ser renderizado
+        if not estagios or trechos != [(0.0, duracao_final)]:
+            estagios.append((trechos, None))
+        return estagios, duracao_final
+
+    @staticmethod
+    def obter_arquivo(file_name):
+        """
+        Caminho a ser servido para um arquivo de `uploads`: a versão editada, do cache, ou o
+        próprio original. None se o arquivo não estiver no banco. Nada é renderizado aqui: se
+        a versão atual ainda não está no cache (edição recém-feita, desfeita ou codec trocado),
+        garante um job "renderizar" para ela e levanta VersaoPendenteError.
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT af.id, af.file_path, p.codec_saida, p.id, p.user_id FROM audio_files af
+            LEFT JOIN projectos_audio_files paf ON af.id = paf.audio_id
+            LEFT JOIN projectos p ON paf.project_id = p.id
+            WHERE af.file_name = %s
+        """, (file_name,))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if not result:
+            return None
+
+        audio_id, file_path, codec, project_id, user_id = result
+        file_path = re.sub(r'^https?://localhost:\d+/', '', file_path)
+        if not file_path.startswith(UPLOAD_DIR):
+            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+        if project_id is None or user_id is None:
+            # Áudio sem projeto (ou de um projeto sem dono): não há a quem atribuir o job
+            return EdlService.renderizar(audio_id, file_path, codec=codec or CODEC_PADRAO)
+        caminho = EdlService.renderizar(audio_id, file_path, codec=codec or CODEC_PADRAO, somente_cache=True)
+        if caminho:
+            return caminho
+
+        raise VersaoPendenteError(JobService.submeter_unico(
+            user_id, project_id, "renderizar", {"project_id": project_id, "file_name": file_name, "user_id": user_id}))
+
+    @staticmethod
+    def codec_saida(audio_id):
+        """Codec de saída do projeto do áudio"""
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT p.codec_saida FROM projectos_audio_files paf
+            JOIN projectos p ON paf.project_id = p.id
+            WHERE paf.audio_id = %s
+        """, (audio_id,))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return result[0] if result and result[0] else CODEC_PADRAO
+
+    @staticmethod
+    def renderizar(audio_id, file_path, edicoes=None, codec=CODEC_PADRAO, somente_cache=False):
+        """
+        Retorna o caminho do áudio com as edições aplicadas, codificado em `codec` (ver
+        CODECS_SAIDA), renderizando-o só se essa versão ainda não estiver em cache. Sem
+        edições e no codec padrão, retorna o próprio original. Com `somente_cache`, nunca
+        renderiza: retorna None se a versão não estiver em cache.
+        """
+        if edicoes is None:
+            edicoes = EdlService.listar(audio_id)
+        if not edicoes and codec == CODEC_PADRAO:
+            return file_path
+
+        extensao, encoder = CODECS_SAIDA[codec]
+        chave = RenderCacheService.chave(
+            [file_path], "edl",
+            [[e["edit_type"], e["start_time"], e["end_time"], e["parametros"]] for e in edicoes],
+            encoder=encoder)
+
+        def renderizar_versao(destino):
+            estagios, _ = EdlService.compilar(edicoes, EdlService.duracao_fonte(audio_id, file_path))
+            # Copiar frames só faz sentido quando a saída também é MP3
+            smart_render = codec == CODEC_PADRAO and all(
+                edicao["parametros"].get("smart_render") for edicao in edicoes)
+            EdlService._renderizar_estagios(audio_id, file_path, estagios, destino, smart_render, encoder=encoder)
+            print(f"🔹 Versão editada de {file_path} renderizada ({len(edicoes)} edição(ões), {codec}).")
+
+        if somente_cache:
+            return RenderCacheService.obter_ou_restaurar(chave, extensao)
+        return RenderCacheService.obter_ou_renderizar(chave, renderizar_versao, extensao, audio_id=audio_id,
+                                                      edit_id=edicoes[-1]["id"] if edicoes else None)
+
+    @staticmethod
+    def renderizar_preview(audio_id, file_path, edicoes, centro):
+        """
+        Prévia rápida de uma versão: só PREVIEW_JANELA_S segundos em volta de `centro` (na
+        linha do tempo da versão editada), em Opus mono de baixa taxa. Retorna a chave da
+        prévia no RenderCacheService, servida em /previews/{chave}.ogg.
+        """
+        estagios, duracao = EdlService.compilar(edicoes, EdlService.duracao_fonte(audio_id, file_path))
+        inicio = max(min(centro - PREVIEW_JANELA_S / 2, duracao - PREVIEW_JANELA_S), 0.0)
+        janela = (round(inicio, 3), round(min(inicio + PREVIEW_JANELA_S, duracao), 3))
+
+        chave = RenderCacheService.chave(
+            [file_path], "edl-preview",
+            {"edicoes": [[e["edit_type"], e["start_time"], e["end_time"], e["parametros"]] for e in edicoes],
+             "janela": janela},
+            encoder=PREVIEW_ENCODER)
+
+        def renderizar_previa(destino):
+            EdlService._renderizar_estagios(audio_id, file_path, estagios, destino, janela=janela,
+                                            encoder=PREVIEW_ENCODER)
+
+        RenderCacheService.obter_ou_renderizar(chave, renderizar_previa, extensao="ogg")
+        return chave
+
+    @staticmethod
+    def decodificar(audio_id, file_path, destino, edicoes=None):
+        """
+        Retorna (amostras, taxa) da versão atual do áudio (ou da versão com as `edicoes`) como
+        PCM mapeado em memória, sem passar por MP3: o próprio cache PCM se não houver edições,
+        ou os estágios gravados em `destino` (PCM s16le bruto).
+        """
+        if edicoes is None:
+            edicoes = EdlService.listar(audio_id)
+        if not edicoes:
+            pcm = PcmCacheService.obter_pcm(audio_id, file_path, IntermediarioService.obter(file_path))
+            if pcm is not None:
+                return pcm
+
+        estagios, _ = EdlService.compilar(edicoes, EdlService.duracao_fonte(audio_id, file_path))
+        return EdlService._renderizar_estagios(audio_id, file_path, estagios, destino, pcm_destino=True)
+
+    @staticmethod
+    def _renderizar_estagios(audio_id, file_path, estagios, destino, smart_render=False, pcm_destino=False,
+                             janela=None, encoder=None):
+        """
+        Renderiza os estágios passando o PCM em blocos de BLOCO_AMOSTRAS: trechos do estágio,
+        efeito (NumPy, no próprio processo) e então o encoder. A saída de um estágio
+        intermediário vai para um PCM temporário, do qual o estágio seguinte recorta os seus
+        trechos. A fonte é o cache PCM ou, se o áudio não couber nele, o FFmpeg decodificando
+        os trechos do original. Em áudios longos no cache, o efeito é aplicado em segmentos
+        paralelos (RenderParaleloService). Com `pcm_destino`, o último estágio é gravado como
+        PCM em vez de MP3 e o retorno é (amostras, taxa). `janela` (inicio, fim), em segundos,
+        limita a saída a esse intervalo, e `encoder` troca a configuração de saída do FFmpeg.
+        """
+        if smart_render and not pcm_destino and not janela and len(estagios) == 1 and estagios[0][1] is None and \
+                EdlService._smart_render(audio_id, file_path, estagios[0][0], destino) is not None:
+            return
+
+        pcm = PcmCacheService.obter_pcm(audio_id, file_path, IntermediarioService.obter(file_path))
+        with tempfile.TemporaryDirectory(dir=TMP_DIR) as tmp_dir:
+            for i, (trechos, efeito) in enumerate(estagios):
+                ultimo = i == len(estagios) - 1
+                if pcm is not None:
+                    amostras, taxa = pcm
+                    canais = amostras.shape[1]
+                    intervalos = EdlService._intervalos(trechos, taxa, len(amostras))
+                    total = sum(b - a for a, b in intervalos)
+
+                    def gerar_trecho(a, b, amostras=amostras, intervalos=intervalos):
+                        return EdlService._blocos_pcm(amostras, RenderParaleloService.recortar(intervalos, a, b))
+                else:
+                    taxa, canais = PCM_TAXA, PCM_CANAIS
+                    total = int(round(EdlService._duracao(trechos) * taxa))
+
+                    def gerar_trecho(a, b, trechos=trechos, total=total):
+                        if (a, b) != (0, total):
+                            trechos = EdlService._sublinha(trechos, a / PCM_TAXA, b / PCM_TAXA)
+                        return EdlService._blocos_ffmpeg(file_path, trechos)
+
+                # Efeito que analisa o original inteiro: usa as medidas gravadas, numa só passada
+                medidas = None
+                if efeito is not None and EFEITOS[efeito[0]].analisa and i == 0 and \
+                        trechos == [(0.0, EdlService.duracao_fonte(audio_id, file_path))]:
+                    medidas = EdlService._medidas(audio_id, file_path)
+
+                inicio, fim = 0, total
+                if ultimo and janela:
+                    inicio = min(int(round(janela[0] * taxa)), total)
+                    fim = max(min(int(round(janela[1] * taxa)), total), inicio)
+
+                if efeito is None:
+                    blocos = gerar_trecho(inicio, fim)
+                elif (inicio, fim) != (0, total):
+                    blocos = EfeitosService.aplicar_trecho(*efeito, gerar_trecho, taxa, canais, total, inicio, fim,
+                                                           medidas=medidas)
+                elif pcm is not None and RenderParaleloService.aplicavel(amostras, efeito[0], total, taxa):
+                    nome, parametros = efeito
+                    blocos = RenderParaleloService.aplicar(
+                        amostras, intervalos, nome, parametros, taxa, os.path.join(tmp_dir, f"estagio{i}"))
+                else:
+                    nome, parametros = efeito
+                    blocos = EfeitosService.aplicar(nome, parametros, lambda: gerar_trecho(0, total),
+                                                    taxa, canais, total, medidas)
+
+                if ultimo and pcm_destino:
+                    return EdlService._gravar_pcm(blocos, taxa, canais, destino)
+                elif ultimo:
+                    # Com o FFmpeg como fonte, o par decodificador → encoder usa um único slot
+                    return EdlService.codificar(blocos, taxa, canais, destino, slot=pcm is not None, encoder=encoder)
+                else:
+                    pcm = EdlService._gravar_pcm(blocos, taxa, canais, os.path.join(tmp_dir, f"estagio{i}.pcm"))
+
+    @staticmethod
+    def _medidas(audio_id, file_path):
+        """Medidas de loudness do original, ou None para o efeito fazer a própria análise"""
+        try:
+            return LoudnessService.obter(audio_id, file_path)
+        except Exception as e:
+            print(f"Medidas de loudness indisponíveis para {file_path}: {e}")
+            return None
+
+    @staticmethod
+    def _intervalos(trechos, taxa, tamanho):
+        """Converte trechos (inicio, fim) em segundos para intervalos de amostras"""
+        intervalos = []
+        for inicio, fim in trechos:
+            a = min(int(round(inicio * taxa)), tamanho)
+            b = tamanho if fim is None else min(int(round(fim * taxa)), tamanho)
+            if b > a:
+                intervalos.append((a, b))
+        return intervalos
+
+    @staticmethod
+    def _blocos_pcm(amostras, intervalos):
+        for a, b in intervalos:
+            for pos in range(a, b, BLOCO_AMOSTRAS):
+                yield amostras[pos:min(pos + BLOCO_AMOSTRAS, b)]
+
+    @staticmethod
+    def _blocos_ffmpeg(file_path, trechos):
+        """Blocos dos trechos decodificados pelo FFmpeg, para áudios fora do cache PCM"""
+        intermediario = IntermediarioService.obter(file_path)
+        stream = FiltergraphService.decodificar_trechos(intermediario or file_path, trechos, PCM_TAXA, PCM_CANAIS,
+                                                        buscar=intermediario is not None)
+        tamanho_bloco = BLOCO_AMOSTRAS * PCM_CANAIS * 2  # bytes (int16)
+        with FfmpegService.processo(stream, pipe_stdout=True) as processo:
+            resto = b""
+            for dados in iter(lambda: processo.stdout.read(tamanho_bloco), b""):
+                dados = resto + dados
+                completo = len(dados) - len(dados) % (PCM_CANAIS * 2)
+                resto = dados[completo:]
+                yield np.frombuffer(dados[:completo], dtype=np.int16).reshape(-1, PCM_CANAIS)
+            processo.stdout.close()
+
+        if processo.returncode != 0:
+            raise RuntimeError(f"FFmpeg falhou ao decodificar {file_path}")
+
+    @staticmethod
+    def codificar(blocos, taxa, canais, destino, slot=True, encoder=None):
+        """Codifica os blocos PCM (em MP3, se `encoder` não disser outra coisa) e retorna a duração do resultado"""
+        entrada = ffmpeg.input("pipe:", format="s16le", ac=canais, ar=taxa)
+        saida = entrada.output(destino, **(encoder or ENCODER_PADRAO))
+        total = 0
+        with FfmpegService.processo(saida, pipe_stdin=True, slot=slot) as processo:
+            for bloco in blocos:
+                processo.stdin.write(np.ascontiguousarray(bloco).tobytes())
+                total += len(bloco)
+            processo.stdin.close()
+
+        if processo.returncode != 0:
+            raise RuntimeError(f"FFmpeg falhou ao gerar {destino}")
+
+        return round(total / taxa, 2)
+
+    @staticmethod
+    def _gravar_pcm(blocos, taxa, canais, caminho):
+        """Grava a saída de um estágio intermediário e a devolve mapeada em memória"""
+        total = 0
+        with open(caminho, "wb") as f:
+            for bloco in blocos:
+                f.write(np.ascontiguousarray(bloco).tobytes())
+                total += len(bloco)
+
+        if total == 0:
+            return np.zeros((0, canais), dtype=np.int16), taxa
+        return np.memmap(caminho, dtype=np.int16, mode="r").reshape(-1, canais), taxa
+
+    @staticmethod
+    def _smart_render(audio_id, file_path, trechos, novo_path):
+        """Tenta a renderização por cópia de frames; retorna None para cair na renderização completa"""
+        if not file_path.lower().endswith(".mp3"):
+            return None
+        try:
+            indice = Mp3FrameService.carregar_indice(audio_id, file_path)
+            if indice is None:
+                return None
+            return SmartRenderService.renderizar(file_path, trechos, novo_path, indice)
+        except Exception as e:
+            print(f"Smart render indisponível para {file_path}: {e}")
+            return None
+
+    @staticmethod
+    def _sublinha(trechos, inicio, fim):
+        """Trechos do original que formam o intervalo [inicio, fim) da linha do tempo atual"""
+        resultado = []
+        pos = 0.0
+        for a, b in trechos:
+            tamanho = b - a
+            x = max(inicio - pos, 0.0)
+            y = tamanho if fim is None else min(fim - pos, tamanho)
+            if y > x:
+                resultado.append((a + x, a + y))
+            pos += tamanho
+        return resultado
+
+    @staticmethod
+    def _juntar(trechos):
+        """Une trechos consecutivos do original (o fim de um é o início do seguinte)"""
+        resultado = []
+        for a, b in trechos:
+            if resultado and abs(resultado[-1][1] - a) < 1e-9:
+                resultado[-1] = (resultado[-1][0], b)
+            else:
+                resultado.append((a, b))
+        return resultado
+
+    @staticmethod
+    def _duracao(trechos):
+        return sum(b - a for a, b in trechos)
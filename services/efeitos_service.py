@@ -0,0 +1,490 @@
+import math
+
+import numpy as np
+
+from services.loudness_service import MedidorLoudness
+
+ESCALA = 32768.0
+EFEITO_PADRAO = "reverb"
+
+EFEITOS = {}  # Nome do efeito -> classe
+
+
+def efeito(nome):
+    """Registra uma classe de efeito com o nome usado no campo `efeito` da API"""
+    def registrar(classe):
+        EFEITOS[nome] = classe
+        return classe
+    return registrar
+
+
+def _parametro(parametros, nome, padrao, minimo, maximo):
+    """Lê um parâmetro numérico do efeito, validando o intervalo"""
+    valor = parametros.get(nome, padrao)
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parâmetro {nome} deve ser numérico")
+    if not minimo <= valor <= maximo:
+        raise ValueError(f"Parâmetro {nome} deve estar entre {minimo} e {maximo}")
+    return valor
+
+
+class Efeito:
+    """
+    Efeito aplicado bloco a bloco sobre amostras float32 (n, canais) no intervalo [-1, 1].
+    O estado necessário entre blocos (histórico de atraso, posição, envelope) fica no objeto,
+    então a memória usada não depende da duração do áudio.
+    """
+
+    analisa = False  # True se o efeito precisa ver o áudio inteiro (analisar) antes de processar
+    latencia = 0  # Amostras que o efeito retém antes de entregar a saída (devolvidas em finalizar)
+
+    def __init__(self, taxa, canais, total, parametros):
+        self.taxa = taxa
+        self.canais = canais
+        self.total = total  # Amostras por canal que serão processadas
+
+    def aquecimento(self):
+        """
+        Amostras anteriores a um trecho que precisam passar pelo efeito para que o estado
+        (atrasos, envelope) chegue ao trecho como numa renderização do início. Usado pela
+        renderização em segmentos paralelos.
+        """
+        return 0
+
+    def posicionar(self, posicao):
+        """Informa a posição (em amostras) do primeiro bloco, quando não é o início do áudio"""
+
+    def analisar(self, bloco):
+        pass
+
+    def carregar_analise(self, medidas):
+        """
+        Recebe as medidas já gravadas do áudio (LoudnessService) no lugar da análise.
+        Retorna True se o efeito puder usá-las, dispensando a passada de analisar.
+        """
+        return False
+
+    def processar(self, bloco):
+        raise NotImplementedError
+
+    def finalizar(self):
+        """Amostras retidas pela latência do efeito, entregues depois do último bloco"""
+        return np.zeros((0, self.canais), dtype=np.float32)
+
+
+@efeito("ganho")
+class Ganho(Efeito):
+    """Multiplica o sinal por um ganho fixo (db)"""
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.fator = np.float32(10 ** (_parametro(parametros, "db", 0.0, -60.0, 24.0) / 20))
+
+    def processar(self, bloco):
+        return bloco * self.fator
+
+
+@efeito("fade-in")
+class FadeIn(Efeito):
+    """Sobe o volume de zero até o normal nos primeiros `duracao` segundos"""
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.tamanho = max(int(_parametro(parametros, "duracao", 1.0, 0.0, 600.0) * taxa), 1)
+        self.posicao = 0
+
+    def posicionar(self, posicao):
+        self.posicao = posicao
+
+    def processar(self, bloco):
+        inicio = self.posicao
+        self.posicao += len(bloco)
+        if inicio >= self.tamanho:
+            return bloco
+        curva = np.minimum(np.arange(inicio, self.posicao) / self.tamanho, 1.0).astype(np.float32)
+        return bloco * curva[:, None]
+
+
+@efeito("fade-out")
+class FadeOut(Efeito):
+    """Desce o volume até zero nos últimos `duracao` segundos"""
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.tamanho = max(int(_parametro(parametros, "duracao", 1.0, 0.0, 600.0) * taxa), 1)
+        self.posicao = 0
+
+    def posicionar(self, posicao):
+        self.posicao = posicao
+
+    def processar(self, bloco):
+        inicio = self.posicao
+        self.posicao += len(bloco)
+        if self.posicao <= self.total - self.tamanho:
+            return bloco
+        restantes = self.total - np.arange(inicio, self.posicao)
+        curva = np.clip(restantes / self.tamanho, 0.0, 1.0).astype(np.float32)
+        return bloco * curva[:, None]
+
+
+@efeito("normalizar")
+class Normalizar(Efeito):
+    """Ajusta o ganho para que o pico do áudio fique em `pico_db` dBFS"""
+
+    analisa = True
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.alvo = 10 ** (_parametro(parametros, "pico_db", -1.0, -60.0, 0.0) / 20)
+        self.pico = 0.0
+
+    def analisar(self, bloco):
+        if len(bloco):
+            self.pico = max(self.pico, float(np.abs(bloco).max()))
+
+    def carregar_analise(self, medidas):
+        if medidas.get("pico_dbfs") is None:
+            return False
+        self.pico = 10 ** (medidas["pico_dbfs"] / 20)
+        return True
+
+    def processar(self, bloco):
+        if self.pico == 0:
+            return bloco
+        return bloco * np.float32(self.alvo / self.pico)
+
+
+@efeito("normalizar-loudness")
+class NormalizarLoudness(Efeito):
+    """
+    Ajusta o ganho para a loudness integrada chegar a `alvo_lufs`, sem passar o true peak
+    de `pico_max_dbtp`. Um único ganho para o áudio todo (sem compressão), como o loudnorm
+    linear.
+    """
+
+    analisa = True
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.alvo = _parametro(parametros, "alvo_lufs", -16.0, -40.0, -5.0)
+        self.pico_max = _parametro(parametros, "pico_max_dbtp", -1.0, -9.0, 0.0)
+        self.medidor = MedidorLoudness(taxa, canais)
+        self.medidas = None
+        self.fator = None
+
+    def analisar(self, bloco):
+        self.medidor.adicionar(bloco)
+
+    def carregar_analise(self, medidas):
+        self.medidas = medidas
+        return True
+
+    def processar(self, bloco):
+        if self.fator is None:
+            medidas = self.medidas or self.medidor.resultado()
+            if medidas["integrado_lufs"] is None:
+                self.fator = np.float32(1.0)  # Silêncio: nada a normalizar
+            else:
+                ganho = self.alvo - medidas["integrado_lufs"]
+                if medidas["true_peak_dbtp"] is not None:
+                    ganho = min(ganho, self.pico_max - medidas["true_peak_dbtp"])
+                self.fator = np.float32(10 ** (ganho / 20))
+        return bloco * self.fator
+
+
+@efeito("eco")
+class Eco(Efeito):
+    """Uma repetição atrasada do sinal, equivalente ao aecho do FFmpeg com um atraso"""
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.atraso = max(int(_parametro(parametros, "atraso_ms", 60.0, 1.0, 5000.0) * taxa / 1000), 1)
+        self.decaimento = np.float32(_parametro(parametros, "decaimento", 0.4, 0.0, 1.0))
+        self.ganho_entrada = np.float32(_parametro(parametros, "ganho_entrada", 0.8, 0.0, 1.0))
+        self.ganho_saida = np.float32(_parametro(parametros, "ganho_saida", 0.88, 0.0, 1.0))
+        self.historico = np.zeros((self.atraso, canais), dtype=np.float32)
+
+    def aquecimento(self):
+        return self.atraso
+
+    def processar(self, bloco):
+        junto = np.concatenate([self.historico, bloco])
+        atrasado = junto[:len(bloco)]
+        self.historico = junto[len(junto) - self.atraso:]
+        return (bloco * self.ganho_entrada + atrasado * self.decaimento) * self.ganho_saida
+
+
+class _Pente:
+    """Filtro pente com realimentação: y[n] = x[n] + g * y[n - D], vetorizado em trechos de D amostras"""
+
+    def __init__(self, atraso, ganho, canais):
+        self.atraso = atraso
+        self.ganho = np.float32(ganho)
+        self.saidas = np.zeros((atraso, canais), dtype=np.float32)  # Últimas D saídas
+
+    def processar(self, x):
+        y = np.empty_like(x)
+        for p in range(0, len(x), self.atraso):
+            q = min(p + self.atraso, len(x))
+            y[p:q] = x[p:q] + self.ganho * self.saidas[:q - p]
+            self.saidas = np.concatenate([self.saidas[q - p:], y[p:q]])
+        return y
+
+
+class _PassaTudo:
+    """Filtro passa-tudo: y[n] = -g * x[n] + x[n - D] + g * y[n - D]"""
+
+    def __init__(self, atraso, ganho, canais):
+        self.atraso = atraso
+        self.ganho = np.float32(ganho)
+        self.entradas = np.zeros((atraso, canais), dtype=np.float32)
+        self.saidas = np.zeros((atraso, canais), dtype=np.float32)
+
+    def processar(self, x):
+        y = np.empty_like(x)
+        for p in range(0, len(x), self.atraso):
+            q = min(p + self.atraso, len(x))
+            y[p:q] = -self.ganho * x[p:q] + self.entradas[:q - p] + self.ganho * self.saidas[:q - p]
+            self.entradas = np.concatenate([self.entradas[q - p:], x[p:q]])
+            self.saidas = np.concatenate([self.saidas[q - p:], y[p:q]])
+        return y
+
+
+@efeito("reverb")
+class Reverb(Efeito):
+    """Reverberação de Schroeder: quatro pentes em paralelo seguidos de dois passa-tudo"""
+
+    ATRASOS_PENTES_MS = (29.7, 37.1, 41.1, 43.7)
+    ATRASOS_PASSA_TUDO_MS = (5.0, 1.7)
+    MAX_CAUDA_S = 30
+    CAUDA_QUEDA_DB = 100
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        tamanho = _parametro(parametros, "tamanho", 0.5, 0.0, 1.0)
+        self.mistura = np.float32(_parametro(parametros, "mistura", 0.3, 0.0, 1.0))
+        realimentacao = 0.7 + 0.28 * tamanho
+        # Voltas nos pentes até a cauda cair abaixo da resolução do PCM de 16 bits (~96 dB), para
+        # que um segmento renderizado à parte chegue à fronteira como na renderização contínua
+        voltas = self.CAUDA_QUEDA_DB / (-20 * math.log10(realimentacao))
+        self.cauda = int(min(voltas * max(self.ATRASOS_PENTES_MS) / 1000, self.MAX_CAUDA_S) * taxa)
+        self.pentes = [_Pente(int(ms * taxa / 1000), realimentacao, canais) for ms in self.ATRASOS_PENTES_MS]
+        self.passa_tudo = [_PassaTudo(int(ms * taxa / 1000), 0.7, canais) for ms in self.ATRASOS_PASSA_TUDO_MS]
+
+    def aquecimento(self):
+        return self.cauda
+
+    def processar(self, bloco):
+        molhado = sum(pente.processar(bloco) for pente in self.pentes) / np.float32(len(self.pentes))
+        for filtro in self.passa_tudo:
+            molhado = filtro.processar(molhado)
+        return bloco * (1 - self.mistura) + molhado * self.mistura
+
+
+@efeito("equalizador")
+class Equalizador(Efeito):
+    """
+    Equalizador de três bandas (graves < 250 Hz < médios < 4 kHz < agudos) com um FIR de
+    fase linear aplicado por FFT (overlap-add). A latência do filtro é compensada.
+    """
+
+    COEFICIENTES = 1025
+    CORTES_HZ = (250.0, 4000.0)
+    latencia = COEFICIENTES // 2
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        graves = _parametro(parametros, "graves_db", 0.0, -24.0, 24.0)
+        medios = _parametro(parametros, "medios_db", 0.0, -24.0, 24.0)
+        agudos = _parametro(parametros, "agudos_db", 0.0, -24.0, 24.0)
+
+        # Resposta desejada com transições suaves (em escala logarítmica) nos cortes
+        grade = 8192
+        log_f = np.log10(np.maximum(np.fft.rfftfreq(grade, 1 / taxa), 1.0))
+        transicao = [0.5 * (1 + np.tanh((log_f - math.log10(corte)) / 0.1)) for corte in self.CORTES_HZ]
+        ganho_db = graves + (medios - graves) * transicao[0] + (agudos - medios) * transicao[1]
+        resposta = np.fft.irfft(10 ** (ganho_db / 20), grade)
+        n = self.COEFICIENTES
+        self.coeficientes = (np.roll(resposta, n // 2)[:n] * np.hanning(n)).astype(np.float32)
+
+        self.sobra = np.zeros((n - 1, canais), dtype=np.float32)
+        self.pular = self.latencia
+
+    def aquecimento(self):
+        return self.COEFICIENTES
+
+    def processar(self, bloco):
+        n = len(bloco)
+        if n == 0:
+            return bloco
+        tamanho_fft = 1 << (n + self.COEFICIENTES - 2).bit_length()
+        espectro = np.fft.rfft(bloco, tamanho_fft, axis=0) * np.fft.rfft(self.coeficientes, tamanho_fft)[:, None]
+        saida = np.fft.irfft(espectro, tamanho_fft, axis=0)[:n + self.COEFICIENTES - 1].astype(np.float32)
+        saida[:self.COEFICIENTES - 1] += self.sobra
+        self.sobra = saida[n:].copy()
+        return self._compensar(saida[:n])
+
+    def finalizar(self):
+        return self._compensar(self.sobra[:self.latencia])
+
+    def _compensar(self, saida):
+        if self.pular:
+            descartar = min(self.pular, len(saida))
+            self.pular -= descartar
+            saida = saida[descartar:]
+        return saida
+
+
+@efeito("compressor")
+class Compressor(Efeito):
+    """
+    Compressor de dinâmica com envelope de pico por janelas de 64 amostras. As janelas caem
+    em múltiplos de JANELA da posição absoluta no áudio, não do bloco: as amostras da janela
+    incompleta no fim de um bloco ficam retidas até o próximo (latência de JANELA - 1), então
+    a saída não depende de como o áudio foi dividido em blocos.
+    """
+
+    JANELA = 64
+    latencia = JANELA - 1
+
+    def __init__(self, taxa, canais, total, parametros):
+        super().__init__(taxa, canais, total, parametros)
+        self.limiar = _parametro(parametros, "limiar_db", -18.0, -60.0, 0.0)
+        self.razao = _parametro(parametros, "razao", 4.0, 1.0, 20.0)
+        self.ganho = _parametro(parametros, "ganho_db", 0.0, 0.0, 24.0)
+        ataque = _parametro(parametros, "ataque_ms", 10.0, 0.1, 1000.0) * taxa / 1000
+        liberacao = _parametro(parametros, "liberacao_ms", 100.0, 1.0, 5000.0) * taxa / 1000
+        self.coef_ataque = math.exp(-self.JANELA / ataque)
+        self.coef_liberacao = math.exp(-self.JANELA / liberacao)
+        self.constante = max(ataque, liberacao)
+        self.envelope = -120.0
+        self.posicao = 0  # Posição absoluta da primeira amostra retida
+        self.retidas = np.zeros((0, canais), dtype=np.float32)  # Janela ainda incompleta
+
+    def aquecimento(self):
+        return int(10 * self.constante)  # O envelope converge em poucas constantes de tempo
+
+    def posicionar(self, posicao):
+        self.posicao = posicao
+
+    def processar(self, bloco):
+        dados = np.concatenate((self.retidas, bloco)) if len(self.retidas) else bloco
+        # Só as janelas completas saem agora; o resto espera o próximo bloco
+        completas = (self.posicao + len(dados)) // self.JANELA * self.JANELA - self.posicao
+        if completas <= 0:
+            self.retidas = dados
+            return dados[:0]
+        self.retidas = dados[completas:]
+        return self._comprimir(dados[:completas])
+
+    def finalizar(self):
+        saida = self._comprimir(self.retidas) if len(self.retidas) else self.retidas
+        self.retidas = self.retidas[:0]
+        return saida
+
+    def _comprimir(self, dados):
+        """Aplica o ganho às amostras `dados`, que começam em self.posicao"""
+        n = len(dados)
+        fase = self.posicao % self.JANELA  # Só depois de posicionar fora da grade: janela inicial parcial
+        janelas = -(-(fase + n) // self.JANELA)
+        picos = np.pad(np.abs(dados).max(axis=1), (fase, janelas * self.JANELA - n - fase))
+        niveis = 20 * np.log10(np.maximum(picos.reshape(janelas, self.JANELA).max(axis=1), 1e-6))
+        self.posicao += n
+
+        # O envelope é recursivo, mas só há uma iteração por janela (n / 64 por bloco)
+        envelope = np.empty(janelas)
+        e = self.envelope
+        for i, nivel in enumerate(niveis.tolist()):
+            coef = self.coef_ataque if nivel > e else self.coef_liberacao
+            e = coef * e + (1 - coef) * nivel
+            envelope[i] = e
+        self.envelope = e
+
+        reducao = np.maximum(envelope - self.limiar, 0) * (1 - 1 / self.razao)
+        curva = np.repeat(10 ** ((self.ganho - reducao) / 20), self.JANELA)[fase:fase + n].astype(np.float32)
+        return dados * curva[:, None]
+
+
+class EfeitosService:
+    """
+    Motor de efeitos em NumPy. Os efeitos são escolhidos pelo nome (registro EFEITOS) e
+    processam o PCM em blocos, dentro do próprio processo: não há um FFmpeg por efeito e a
+    memória usada fica constante em áudios longos.
+    """
+
+    @staticmethod
+    def listar():
+        return sorted(EFEITOS)
+
+    @staticmethod
+    def validar(nome, parametros=None):
+        """Levanta ValueError se o efeito não existir ou se algum parâmetro for inválido"""
+        if nome not in EFEITOS:
+            raise ValueError(f"Efeito desconhecido: {nome}. Disponíveis: {', '.join(EfeitosService.listar())}")
+        EFEITOS[nome](44100, 2, 0, parametros or {})
+
+    @staticmethod
+    def criar(nome, parametros, taxa, canais, total):
+        return EFEITOS[nome](taxa, canais, total, parametros or {})
+
+    @staticmethod
+    def aplicar(nome, parametros, gerar_blocos, taxa, canais, total, medidas=None):
+        """
+        Aplica o efeito aos blocos int16 (n, canais) de gerar_blocos() e gera os blocos de
+        saída, também int16. Efeitos que precisam de análise chamam gerar_blocos() duas vezes,
+        a não ser que possam usar as `medidas` gravadas da entrada (LoudnessService).
+        """
+        efeito_ = EfeitosService.criar(nome, parametros, taxa, canais, total)
+        EfeitosService._analisar(efeito_, gerar_blocos, medidas)
+        return EfeitosService.processar(efeito_, gerar_blocos, analisado=True)
+
+    @staticmethod
+    def aplicar_trecho(nome, parametros, gerar_trecho, taxa, canais, total, inicio, fim, alinhamento=1,
+                       medidas=None):
+        """
+        Gera só as amostras [inicio, fim) da saída do efeito, iguais às de uma renderização
+        completa. gerar_trecho(a, b) deve gerar os blocos das amostras [a, b) da entrada: o
+        efeito começa Efeito.aquecimento() antes de `inicio` (arredondado para um múltiplo de
+        `alinhamento`), vai `latencia` além de `fim` e o excedente é descartado. A análise,
+        quando o efeito precisa dela, continua sendo da entrada inteira.
+        """
+        efeito_ = EfeitosService.criar(nome, parametros, taxa, canais, total)
+        EfeitosService._analisar(efeito_, lambda: gerar_trecho(0, total), medidas)
+        aquecimento = -(-efeito_.aquecimento() // alinhamento) * alinhamento
+        a0 = max(inicio - aquecimento, 0)
+        b0 = min(fim + efeito_.latencia, total)
+        efeito_.posicionar(a0)
+
+        pos = a0
+        for bloco in EfeitosService.processar(efeito_, lambda: gerar_trecho(a0, b0), analisado=True):
+            x = max(inicio - pos, 0)
+            y = min(fim - pos, len(bloco))
+            if y > x:
+                yield bloco[x:y]
+            pos += len(bloco)
+
+    @staticmethod
+    def processar(efeito_, gerar_blocos, analisado=False):
+        """Como aplicar, mas com um efeito já criado (e posicionado)"""
+        if not analisado:
+            EfeitosService._analisar(efeito_, gerar_blocos)
+
+        for bloco in gerar_blocos():
+            yield EfeitosService._para_int16(efeito_.processar(bloco.astype(np.float32) / ESCALA))
+
+        resto = efeito_.finalizar()
+        if len(resto):
+            yield EfeitosService._para_int16(resto)
+
+    @staticmethod
+    def _analisar(efeito_, gerar_blocos, medidas=None):
+        if not efeito_.analisa or (medidas and efeito_.carregar_analise(medidas)):
+            return
+        for bloco in gerar_blocos():
+            efeito_.analisar(bloco.astype(np.float32) / ESCALA)
+
+    @staticmethod
+    def _para_int16(bloco):
+        return np.clip(bloco * ESCALA, -ESCALA, ESCALA - 1).astype(np.int16)
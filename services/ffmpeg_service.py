@@ -0,0 +1,185 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import ffmpeg
+
+FFMPEG_MAX_PROCESSOS = int(os.environ.get("FFMPEG_MAX_PROCESSOS", os.cpu_count() or 2))
+FFMPEG_MAX_FILA = int(os.environ.get("FFMPEG_MAX_FILA", 4 * FFMPEG_MAX_PROCESSOS))
+FFMPEG_ESPERA_MAX = float(os.environ.get("FFMPEG_ESPERA_MAX", 30))  # Segundos esperando um slot
+FFMPEG_TIMEOUT = float(os.environ.get("FFMPEG_TIMEOUT", 600))  # Segundos por processo
+RETRY_AFTER = 5  # Sugestão de espera (segundos) devolvida no cabeçalho Retry-After
+SLOT_ESPERA_INTERVALO = 0.05  # Segundos entre as tentativas de pegar um slot livre
+
+# Compartilhados entre o servidor, os workers do prefork e os processos do pool de renderização:
+# o PID de quem ocupa cada slot e de cada processo esperando na fila (0 = livre). A entrada de
+# um processo que morreu sem liberá-la (SIGKILL, OOM) é reaproveitada por quem a encontrar
+_slots = multiprocessing.Array("i", FFMPEG_MAX_PROCESSOS)
+_fila = multiprocessing.Array("i", FFMPEG_MAX_FILA)
+
+
+class FfmpegSaturadoError(Exception):
+    """Todos os slots do FFmpeg estão ocupados e a fila de espera está cheia"""
+
+    def __init__(self, message="Servidor ocupado, tente novamente em instantes"):
+        super().__init__(message)
+        self.retry_after = RETRY_AFTER
+
+
+class FfmpegTimeoutError(Exception):
+    """Um processo do FFmpeg passou de FFMPEG_TIMEOUT e foi encerrado"""
+
+
+class FfmpegService:
+    """
+    Executor central de processos ffmpeg/ffprobe.
+
+    Limita quantos processos rodam ao mesmo tempo (FFMPEG_MAX_PROCESSOS), quantos podem
+    esperar por um slot (FFMPEG_MAX_FILA) e quanto tempo cada processo pode durar
+    (FFMPEG_TIMEOUT). Quando a fila está cheia a chamada falha na hora com
+    FfmpegSaturadoError em vez de acumular processos. Os limites valem para todos os
+    processos do servidor, e um processo que morre segurando um slot não o perde para sempre.
+    """
+
+    @staticmethod
+    def compartilhados():
+        """Tabelas de slots e da fila, para repassar aos processos do pool (initargs)"""
+        return _slots, _fila
+
+    @staticmethod
+    def configurar(slots, fila):
+        """Initializer dos processos do pool: passa a usar os limites do processo principal"""
+        global _slots, _fila
+        _slots = slots
+        _fila = fila
+
+    @staticmethod
+    def liberar_processo(pid):
+        """Libera os slots e os lugares na fila de um processo que terminou (chamado pelo supervisor)"""
+        for tabela in (_slots, _fila):
+            with tabela.get_lock():
+                for i, dono in enumerate(tabela):
+                    if dono == pid:
+                        tabela[i] = 0
+
+    @staticmethod
+    def executar(stream, input=None, capture_stdout=False, timeout=FFMPEG_TIMEOUT):
+        """Executa um stream do ffmpeg-python até o fim e retorna o stdout (se capturado)"""
+        with FfmpegService.processo(stream, pipe_stdin=input is not None,
+                                    pipe_stdout=capture_stdout, timeout=timeout) as processo:
+            stdout, _ = processo.communicate(input)
+
+        if processo.returncode != 0:
+            raise ffmpeg.Error("ffmpeg", stdout, processo.log_erros)
+        return stdout
+
+    @staticmethod
+    @contextmanager
+    def processo(stream, pipe_stdin=False, pipe_stdout=False, timeout=FFMPEG_TIMEOUT, slot=True):
+        """
+        Inicia o ffmpeg dentro de um slot e entrega o Popen ao chamador, que lê/escreve nos
+        pipes. O slot só é liberado quando o processo termina. O stderr vai para um arquivo
+        temporário (nunca enche um pipe) e fica disponível em `processo.log_erros`.
+        `slot=False` é para o segundo processo de um par decodificador → encoder, que já
+        está coberto pelo slot do primeiro (pedir dois slots pode travar com a fila cheia).
+        """
+        args = ffmpeg.compile(stream, overwrite_output=True)
+        args[1:1] = ["-nostats"] if pipe_stdin else ["-nostats", "-nostdin"]
+
+        with FfmpegService._slot() if slot else nullcontext(), tempfile.TemporaryFile() as log:
+            processo = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE if pipe_stdin else None,
+                stdout=subprocess.PIPE if pipe_stdout else None,
+                stderr=log,
+            )
+            expirou = threading.Event()
+
+            def encerrar():
+                expirou.set()
+                processo.kill()
+
+            limite = threading.Timer(timeout, encerrar)
+            limite.daemon = True
+            limite.start()
+            try:
+                yield processo
+                processo.wait()
+            finally:
+                limite.cancel()
+                if processo.poll() is None:
+                    processo.kill()
+                    processo.wait()
+                log.seek(0)
+                processo.log_erros = log.read()
+
+        if expirou.is_set():
+            raise FfmpegTimeoutError(f"FFmpeg excedeu o tempo limite de {timeout:.0f}s")
+
+    @staticmethod
+    def probe(file_path, timeout=60):
+        """Equivalente a ffmpeg.probe, mas dentro dos limites do executor"""
+        args = ["ffprobe", "-show_format", "-show_streams", "-of", "json", file_path]
+        with FfmpegService._slot():
+            resultado = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+
+        if resultado.returncode != 0:
+            raise ffmpeg.Error("ffprobe", resultado.stdout, resultado.stderr)
+        return json.loads(resultado.stdout.decode("utf-8"))
+
+    @staticmethod
+    @contextmanager
+    def _slot():
+        pid = os.getpid()
+        if not FfmpegService._ocupar(_fila, pid):
+            raise FfmpegSaturadoError()
+
+        try:
+            limite = time.monotonic() + FFMPEG_ESPERA_MAX
+            while not FfmpegService._ocupar(_slots, pid):
+                if time.monotonic() >= limite:
+                    raise FfmpegSaturadoError()
+                time.sleep(SLOT_ESPERA_INTERVALO)
+        finally:
+            FfmpegService._desocupar(_fila, pid)
+
+        try:
+            yield
+        finally:
+            FfmpegService._desocupar(_slots, pid)
+
+    @staticmethod
+    def _ocupar(tabela, pid):
+        """Marca uma entrada livre (ou de um processo morto) da tabela com `pid`. False se não houver"""
+        with tabela.get_lock():
+            for i, dono in enumerate(tabela):
+                if dono == 0 or not FfmpegService._vivo(dono):
+                    tabela[i] = pid
+                    return True
+        return False
+
+    @staticmethod
+    def _desocupar(tabela, pid):
+        """Libera uma entrada de `pid` (cada thread do processo ocupa a sua)"""
+        with tabela.get_lock():
+            for i, dono in enumerate(tabela):
+                if dono == pid:
+                    tabela[i] = 0
+                    return
+
+    @staticmethod
+    def _vivo(pid):
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # Existe, mas é de outro usuário
+        return True
@@ -0,0 +1,60 @@
+import ffmpeg
+
+
+class FiltergraphService:
+    """
+    Monta filtergraphs do FFmpeg para que os trechos de uma edição sejam decodificados numa
+    única execução, sem nenhum arquivo intermediário.
+    """
+
+    @staticmethod
+    def compilar_trechos(entrada, trechos):
+        """
+        Recebe um stream de entrada e uma lista de trechos (inicio, fim) em segundos e
+        retorna um stream com os trechos concatenados na ordem dada, usando
+        asplit/atrim/asetpts/concat. `fim` igual a None significa até o final do áudio.
+        """
+        if not trechos:
+            raise ValueError("Nenhum trecho informado")
+
+        if len(trechos) > 1:
+            divisao = entrada.audio.filter_multi_output("asplit", len(trechos))
+            fontes = [divisao[i] for i in range(len(trechos))]
+        else:
+            fontes = [entrada.audio]
+
+        partes = []
+        for fonte, (inicio, fim) in zip(fontes, trechos):
+            if fim is None:
+                parte = fonte.filter("atrim", start=inicio)
+            else:
+                parte = fonte.filter("atrim", start=inicio, end=fim)
+            partes.append(parte.filter("asetpts", "PTS-STARTPTS"))
+
+        if len(partes) == 1:
+            return partes[0]
+        return ffmpeg.concat(*partes, v=0, a=1)
+
+    @staticmethod
+    def decodificar_trechos(file_path, trechos, taxa, canais, buscar=False):
+        """
+        Stream que entrega os trechos concatenados de `file_path` como PCM s16le no stdout.
+        Com `buscar`, cada trecho é uma entrada aberta já no seu início (-ss), em vez de
+        decodificar o arquivo desde o começo e descartar com atrim. Só é exato em formatos
+        com busca precisa por amostra, como o FLAC intermediário.
+        """
+        if buscar:
+            if not trechos:
+                raise ValueError("Nenhum trecho informado")
+            partes = []
+            for inicio, fim in trechos:
+                opcoes = {"ss": inicio} if fim is None else {"ss": inicio, "t": fim - inicio}
+                partes.append(ffmpeg.input(file_path, **opcoes).audio)
+            audio = partes[0] if len(partes) == 1 else ffmpeg.concat(*partes, v=0, a=1)
+        else:
+            audio = FiltergraphService.compilar_trechos(ffmpeg.input(file_path), trechos)
+        return (
+            audio
+            .output("pipe:", format="s16le", acodec="pcm_s16le", ac=canais, ar=taxa)
+            .global_args("-loglevel", "error")
+        )
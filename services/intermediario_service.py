@@ -0,0 +1,74 @@
+import os
+
+import ffmpeg
+
+from services.ffmpeg_service import FfmpegService
+from services.pcm_cache_service import PCM_CANAIS, PCM_TAXA, PcmCacheService
+
+UPLOAD_DIR = "uploads"
+INTERMEDIARIO_DIR = os.path.join("cache", "intermediarios")  # Fora de uploads: /uploads serve o que estiver lá
+
+os.makedirs(os.path.dirname(INTERMEDIARIO_DIR), exist_ok=True)
+if os.path.isdir(os.path.join(UPLOAD_DIR, "intermediarios")) and not os.path.exists(INTERMEDIARIO_DIR):
+    # Local antigo, acessível por /uploads/intermediarios
+    os.replace(os.path.join(UPLOAD_DIR, "intermediarios"), INTERMEDIARIO_DIR)
+os.makedirs(INTERMEDIARIO_DIR, exist_ok=True)
+
+
+class IntermediarioService:
+    """
+    Formato intermediário canônico dos áudios enviados.
+
+    Depois do upload, um job em segundo plano converte o original para FLAC 16 bits em
+    PCM_TAXA/PCM_CANAIS, guardado em cache/intermediarios com o hash do conteúdo do
+    original no nome. As edições decodificam dele em vez do MP3: é mais rápido de
+    decodificar, a busca por tempo é exata e nada é perdido antes da codificação final.
+    Enquanto a conversão não termina (ou se ela falhar), o original é usado.
+    """
+
+    @staticmethod
+    def obter(file_path):
+        """Caminho do intermediário do arquivo, ou None se ele ainda não foi gerado"""
+        caminho = IntermediarioService._caminho(file_path)
+        return caminho if os.path.exists(caminho) else None
+
+    @staticmethod
+    def fonte(file_path):
+        """Arquivo de onde as edições devem decodificar: o intermediário, se existir, ou o original"""
+        return IntermediarioService.obter(file_path) or file_path
+
+    @staticmethod
+    def gerar(file_path):
+        """Converte o original para o intermediário (se ainda não existir) e retorna o caminho"""
+        caminho = IntermediarioService._caminho(file_path)
+        if os.path.exists(caminho):
+            return caminho
+
+        tmp_path = f"{caminho}.{os.getpid()}.tmp"
+        stream = (
+            ffmpeg
+            .input(file_path)
+            .output(tmp_path, format="flac", acodec="flac", sample_fmt="s16", ac=PCM_CANAIS, ar=PCM_TAXA)
+            .global_args("-loglevel", "error")
+        )
+        try:
+            FfmpegService.executar(stream)
+            os.replace(tmp_path, caminho)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        print(f"🔹 Intermediário de {file_path} gerado.")
+        return caminho
+
+    @staticmethod
+    def remover(file_path):
+        """Apaga o intermediário do arquivo (chamado antes de apagar o original)"""
+        try:
+            os.remove(IntermediarioService._caminho(file_path))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _caminho(file_path):
+        return os.path.join(INTERMEDIARIO_DIR, PcmCacheService.calcular_hash(file_path)[:32] + ".flac")
@@ -0,0 +1,267 @@
+import functools
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from database import conectar
+from services.ffmpeg_service import FfmpegService, RETRY_AFTER
+
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 2))
+RENDER_FILA_MAX = int(os.environ.get("RENDER_FILA_MAX", 8 * RENDER_WORKERS))  # Jobs aguardando no processo
+
+# Operação -> método de EdicaoAudioService que executa o job
+OPERACOES = {
+    "recortar": "recortar_audio",
+    "mesclar": "mesclar_audio",
+    "mixar": "mixar_audios",
+    "alongar": "alongar_audio",
+    "encurtar": "encurtar_audio",
+    "aplicar-efeito": "aplicar_efeito",
+    "renderizar": "renderizar_versao",
+    "intermediario": "gerar_intermediario",
+    "analisar": "analisar_versao",
+}
+
+
+def _executar_job(job_id):
+    """Executa um job num processo do pool. Fica fora da classe para poder ser enviado ao pool"""
+    from services.edicao_service import EdicaoAudioService
+
+    conn = conectar()
+    cursor = conn.cursor(dictionary=True)
+
+    # Reservar o job de forma atômica: só um worker consegue passá-lo para "executando"
+    cursor.execute(
+        "UPDATE render_jobs SET status = 'executando' WHERE id = %s AND status = 'pendente'", (job_id,))
+    conn.commit()
+    if cursor.rowcount != 1:
+        cursor.close()
+        conn.close()
+        return
+
+    cursor.execute("SELECT operacao, parametros FROM render_jobs WHERE id = %s", (job_id,))
+    job = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    try:
+        metodo = getattr(EdicaoAudioService, OPERACOES[job["operacao"]])
+        resultado = metodo(**json.loads(job["parametros"]))
+        if isinstance(resultado, tuple):
+            resultado = resultado[0]  # Alguns serviços retornam (corpo, status HTTP)
+    except Exception as e:
+        resultado = {"status": "erro", "message": str(e)}
+
+    status = "concluido" if resultado.get("status") == "sucesso" else "falhou"
+    JobService._finalizar(job_id, status, resultado)
+
+
+class JobService:
+    """
+    Fila de renderização assíncrona.
+
+    Os endpoints de edição gravam o job na tabela render_jobs e respondem imediatamente;
+    um pool de processos executa a renderização e grava o resultado no mesmo registro,
+    que é consultado por GET /api/jobs/{id}.
+    """
+
+    _pool = None
+    _em_andamento = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def submeter(user_id, project_id, operacao, parametros):
+        """
+        Registra um job de edição e o envia ao pool de workers. Se a fila já tiver
+        RENDER_FILA_MAX jobs, recusa na hora com status "ocupado" (503 no servidor).
+        """
+        if operacao not in OPERACOES:
+            return {"status": "erro", "message": f"Operação desconhecida: {operacao}"}
+
+        with JobService._lock:
+            if JobService._em_andamento >= RENDER_FILA_MAX:
+                return {"status": "ocupado", "message": "Servidor ocupado, tente novamente em instantes",
+                        "retry_after": RETRY_AFTER}
+
+        job_id = str(uuid.uuid4())
+        try:
+            conn = conectar()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO render_jobs (id, user_id, projeto_id, operacao, parametros)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (job_id, user_id, project_id, operacao, json.dumps(parametros)))
+            conn.commit()
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
+
+        try:
+            JobService._enviar(job_id)
+        except Exception as e:
+            JobService._finalizar(job_id, "falhou", {"status": "erro", "message": str(e)})
+            return {"status": "erro", "message": str(e)}
+
+        return {"status": "pendente", "job_id": job_id, "job_url": f"/api/jobs/{job_id}"}
+
+    @staticmethod
+    def submeter_unico(user_id, project_id, operacao, parametros):
+        """
+        Como submeter, mas se já houver um job igual (mesma operação e parâmetros) pendente
+        ou executando, retorna esse em vez de criar outro.
+        """
+        try:
+            conn = conectar()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, parametros FROM render_jobs
+                WHERE projeto_id = %s AND operacao = %s AND status IN ('pendente', 'executando')
+            """, (project_id, operacao))
+            existentes = cursor.fetchall()
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
+
+        procurados = {chave: str(valor) for chave, valor in parametros.items()}
+        for job_id, parametros_job in existentes:
+            if {chave: str(valor) for chave, valor in json.loads(parametros_job).items()} == procurados:
+                return {"status": "pendente", "job_id": job_id, "job_url": f"/api/jobs/{job_id}"}
+
+        return JobService.submeter(user_id, project_id, operacao, parametros)
+
+    @staticmethod
+    def obter_job(job_id, user_id):
+        """Retorna o estado de um job do usuário e, se já terminou, o resultado"""
+        try:
+            conn = conectar()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, operacao, status, resultado, created_at, updated_at
+                FROM render_jobs WHERE id = %s AND user_id = %s
+            """, (job_id, user_id))
+            job = cursor.fetchone()
+            cursor.close()
+            conn.close()
+
+            if not job:
+                return {"status": "erro", "message": "Job não encontrado"}
+
+            for campo in ("created_at", "updated_at"):
+                if isinstance(job[campo], datetime):
+                    job[campo] = job[campo].strftime("%Y-%m-%d %H:%M:%S")
+            job["resultado"] = json.loads(job["resultado"]) if job["resultado"] else None
+
+            return {"status": "sucesso", "job": job}
+
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
+
+    @staticmethod
+    def retomar_pendentes():
+        """
+        Chamado na inicialização do servidor: reenvia ao pool os jobs que ficaram pendentes
+        e marca como falhos os que estavam executando quando o servidor parou. Nenhum job
+        pode estar executando de verdade nesse momento: a inicialização roda antes de
+        qualquer processo atender requisições (ver servidor.py).
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+
+        cursor.execute("UPDATE render_jobs SET status = 'falhou', resultado = %s WHERE status = 'executando'",
+                       (json.dumps({"status": "erro", "message": "Job interrompido"}),))
+        conn.commit()
+
+        cursor.execute("SELECT id FROM render_jobs WHERE status = 'pendente' ORDER BY created_at")
+        pendentes = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+
+        for job_id in pendentes:
+            JobService._enviar(job_id)
+
+        if pendentes:
+            print(f"🔹 {len(pendentes)} job(s) de renderização retomado(s).")
+
+    @staticmethod
+    def _finalizar(job_id, status, resultado, somente_em_aberto=False):
+        try:
+            conn = conectar()
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE render_jobs SET status = %s, resultado = %s WHERE id = %s"
+                + (" AND status IN ('pendente', 'executando')" if somente_em_aberto else ""),
+                (status, json.dumps(resultado), job_id)
+            )
+            conn.commit()
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            print(f"Erro ao finalizar job {job_id}: {e}")
+
+    @staticmethod
+    def _enviar(job_id):
+        with JobService._lock:
+            JobService._em_andamento += 1
+        try:
+            pool = JobService._obter_pool()
+            try:
+                futuro = pool.submit(_executar_job, job_id)
+            except BrokenProcessPool:
+                # Um worker morreu (ex.: OOM numa renderização longa) e o pool não aceita
+                # mais jobs: é descartado e o job vai para um pool novo
+                JobService._descartar_pool(pool)
+                pool = JobService._obter_pool()
+                futuro = pool.submit(_executar_job, job_id)
+        except Exception:
+            with JobService._lock:
+                JobService._em_andamento -= 1
+            raise
+        futuro.add_done_callback(functools.partial(JobService._concluido, job_id, pool))
+
+    @staticmethod
+    def _concluido(job_id, pool, futuro):
+        with JobService._lock:
+            JobService._em_andamento -= 1
+
+        erro = None if futuro.cancelled() else futuro.exception()
+        if erro is not None:
+            # O job não chegou a gravar o resultado (o worker morreu): sem isso ele ficaria
+            # pendente ou executando até o servidor reiniciar
+            print(f"Erro no job {job_id}: {erro!r}")
+            JobService._finalizar(job_id, "falhou", {"status": "erro", "message": "Job interrompido"},
+                                  somente_em_aberto=True)
+            if isinstance(erro, BrokenProcessPool):
+                JobService._descartar_pool(pool)
+
+    @staticmethod
+    def _descartar_pool(pool):
+        with JobService._lock:
+            if JobService._pool is pool:
+                JobService._pool = None
+        pool.shutdown(wait=False)
+
+    @staticmethod
+    def encerrar():
+        """Espera os jobs enviados por este processo terminarem (encerramento gracioso do servidor)"""
+        with JobService._lock:
+            pool, JobService._pool = JobService._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    @staticmethod
+    def _obter_pool():
+        with JobService._lock:  # O servidor atende várias requisições ao mesmo tempo
+            if JobService._pool is None:
+                # Os workers usam o mesmo semáforo do FfmpegService que o servidor
+                JobService._pool = ProcessPoolExecutor(
+                    max_workers=RENDER_WORKERS,
+                    initializer=FfmpegService.configurar,
+                    initargs=FfmpegService.compartilhados(),
+                )
+            return JobService._pool
@@ -0,0 +1,267 @@
+import json
+import math
+import os
+import re
+
+import ffmpeg
+import numpy as np
+
+from database import conectar
+from services.ffmpeg_service import FfmpegService
+from services.intermediario_service import IntermediarioService
+from services.pcm_cache_service import PCM_CANAIS, PCM_TAXA, PcmCacheService
+
+UPLOAD_DIR = "uploads"
+SEGMENTO_S = 0.1  # Os blocos de 400 ms e as janelas de 3 s andam de 100 em 100 ms
+BLOCO_RMS_S = 1.0  # Resolução da série de RMS gravada
+BLOCO_LEITURA = 256 * 1024  # Amostras por leitura
+
+
+class MedidorLoudness:
+    """
+    Mede loudness (EBU R128 / ITU-R BS.1770) em streaming, bloco a bloco.
+
+    O sinal é dividido em segmentos de 100 ms e, de cada um, só guardamos a energia: a
+    ponderação K é aplicada no domínio da frequência (Parseval), com a resposta dos dois
+    biquads da norma. Loudness integrada, LRA e RMS saem dessas energias no fim; o true
+    peak usa sobreamostragem 4x por um FIR polifásico. A memória cresce só com o número de
+    segmentos (alguns bytes a cada 100 ms).
+    """
+
+    FASES = 4
+    COEFICIENTES_POR_FASE = 12
+
+    def __init__(self, taxa, canais):
+        self.taxa = taxa
+        self.canais = canais
+        self.segmento = int(round(taxa * SEGMENTO_S))
+
+        n = self.segmento
+        freqs = np.fft.rfftfreq(n, 1 / taxa)
+        pesos = np.full(len(freqs), 2.0)  # Parseval para a rfft: DC e Nyquist contam uma vez
+        pesos[0] = 1.0
+        if n % 2 == 0:
+            pesos[-1] = 1.0
+        self.ponderacao = pesos * MedidorLoudness._ponderacao_k(freqs, taxa) / (n * n)
+
+        total = self.FASES * self.COEFICIENTES_POR_FASE
+        t = (np.arange(total) - (total - 1) / 2) / self.FASES
+        h = np.sinc(t) * np.hanning(total)
+        self.fases = [h[p::self.FASES] * (self.FASES / h.sum()) for p in range(self.FASES)]
+
+        self.resto = np.zeros((0, canais), dtype=np.float32)
+        self.cauda = np.zeros((self.COEFICIENTES_POR_FASE - 1, canais), dtype=np.float32)
+        self.energias_k = []  # Energia ponderada K por segmento (soma dos canais)
+        self.energias = []  # Média quadrática sem ponderação por segmento
+        self.pico = 0.0
+        self.true_peak = 0.0
+
+    def adicionar(self, bloco):
+        """Acrescenta amostras float (n, canais) no intervalo [-1, 1]"""
+        if not len(bloco):
+            return
+        self.pico = max(self.pico, float(np.abs(bloco).max()))
+
+        # True peak: cada fase do FIR dá uma das 4 amostras intermediárias
+        entrada = np.concatenate([self.cauda, bloco])
+        self.cauda = entrada[len(entrada) - (self.COEFICIENTES_POR_FASE - 1):]
+        for canal in range(self.canais):
+            for fase in self.fases:
+                interpolado = np.convolve(entrada[:, canal], fase, mode="valid")
+                self.true_peak = max(self.true_peak, float(np.abs(interpolado).max()))
+
+        dados = np.concatenate([self.resto, bloco])
+        completos = len(dados) - len(dados) % self.segmento
+        self.resto = dados[completos:]
+        if not completos:
+            return
+        segmentos = dados[:completos].reshape(-1, self.segmento, self.canais).astype(np.float64)
+        espectro = np.abs(np.fft.rfft(segmentos, axis=1)) ** 2
+        self.energias_k.append((espectro * self.ponderacao[None, :, None]).sum(axis=(1, 2)))
+        self.energias.append((segmentos ** 2).mean(axis=(1, 2)))
+
+    def resultado(self):
+        """Medidas finais; loudness e LRA ficam None quando o áudio é curto ou silencioso demais"""
+        z = np.concatenate(self.energias_k) if self.energias_k else np.zeros(0)
+        energias = np.concatenate(self.energias) if self.energias else np.zeros(0)
+        por_bloco_rms = int(round(BLOCO_RMS_S / SEGMENTO_S))
+
+        rms_blocos = []
+        for i in range(0, len(energias), por_bloco_rms):
+            rms_blocos.append(MedidorLoudness._db(energias[i:i + por_bloco_rms].mean()))
+
+        return {
+            "integrado_lufs": MedidorLoudness._integrado(z),
+            "true_peak_dbtp": MedidorLoudness._db(max(self.true_peak, self.pico) ** 2),
+            "pico_dbfs": MedidorLoudness._db(self.pico ** 2),
+            "lra": MedidorLoudness._lra(z),
+            "rms_dbfs": MedidorLoudness._db(energias.mean()) if len(energias) else None,
+            "rms_blocos": rms_blocos,
+        }
+
+    @staticmethod
+    def _integrado(z):
+        """Loudness integrada: blocos de 400 ms (75% de sobreposição) com gates de -70 LUFS e -10 LU"""
+        if len(z) < 4:
+            return None
+        blocos = np.convolve(z, np.ones(4) / 4, mode="valid")
+        loudness = -0.691 + 10 * np.log10(np.maximum(blocos, 1e-20))
+        blocos = blocos[loudness > -70]
+        if not len(blocos):
+            return None
+        relativo = -0.691 + 10 * math.log10(blocos.mean()) - 10
+        blocos = blocos[-0.691 + 10 * np.log10(blocos) > relativo]
+        return round(-0.691 + 10 * math.log10(blocos.mean()), 2)
+
+    @staticmethod
+    def _lra(z):
+        """Loudness range (EBU Tech 3342): janelas de 3 s, gates de -70 LUFS e -20 LU, P95 - P10"""
+        if len(z) < 30:
+            return None
+        janelas = np.convolve(z, np.ones(30) / 30, mode="valid")
+        loudness = -0.691 + 10 * np.log10(np.maximum(janelas, 1e-20))
+        janelas, loudness = janelas[loudness > -70], loudness[loudness > -70]
+        if not len(janelas):
+            return None
+        loudness = loudness[loudness > -0.691 + 10 * math.log10(janelas.mean()) - 20]
+        return round(float(np.percentile(loudness, 95) - np.percentile(loudness, 10)), 2)
+
+    @staticmethod
+    def _db(energia):
+        return round(10 * math.log10(energia), 2) if energia > 0 else None
+
+    @staticmethod
+    def _ponderacao_k(freqs, taxa):
+        """|H(f)|² da ponderação K: shelf de +4 dB em altas frequências seguido de um passa-altas de 38 Hz"""
+        z = np.exp(-1j * 2 * np.pi * freqs / taxa)
+
+        w0 = 2 * math.pi * 1500.0 / taxa
+        a = 10 ** (4.0 / 40)
+        alpha = math.sin(w0) / (2 / math.sqrt(2))
+        cos = math.cos(w0)
+        shelf = (
+            (a * ((a + 1) + (a - 1) * cos + 2 * math.sqrt(a) * alpha)
+             - 2 * a * ((a - 1) + (a + 1) * cos) * z
+             + a * ((a + 1) + (a - 1) * cos - 2 * math.sqrt(a) * alpha) * z ** 2)
+            / (((a + 1) - (a - 1) * cos + 2 * math.sqrt(a) * alpha)
+               + 2 * ((a - 1) - (a + 1) * cos) * z
+               + ((a + 1) - (a - 1) * cos - 2 * math.sqrt(a) * alpha) * z ** 2)
+        )
+
+        w0 = 2 * math.pi * 38.0 / taxa
+        alpha = math.sin(w0) / (2 * 0.5)
+        cos = math.cos(w0)
+        passa_altas = (
+            ((1 + cos) / 2 - (1 + cos) * z + (1 + cos) / 2 * z ** 2)
+            / ((1 + alpha) - 2 * cos * z + (1 - alpha) * z ** 2)
+        )
+        return np.abs(shelf * passa_altas) ** 2
+
+
+class LoudnessService:
+    """
+    Análise de loudness e níveis de cada linha de audio_files, feita uma única vez e
+    guardada em audio_loudness (identificada pelo hash do conteúdo do arquivo). Listagens e
+    normalizações usam as medidas gravadas sem ler o áudio de novo.
+    """
+
+    @staticmethod
+    def obter_audio(audio_id, user_id, incluir_blocos=False):
+        """Medidas de um áudio que pertence ao usuário"""
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT af.file_path FROM audio_files af
+            JOIN projectos_audio_files paf ON af.id = paf.audio_id
+            JOIN projectos p ON paf.project_id = p.id
+            WHERE af.id = %s AND p.user_id = %s
+        """, (audio_id, user_id))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if not result:
+            return {"status": "erro", "message": "Áudio não encontrado"}
+
+        file_path = re.sub(r'^https?://localhost:\d+/', '', result[0])
+        if not file_path.startswith(UPLOAD_DIR):
+            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+        if not os.path.exists(file_path):
+            return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
+
+        medidas = LoudnessService.obter(audio_id, file_path)
+        if not incluir_blocos:
+            medidas = {campo: valor for campo, valor in medidas.items() if campo != "rms_blocos"}
+        return {"status": "sucesso", "audio_id": audio_id, "bloco_rms_s": BLOCO_RMS_S, **medidas}
+
+    @staticmethod
+    def obter(audio_id, file_path):
+        """Medidas do arquivo: as gravadas, se o conteúdo não mudou, ou medidas e gravadas agora"""
+        content_hash = PcmCacheService.calcular_hash(file_path)
+
+        conn = conectar()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT integrado_lufs, true_peak_dbtp, pico_dbfs, lra, rms_dbfs, rms_blocos
+            FROM audio_loudness WHERE audio_id = %s AND content_hash = %s
+        """, (audio_id, content_hash))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if result:
+            medidas = {campo: float(valor) if valor is not None else None
+                       for campo, valor in result.items() if campo != "rms_blocos"}
+            medidas["rms_blocos"] = json.loads(result["rms_blocos"]) if result["rms_blocos"] else []
+            return medidas
+
+        medidas = LoudnessService.medir(audio_id, file_path)
+
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            REPLACE INTO audio_loudness
+                (audio_id, content_hash, integrado_lufs, true_peak_dbtp, pico_dbfs, lra, rms_dbfs, rms_blocos)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (audio_id, content_hash, medidas["integrado_lufs"], medidas["true_peak_dbtp"], medidas["pico_dbfs"],
+              medidas["lra"], medidas["rms_dbfs"], json.dumps(medidas["rms_blocos"])))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        print(f"🔹 Loudness de {file_path}: {medidas['integrado_lufs']} LUFS, {medidas['true_peak_dbtp']} dBTP.")
+        return medidas
+
+    @staticmethod
+    def medir(audio_id, file_path):
+        """Lê o áudio em blocos (do cache PCM ou decodificando com o FFmpeg) e mede"""
+        fonte = IntermediarioService.fonte(file_path)
+        pcm = PcmCacheService.obter_pcm(audio_id, file_path, fonte)
+        if pcm is not None:
+            amostras, taxa = pcm
+            medidor = MedidorLoudness(taxa, amostras.shape[1])
+            for pos in range(0, len(amostras), BLOCO_LEITURA):
+                medidor.adicionar(amostras[pos:pos + BLOCO_LEITURA].astype(np.float32) / 32768)
+            return medidor.resultado()
+
+        stream = (
+            ffmpeg
+            .input(fonte)
+            .output("pipe:", format="s16le", acodec="pcm_s16le", ac=PCM_CANAIS, ar=PCM_TAXA)
+            .global_args("-loglevel", "error")
+        )
+        medidor = MedidorLoudness(PCM_TAXA, PCM_CANAIS)
+        tamanho_bloco = BLOCO_LEITURA * PCM_CANAIS * 2  # bytes (int16)
+        with FfmpegService.processo(stream, pipe_stdout=True) as processo:
+            resto = b""
+            for dados in iter(lambda: processo.stdout.read(tamanho_bloco), b""):
+                dados = resto + dados
+                completo = len(dados) - len(dados) % (PCM_CANAIS * 2)
+                resto = dados[completo:]
+                valores = np.frombuffer(dados[:completo], dtype=np.int16).reshape(-1, PCM_CANAIS)
+                medidor.adicionar(valores.astype(np.float32) / 32768)
+            processo.stdout.close()
+
+        if processo.returncode != 0:
+            raise RuntimeError(f"FFmpeg falhou ao decodificar {file_path}")
+        return medidor.resultado()
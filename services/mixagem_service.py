@@ -0,0 +1,38 @@
+import numpy as np
+
+BLOCO_MIXAGEM = 256 * 1024  # Amostras de saída por bloco
+
+
+class MixagemService:
+    """
+    Mixagem de várias faixas em blocos de BLOCO_MIXAGEM amostras. Cada bloco de saída soma
+    só o pedaço de cada faixa que cai nele, então a memória usada não depende da duração
+    nem da quantidade de faixas.
+    """
+
+    @staticmethod
+    def ganhos(ganho_db, pan):
+        """
+        Ganho por canal (esquerdo, direito) de uma faixa estéreo. `pan` vai de -1 (só o
+        esquerdo) a 1 (só o direito); no centro os dois canais ficam com o ganho da faixa.
+        """
+        fator = 10 ** (ganho_db / 20)
+        return np.array([fator * min(1.0, 1.0 - pan), fator * min(1.0, 1.0 + pan)], dtype=np.float32)
+
+    @staticmethod
+    def blocos(faixas, canais):
+        """
+        Recebe faixas (amostras, inicio, ganhos), com `amostras` int16 (n, canais), `inicio`
+        em amostras na linha do tempo da mixagem e `ganhos` por canal, e gera os blocos int16
+        da soma. A mixagem termina no fim da faixa que acaba por último.
+        """
+        total = max((inicio + len(amostras) for amostras, inicio, _ in faixas), default=0)
+        for pos in range(0, total, BLOCO_MIXAGEM):
+            fim = min(pos + BLOCO_MIXAGEM, total)
+            mix = np.zeros((fim - pos, canais), dtype=np.float32)
+            for amostras, inicio, ganhos in faixas:
+                a = max(pos, inicio)
+                b = min(fim, inicio + len(amostras))
+                if b > a:
+                    mix[a - pos:b - pos] += amostras[a - inicio:b - inicio] * ganhos
+            yield np.clip(mix, -32768, 32767).astype(np.int16)
@@ -0,0 +1,279 @@
+import json
+import mmap
+import os
+
+import numpy as np
+
+INDICE_DIR = os.path.join("cache", "indices")
+BITRATES_MPEG1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+BITRATES_MPEG2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+TAXAS = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+ATRASO_DECODIFICADOR = 529  # Atraso do decodificador MP3 (amostras), somado ao atraso do LAME
+DTYPE_INDICE = np.dtype([("offset", "<i8"), ("tamanho", "<i4"), ("main_data_begin", "<i2")])
+CAMPOS_META = ("taxa", "canais", "amostras_por_frame", "bitrate", "atraso", "preenchimento", "duracao")
+
+os.makedirs(INDICE_DIR, exist_ok=True)
+
+
+class Mp3FrameService:
+    """
+    Leitura dos frames de um arquivo MP3 (MPEG-1/2/2.5 Layer III) sem decodificar o áudio.
+
+    O índice gerado associa cada frame ao seu offset em bytes e à posição em amostras
+    (frame * amostras_por_frame), e guarda o main_data_begin de cada frame, usado para
+    tratar o bit reservoir ao copiar frames para outro arquivo.
+
+    O índice de cada arquivo em audio_files é gravado uma única vez (no upload ou no
+    primeiro uso) em INDICE_DIR, como um array .npy aberto com memmap e um .json com os
+    metadados, e é invalidado quando o tamanho ou a data de modificação do arquivo mudam.
+    """
+
+    @staticmethod
+    def salvar_indice(audio_id, file_path, indice=None):
+        """Grava o índice de frames do áudio em disco. Retorna o índice, ou None se não for MP3"""
+        if indice is None:
+            indice = Mp3FrameService.indexar(file_path)
+        if indice is None:
+            return None
+
+        frames = np.empty(len(indice["offsets"]), dtype=DTYPE_INDICE)
+        frames["offset"] = indice["offsets"]
+        frames["tamanho"] = indice["tamanhos"]
+        frames["main_data_begin"] = indice["main_data_begin"]
+
+        base = os.path.join(INDICE_DIR, str(audio_id))
+        stat = os.stat(file_path)
+        meta = {campo: indice[campo] for campo in CAMPOS_META}
+        meta["tamanho_arquivo"] = stat.st_size
+        meta["mtime"] = stat.st_mtime_ns
+
+        tmp_path = f"{base}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, frames)
+        os.replace(tmp_path, base + ".npy")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        return indice
+
+    @staticmethod
+    def carregar_indice(audio_id, file_path):
+        """Carrega o índice gravado do áudio, recriando-o se não existir ou estiver desatualizado"""
+        base = os.path.join(INDICE_DIR, str(audio_id))
+        try:
+            with open(base + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            stat = os.stat(file_path)
+            if meta["tamanho_arquivo"] == stat.st_size and meta["mtime"] == stat.st_mtime_ns:
+                frames = np.load(base + ".npy", mmap_mode="r")
+                indice = {campo: meta[campo] for campo in CAMPOS_META}
+                indice["offsets"] = frames["offset"]
+                indice["tamanhos"] = frames["tamanho"]
+                indice["main_data_begin"] = frames["main_data_begin"]
+                return indice
+        except (OSError, ValueError, KeyError):
+            pass  # Índice ausente ou corrompido: recriar
+
+        return Mp3FrameService.salvar_indice(audio_id, file_path)
+
+    @staticmethod
+    def remover_indice(audio_id):
+        for ext in (".npy", ".json"):
+            caminho = os.path.join(INDICE_DIR, f"{audio_id}{ext}")
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+    @staticmethod
+    def indexar(file_path):
+        """Indexa os frames de um arquivo MP3. Retorna None se o arquivo não for MP3 Layer III"""
+        with open(file_path, "rb") as f:
+            try:
+                dados = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return None  # Arquivo vazio
+            try:
+                return Mp3FrameService.indexar_bytes(dados)
+            finally:
+                dados.close()
+
+    @staticmethod
+    def indexar_bytes(dados):
+        """Indexa os frames de um MP3 em memória (bytes, bytearray ou mmap)"""
+        pos = Mp3FrameService._pular_id3v2(dados)
+        pos = Mp3FrameService._sincronizar(dados, pos)
+        if pos is None:
+            return None
+
+        primeiro = Mp3FrameService.ler_cabecalho(dados, pos)
+        tamanho, taxa, canais, amostras_por_frame, bitrate, _ = primeiro
+
+        atraso = 0
+        preenchimento = 0
+        tag = Mp3FrameService._ler_tag_xing(dados, pos, primeiro)
+        if tag is not None:
+            # O primeiro frame é só a tag Xing/Info; o áudio começa no seguinte
+            atraso, preenchimento = tag
+            pos += tamanho
+
+        offsets = []
+        tamanhos = []
+        main_data_begin = []
+        while pos is not None and pos < len(dados):
+            cabecalho = Mp3FrameService.ler_cabecalho(dados, pos)
+            if cabecalho is None:
+                if dados[pos:pos + 3] == b"TAG" or dados[pos:pos + 8] == b"APETAGEX":
+                    break  # Tags no final do arquivo
+                pos = Mp3FrameService._sincronizar(dados, pos + 1)
+                continue
+
+            tamanho, taxa_frame, canais_frame, amostras_frame, _, _ = cabecalho
+            if taxa_frame != taxa or amostras_frame != amostras_por_frame:
+                pos = Mp3FrameService._sincronizar(dados, pos + 1)
+                continue
+            if pos + tamanho > len(dados):
+                break  # Frame truncado no final do arquivo
+
+            offsets.append(pos)
+            tamanhos.append(tamanho)
+            main_data_begin.append(Mp3FrameService.ler_main_data_begin(dados, pos, cabecalho))
+            pos += tamanho
+
+        total_amostras = len(offsets) * amostras_por_frame
+        if tag is not None:
+            # O FFmpeg descarta atraso + 529 amostras no início e preenchimento - 529 no final
+            total_amostras -= atraso + preenchimento - ATRASO_DECODIFICADOR
+
+        return {
+            "taxa": taxa,
+            "canais": canais,
+            "amostras_por_frame": amostras_por_frame,
+            "bitrate": bitrate,
+            "atraso": atraso,
+            "preenchimento": preenchimento,
+            "duracao": max(total_amostras, 0) / taxa,
+            "offsets": np.array(offsets, dtype=np.int64),
+            "tamanhos": np.array(tamanhos, dtype=np.int32),
+            "main_data_begin": np.array(main_data_begin, dtype=np.int16),
+        }
+
+    @staticmethod
+    def ler_cabecalho(dados, pos):
+        """
+        Interpreta o cabeçalho de frame em `pos`.
+        Retorna (tamanho, taxa, canais, amostras_por_frame, bitrate, crc) ou None.
+        """
+        if pos < 0 or pos + 4 > len(dados):
+            return None
+
+        b0, b1, b2, b3 = dados[pos], dados[pos + 1], dados[pos + 2], dados[pos + 3]
+        if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+            return None
+
+        versao = (b1 >> 3) & 3
+        camada = (b1 >> 1) & 3
+        indice_bitrate = b2 >> 4
+        indice_taxa = (b2 >> 2) & 3
+        if versao == 1 or camada != 1 or indice_bitrate in (0, 15) or indice_taxa == 3:
+            return None  # Versão reservada, outra camada ou formato livre
+
+        mpeg1 = versao == 3
+        bitrate = (BITRATES_MPEG1 if mpeg1 else BITRATES_MPEG2)[indice_bitrate]
+        taxa = TAXAS[versao][indice_taxa]
+        padding = (b2 >> 1) & 1
+        canais = 1 if (b3 >> 6) == 3 else 2
+
+        if mpeg1:
+            return 144000 * bitrate // taxa + padding, taxa, canais, 1152, bitrate, (b1 & 1) == 0
+        return 72000 * bitrate // taxa + padding, taxa, canais, 576, bitrate, (b1 & 1) == 0
+
+    @staticmethod
+    def tamanho_side_info(cabecalho):
+        _, _, canais, amostras_por_frame, _, _ = cabecalho
+        if amostras_por_frame == 1152:
+            return 17 if canais == 1 else 32
+        return 9 if canais == 1 else 17
+
+    @staticmethod
+    def inicio_payload(pos, cabecalho):
+        """Offset onde começa a área de main data do frame (após cabeçalho, CRC e side info)"""
+        crc = cabecalho[5]
+        return pos + 4 + (2 if crc else 0) + Mp3FrameService.tamanho_side_info(cabecalho)
+
+    @staticmethod
+    def ler_main_data_begin(dados, pos, cabecalho):
+        """Quantos bytes do main data deste frame estão nos frames anteriores (bit reservoir)"""
+        si = pos + 4 + (2 if cabecalho[5] else 0)
+        if cabecalho[3] == 1152:
+            return (dados[si] << 1) | (dados[si + 1] >> 7)
+        return dados[si]
+
+    @staticmethod
+    def tamanho_main_data(dados, pos, cabecalho):
+        """Tamanho em bytes do main data do frame, somando o part2_3_length de cada grânulo/canal"""
+        _, _, canais, amostras_por_frame, _, crc = cabecalho
+        si = pos + 4 + (2 if crc else 0)
+        tamanho_si = Mp3FrameService.tamanho_side_info(cabecalho)
+        bits = int.from_bytes(bytes(dados[si:si + tamanho_si]), "big")
+        total_bits = tamanho_si * 8
+
+        def campo(inicio, largura):
+            return (bits >> (total_bits - inicio - largura)) & ((1 << largura) - 1)
+
+        soma = 0
+        if amostras_por_frame == 1152:
+            p = 9 + (5 if canais == 1 else 3) + 4 * canais
+            for _ in range(2 * canais):
+                soma += campo(p, 12)
+                p += 59
+        else:
+            p = 8 + (1 if canais == 1 else 2)
+            for _ in range(canais):
+                soma += campo(p, 12)
+                p += 63
+
+        return (soma + 7) // 8
+
+    @staticmethod
+    def _pular_id3v2(dados):
+        if dados[0:3] != b"ID3" or len(dados) < 10:
+            return 0
+        tamanho = 0
+        for b in dados[6:10]:
+            tamanho = (tamanho << 7) | (b & 0x7F)
+        rodape = 10 if dados[5] & 0x10 else 0
+        return 10 + tamanho + rodape
+
+    @staticmethod
+    def _sincronizar(dados, pos):
+        """Procura o próximo frame válido, exigindo que o frame seguinte também seja válido"""
+        while True:
+            pos = dados.find(b"\xff", pos)
+            if pos < 0:
+                return None
+            cabecalho = Mp3FrameService.ler_cabecalho(dados, pos)
+            if cabecalho is not None:
+                seguinte = pos + cabecalho[0]
+                if seguinte >= len(dados) or Mp3FrameService.ler_cabecalho(dados, seguinte) is not None:
+                    return pos
+            pos += 1
+
+    @staticmethod
+    def _ler_tag_xing(dados, pos, cabecalho):
+        """Se o frame em `pos` for uma tag Xing/Info, retorna (atraso, preenchimento) do LAME"""
+        inicio = pos + 4 + (2 if cabecalho[5] else 0) + Mp3FrameService.tamanho_side_info(cabecalho)
+        if dados[inicio:inicio + 4] not in (b"Xing", b"Info"):
+            return None
+
+        flags = int.from_bytes(bytes(dados[inicio + 4:inicio + 8]), "big")
+        p = inicio + 8
+        p += 4 if flags & 1 else 0  # Número de frames
+        p += 4 if flags & 2 else 0  # Número de bytes
+        p += 100 if flags & 4 else 0  # TOC
+        p += 4 if flags & 8 else 0  # Qualidade
+
+        # Extensão LAME (também escrita pelo FFmpeg como "Lavf"/"Lavc")
+        if p + 24 > pos + cabecalho[0] or not bytes(dados[p:p + 4]).isalpha():
+            return 0, 0
+        b = dados[p + 21:p + 24]
+        atraso = (b[0] << 4) | (b[1] >> 4)
+        preenchimento = ((b[1] & 0x0F) << 8) | b[2]
+        return atraso + ATRASO_DECODIFICADOR, preenchimento
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import time
+
+import ffmpeg
+import numpy as np
+
+from services.ffmpeg_service import FFMPEG_TIMEOUT, FfmpegService
+
+CACHE_DIR = os.path.join("cache", "pcm")
+PCM_CACHE_MAX_BYTES = int(os.environ.get("PCM_CACHE_MAX_BYTES", 2 * 1024 ** 3))  # 2 GB por padrão
+PCM_TAXA = 44100
+PCM_CANAIS = 2
+PCM_DTYPE = np.int16
+BLOCO_LEITURA = 1024 * 1024
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+class PcmCacheService:
+    """
+    Cache persistente de áudio decodificado (PCM s16le) em disco.
+
+    Cada entrada é um arquivo .pcm bruto acompanhado de um .json com os metadados,
+    identificado pelo id em audio_files e pelo hash do conteúdo do arquivo de origem.
+    As entradas são abertas com np.memmap, então recortes e concatenações leem apenas
+    as amostras necessárias. O espaço total é limitado por PCM_CACHE_MAX_BYTES e as
+    entradas menos usadas recentemente são removidas primeiro.
+    """
+
+    _hashes = {}  # (caminho, tamanho, mtime) -> hash do conteúdo
+
+    @staticmethod
+    def calcular_hash(file_path):
+        """Calcula o SHA-256 do arquivo, reaproveitando o resultado enquanto o arquivo não mudar"""
+        stat = os.stat(file_path)
+        chave = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if chave in PcmCacheService._hashes:
+            return PcmCacheService._hashes[chave]
+
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for bloco in iter(lambda: f.read(BLOCO_LEITURA), b""):
+                sha.update(bloco)
+
+        PcmCacheService._hashes[chave] = sha.hexdigest()
+        return PcmCacheService._hashes[chave]
+
+    @staticmethod
+    def registrar_hash(file_path, hash_conteudo):
+        """Guarda o hash já calculado de um arquivo (no upload, enquanto ele era gravado)"""
+        stat = os.stat(file_path)
+        PcmCacheService._hashes[(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)] = hash_conteudo
+
+    @staticmethod
+    def obter_pcm(audio_id, file_path, fonte=None):
+        """
+        Retorna (amostras, taxa) com as amostras mapeadas em memória no formato (n, canais).
+        Decodifica e grava no cache na primeira vez. Retorna None se o áudio decodificado
+        não couber no orçamento do cache ou se a decodificação falhar. `fonte` é o arquivo a
+        decodificar quando não for o próprio original (o intermediário); a entrada continua
+        identificada pelo original.
+        """
+        content_hash = PcmCacheService.calcular_hash(file_path)
+        base = os.path.join(CACHE_DIR, f"{audio_id}_{content_hash[:32]}")
+        pcm_path = base + ".pcm"
+        meta_path = base + ".json"
+
+        if not (os.path.exists(pcm_path) and os.path.exists(meta_path)):
+            PcmCacheService._remover_versoes_antigas(audio_id, base)
+            if not PcmCacheService._decodificar(fonte or file_path, pcm_path, meta_path):
+                return None
+            PcmCacheService._despejar(manter=pcm_path)
+        else:
+            os.utime(pcm_path)  # Marca como usado recentemente (LRU)
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if meta["amostras"] == 0:
+            return np.zeros((0, meta["canais"]), dtype=PCM_DTYPE), meta["taxa"]
+
+        amostras = np.memmap(pcm_path, dtype=meta["dtype"], mode="r").reshape(-1, meta["canais"])
+        return amostras, meta["taxa"]
+
+    @staticmethod
+    def invalidar(audio_id):
+        """Remove todas as entradas do cache associadas a um áudio"""
+        PcmCacheService._remover_versoes_antigas(audio_id, None)
+
+    @staticmethod
+    def _decodificar(file_path, pcm_path, meta_path):
+        """Decodifica o arquivo para PCM, abortando se ultrapassar o orçamento do cache"""
+        tmp_path = f"{pcm_path}.{os.getpid()}.tmp"
+        stream = (
+            ffmpeg
+            .input(file_path)
+            .output("pipe:", format="s16le", acodec="pcm_s16le", ac=PCM_CANAIS, ar=PCM_TAXA)
+            .global_args("-loglevel", "error")
+        )
+
+        escrito = 0
+        excedeu = False
+        with FfmpegService.processo(stream, pipe_stdout=True) as processo, open(tmp_path, "wb") as f:
+            for bloco in iter(lambda: processo.stdout.read(BLOCO_LEITURA), b""):
+                escrito += len(bloco)
+                if escrito > PCM_CACHE_MAX_BYTES:
+                    excedeu = True
+                    processo.kill()
+                    break
+                f.write(bloco)
+            processo.stdout.close()
+
+        if excedeu or processo.returncode != 0:
+            os.remove(tmp_path)
+            if excedeu:
+                print(f"Áudio {file_path} excede o orçamento do cache PCM, usando o FFmpeg diretamente.")
+            return False
+
+        tamanho_amostra = np.dtype(PCM_DTYPE).itemsize * PCM_CANAIS
+        meta = {
+            "taxa": PCM_TAXA,
+            "canais": PCM_CANAIS,
+            "dtype": np.dtype(PCM_DTYPE).name,
+            "amostras": escrito // tamanho_amostra,
+        }
+
+        os.replace(tmp_path, pcm_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return True
+
+    @staticmethod
+    def _remover_versoes_antigas(audio_id, base_atual):
+        """
+        Apaga entradas de um áudio cujo conteúdo mudou (hash diferente). Os .tmp de uma
+        decodificação em andamento (em outro processo) ficam; só são apagados os abandonados,
+        sem escrita há mais de FFMPEG_TIMEOUT.
+        """
+        prefixo = f"{audio_id}_"
+        limite = time.time() - FFMPEG_TIMEOUT
+        for nome in os.listdir(CACHE_DIR):
+            caminho = os.path.join(CACHE_DIR, nome)
+            if not nome.startswith(prefixo) or os.path.splitext(caminho)[0] == base_atual:
+                continue
+            try:
+                if nome.endswith(".tmp") and os.path.getmtime(caminho) >= limite:
+                    continue
+                os.remove(caminho)
+            except OSError:
+                pass  # Outro processo pode ter removido ou ainda estar usando o arquivo
+
+    @staticmethod
+    def _despejar(manter=None):
+        """Remove as entradas menos usadas recentemente até o cache caber no orçamento"""
+        entradas = []
+        total = 0
+        for nome in os.listdir(CACHE_DIR):
+            if not nome.endswith(".pcm"):
+                continue
+            caminho = os.path.join(CACHE_DIR, nome)
+            stat = os.stat(caminho)
+            total += stat.st_size
+            entradas.append((stat.st_mtime, stat.st_size, caminho))
+
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= PCM_CACHE_MAX_BYTES:
+                break
+            if caminho == manter:
+                continue
+            try:
+                os.remove(caminho)
+                os.remove(os.path.splitext(caminho)[0] + ".json")
+            except OSError:
+                pass
+            total -= tamanho
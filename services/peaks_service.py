@@ -0,0 +1,171 @@
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+from database import conectar
+from services.edl_service import EdlService
+from services.ffmpeg_service import RETRY_AFTER
+from services.job_service import JobService
+from services.render_cache_service import RenderCacheService
+
+UPLOAD_DIR = "uploads"
+CACHE_DIR = os.path.join("cache", "peaks")
+AMOSTRAS_POR_PICO = 256  # Resolução do nível 0; cada nível seguinte tem a metade dos picos
+MAX_PICOS_RESPOSTA = 65536
+BLOCO_PICOS = 4096  # Picos calculados por leitura do PCM
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+class PeaksService:
+    """
+    Pirâmide de picos (mínimo/máximo por bloco) para desenhar a forma de onda.
+
+    O nível 0 tem um par (mín, máx) a cada AMOSTRAS_POR_PICO amostras e cada nível acima
+    junta dois picos do nível anterior. Todos os níveis ficam num único arquivo binário
+    int16 em cache/peaks, aberto com np.memmap: uma requisição lê só o trecho do nível pedido.
+    A pirâmide é calculada uma vez por versão do áudio (chave = original + lista de edições),
+    a partir do PCM da versão, por um job: a requisição nunca decodifica o áudio.
+    """
+
+    @staticmethod
+    def obter_picos_audio(audio_id, user_id, zoom=0, inicio=None, fim=None):
+        """
+        Picos da versão atual (com as edições) de um áudio que pertence ao usuário. Se a
+        pirâmide dessa versão ainda não existe, envia o job que a calcula e retorna
+        status "pendente" com o `job_url`.
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT af.file_path, af.file_name, paf.project_id FROM audio_files af
+            JOIN projectos_audio_files paf ON af.id = paf.audio_id
+            JOIN projectos p ON paf.project_id = p.id
+            WHERE af.id = %s AND p.user_id = %s
+        """, (audio_id, user_id))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if not result:
+            return {"status": "erro", "message": "Áudio não encontrado"}
+
+        file_path = re.sub(r'^https?://localhost:\d+/', '', result[0])
+        if not file_path.startswith(UPLOAD_DIR):
+            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+        if not os.path.exists(file_path):
+            return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
+
+        base = PeaksService.base(audio_id, file_path)
+        if not PeaksService.existe(base):
+            job = JobService.submeter_unico(user_id, result[2], "analisar",
+                                            {"project_id": result[2], "file_name": result[1], "user_id": user_id})
+            if job["status"] != "pendente":
+                return job
+            return {"status": "pendente", "message": "Forma de onda em cálculo, tente novamente em instantes",
+                    "job_url": job["job_url"], "retry_after": RETRY_AFTER}
+
+        try:
+            picos = PeaksService.obter_picos(base, zoom, inicio, fim)
+        except ValueError as e:
+            return {"status": "erro", "message": str(e)}
+
+        return {"status": "sucesso", **picos}
+
+    @staticmethod
+    def base(audio_id, file_path, edicoes=None):
+        """Caminho (sem extensão) da pirâmide da versão com as `edicoes` (as atuais, por padrão)"""
+        if edicoes is None:
+            edicoes = EdlService.listar(audio_id)
+        chave = RenderCacheService.chave(
+            [file_path], "picos",
+            {"edicoes": [[e["edit_type"], e["start_time"], e["end_time"], e["parametros"]] for e in edicoes],
+             "amostras_por_pico": AMOSTRAS_POR_PICO})
+        return os.path.join(CACHE_DIR, chave[:32])
+
+    @staticmethod
+    def existe(base):
+        return os.path.exists(base + ".bin") and os.path.exists(base + ".json")
+
+    @staticmethod
+    def obter_picos(base, zoom=0, inicio=None, fim=None):
+        """
+        Retorna os picos do nível `zoom` entre `inicio` e `fim` (em segundos) da pirâmide em
+        `base`. Cada pico é [mín, máx] em int16 e cobre `amostras_por_pico` amostras a partir
+        de `inicio`.
+        """
+        meta, picos = PeaksService._carregar(base)
+        if not 0 <= zoom < len(meta["niveis"]):
+            raise ValueError(f"zoom deve estar entre 0 e {len(meta['niveis']) - 1}")
+
+        nivel = meta["niveis"][zoom]
+        por_pico = AMOSTRAS_POR_PICO << zoom
+        a = 0 if inicio is None else max(int(inicio * meta["taxa"]) // por_pico, 0)
+        b = nivel["tamanho"] if fim is None else math.ceil(fim * meta["taxa"] / por_pico)
+        b = min(b, nivel["tamanho"])
+        if b - a > MAX_PICOS_RESPOSTA:
+            raise ValueError("Intervalo grande demais para este zoom; use um zoom maior ou um trecho menor")
+
+        fatia = picos[nivel["offset"] + a:nivel["offset"] + max(a, b)]
+        return {
+            "zoom": zoom,
+            "niveis": len(meta["niveis"]),
+            "taxa": meta["taxa"],
+            "amostras_por_pico": por_pico,
+            "inicio": a * por_pico / meta["taxa"],
+            "duracao": meta["amostras"] / meta["taxa"],
+            "picos": fatia.tolist(),
+        }
+
+    @staticmethod
+    def _carregar(base):
+        """Abre a pirâmide já calculada"""
+        with open(base + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["total"] == 0:
+            return meta, np.zeros((0, 2), dtype=np.int16)
+        return meta, np.memmap(base + ".bin", dtype=np.int16, mode="r").reshape(-1, 2)
+
+    @staticmethod
+    def calcular(amostras, taxa, base):
+        """Monta todos os níveis da pirâmide a partir das amostras (PCM int16, uma linha por amostra)"""
+        # Cada linha de (AMOSTRAS_POR_PICO * canais) valores é um pico, com o mínimo e o
+        # máximo tomados entre todos os canais
+        largura = AMOSTRAS_POR_PICO * amostras.shape[1]
+        passo = AMOSTRAS_POR_PICO * BLOCO_PICOS
+        partes = []
+        for pos in range(0, len(amostras), passo):
+            valores = np.asarray(amostras[pos:pos + passo]).reshape(-1)
+            completos = len(valores) - len(valores) % largura
+            if completos:
+                linhas = valores[:completos].reshape(-1, largura)
+                partes.append(np.stack([linhas.min(axis=1), linhas.max(axis=1)], axis=1))
+            if completos < len(valores):  # Último bloco parcial (só no fim do áudio)
+                resto = valores[completos:]
+                partes.append(np.array([[resto.min(), resto.max()]], dtype=np.int16))
+
+        nivel = np.concatenate(partes) if partes else np.zeros((0, 2), dtype=np.int16)
+        niveis = [nivel]
+        while len(nivel) > 1:
+            if len(nivel) % 2:
+                nivel = np.concatenate([nivel, nivel[-1:]])
+            pares = nivel.reshape(-1, 2, 2)
+            nivel = np.stack([pares[:, :, 0].min(axis=1), pares[:, :, 1].max(axis=1)], axis=1)
+            niveis.append(nivel)
+
+        meta = {"taxa": taxa, "amostras": len(amostras), "amostras_por_pico": AMOSTRAS_POR_PICO, "niveis": []}
+        offset = 0
+        for nivel in niveis:
+            meta["niveis"].append({"offset": offset, "tamanho": len(nivel)})
+            offset += len(nivel)
+        meta["total"] = offset
+
+        tmp_path = f"{base}.{os.getpid()}.tmp"
+        np.concatenate(niveis).astype(np.int16).tofile(tmp_path)
+        os.replace(tmp_path, base + ".bin")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, base + ".json")
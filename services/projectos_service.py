@@ -1,12 +1,23 @@
 import os, re
 
+import threading
+import time
 import unicodedata
+import uuid
 
 import database
 from database import conectar
 from services.auth_service import AuthService
+from services.blob_store_service import BlobStoreService
 from datetime import datetime
+from services.duracao_service import DuracaoService
+from services.edl_service import CODECS_SAIDA, EdlService
 from services.historico_service import HistoricoService
+from services.intermediario_service import IntermediarioService
+from services.ffmpeg_service import RETRY_AFTER
+from services.job_service import JobService
+from services.mp3_frame_service import Mp3FrameService
+from services.pcm_cache_service import PcmCacheService
 import zipfile
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -26,10 +37,13 @@ class ProjectosService:
 
             # Buscar todos os projetos do usuário e seus arquivos de áudio
             cursor.execute("""
-                SELECT p.id, p.project_name, p.created_at, af.file_name, af.file_path
+                SELECT p.id, p.project_name, p.created_at, p.codec_saida, af.file_name, af.file_path, af.duration,
+                    af.head_edit_id AS versao,
+                    al.integrado_lufs, al.true_peak_dbtp, al.lra
                 FROM projectos p
                 LEFT JOIN projectos_audio_files paf ON p.id = paf.project_id
                 LEFT JOIN audio_files af ON paf.audio_id = af.id
+                LEFT JOIN audio_loudness al ON al.audio_id = af.id
                 WHERE p.user_id = %s
             """, (user_id,))
 
@@ -46,6 +60,7 @@ class ProjectosService:
                         "project_name": projeto["project_name"].strip(),
                         "created_at": projeto["created_at"].strftime("%Y-%m-%d %H:%M:%S") if isinstance(
                             projeto["created_at"], datetime) else projeto["created_at"],
+                        "codec_saida": projeto["codec_saida"],
                         "arquivos": []  # Lista para armazenar os arquivos do projeto
                     }
 
@@ -53,7 +68,9 @@ class ProjectosService:
                     projectos_dict[project_id]["arquivos"].append({
                         "file_name": projeto["file_name"],
                         "file_path": projeto["file_path"],
-                        "audio_url": f"http://localhost:8000/uploads/{os.path.basename(projeto['file_path'])}"
+                        "duration": float(projeto["duration"]),
+                        "audio_url": ProjectosService._audio_url(projeto["file_path"], projeto["versao"]),
+                        "loudness": ProjectosService._loudness(projeto)
                     })
 
             # Converter dicionário para lista
@@ -78,14 +95,17 @@ class ProjectosService:
 
         user_id = auth_response["user_id"]
         #print(audio_file)
-        file_name = audio_file.get("filename", "audio_default.mp3")
+        file_name = audio_file.filename or "audio_default.mp3"
         normalized_filename = ProjectosService.normalizar_nome(file_name)
         file_path = os.path.join(UPLOAD_DIR, normalized_filename)
         print(normalized_filename)
         try:
-            # Salvar o arquivo no servidor
-            with open(file_path, "wb") as f:
-                f.write(audio_file["file"])
+            # Mover o arquivo recebido (multipart.ArquivoEnviado) para a pasta de uploads
+            ProjectosService._salvar_upload(audio_file, file_path)
+
+            # Indexar os frames uma única vez: dá a duração exata sem ffprobe
+            indice = ProjectosService._indexar_upload(file_path)
+            duracao = ProjectosService._duracao_upload(file_path, indice)
 
             conn = conectar()
             cursor = conn.cursor()
@@ -93,7 +113,7 @@ class ProjectosService:
             # 1️⃣ Inserir o arquivo de áudio na tabela audio_files
             cursor.execute(
                 "INSERT INTO audio_files (file_name, file_path, duration) VALUES (%s, %s, %s)",
-                (normalized_filename, file_path, 0)  # ⚠ Defina a duração real depois
+                (normalized_filename, file_path, duracao)
             )
             audio_id = cursor.lastrowid  # Obtém o ID do áudio inserido
 
@@ -114,6 +134,10 @@ class ProjectosService:
             cursor.close()
             conn.close()
 
+            if indice:
+                Mp3FrameService.salvar_indice(audio_id, file_path, indice)
+            ProjectosService._agendar_intermediario(user_id, project_id, normalized_filename)
+
             # Registrar atividade no histórico
             HistoricoService.registrar_atividade(user_id, project_id, "criação", "Criou projeto")
             return {"status": "sucesso", "message": "Projeto criado com sucesso"}
@@ -139,13 +163,20 @@ class ProjectosService:
                     p.id AS project_id, 
                     p.project_name, 
                     p.created_at, 
+                    p.codec_saida,
                     af.id AS audio_id,
                     af.file_name, 
                     af.file_path,
-                    af.created_at
+                    af.duration,
+                    af.created_at,
+                    af.head_edit_id AS versao,
+                    al.integrado_lufs,
+                    al.true_peak_dbtp,
+                    al.lra
                 FROM projectos p
                 LEFT JOIN projectos_audio_files paf ON p.id = paf.project_id
                 LEFT JOIN audio_files af ON paf.audio_id = af.id
+                LEFT JOIN audio_loudness al ON al.audio_id = af.id
                 WHERE p.id = %s AND p.user_id = %s
             """, (project_id, user_id))
 
@@ -172,7 +203,11 @@ class ProjectosService:
                 # 🔹 Verificar se já temos uma versão desse arquivo e comparar timestamps
                 if nome_base not in arquivos_filtrados or arquivos_filtrados[nome_base]["created_at"] < arquivo[
                     "created_at"]:
-                    arquivo["audio_url"] = f"http://localhost:8000/uploads/{os.path.basename(arquivo['file_path'])}"
+                    arquivo["audio_url"] = ProjectosService._audio_url(arquivo["file_path"], arquivo["versao"])
+                    arquivo["duration"] = float(arquivo["duration"])  # DECIMAL não é serializável em JSON
+                    arquivo["loudness"] = ProjectosService._loudness(arquivo)
+                    for campo in ("integrado_lufs", "true_peak_dbtp", "lra"):
+                        del arquivo[campo]
                     arquivos_filtrados[nome_base] = arquivo
 
             cursor.close()
@@ -182,6 +217,7 @@ class ProjectosService:
                 "id": arquivos[0]["project_id"],
                 "project_name": arquivos[0]["project_name"].strip(),
                 "created_at": arquivos[0]["created_at"],
+                "codec_saida": arquivos[0]["codec_saida"],
                 "arquivos": list(arquivos_filtrados.values())  # 🔥 Apenas os mais recentes!
             }
 
@@ -225,7 +261,10 @@ class ProjectosService:
             for arquivo in arquivos:
                 file_path = arquivo["file_path"]
                 if os.path.exists(file_path):
+                    IntermediarioService.remover(file_path)
                     os.remove(file_path)
+                Mp3FrameService.remover_indice(arquivo["id"])
+                BlobStoreService.remover_audio(arquivo["id"])
 
             # 🔥 Obter IDs dos arquivos de áudio para exclusão
             audio_ids = [arquivo["id"] for arquivo in arquivos]
@@ -267,7 +306,7 @@ class ProjectosService:
         user_id = auth_response["user_id"]
 
         # 🔹 Normalizar o nome do arquivo antes de salvar
-        normalized_filename = ProjectosService.normalizar_nome(audio_file['filename'])
+        normalized_filename = ProjectosService.normalizar_nome(audio_file.filename)
         file_path = os.path.join(UPLOAD_DIR, normalized_filename)
 
         try:
@@ -286,13 +325,16 @@ class ProjectosService:
                 return {"status": "insucesso", "message": "Áudio já existe, tente com outro nome"}
 
             # 🔹 Salvar o arquivo no servidor com o nome normalizado
-            with open(file_path, "wb") as f:
-                f.write(audio_file['file'])
+            ProjectosService._salvar_upload(audio_file, file_path)
+
+            # Indexar os frames uma única vez: dá a duração exata sem ffprobe
+            indice = ProjectosService._indexar_upload(file_path)
+            duracao = ProjectosService._duracao_upload(file_path, indice)
 
             # Inserir o áudio na tabela
             cursor.execute(
                 "INSERT INTO audio_files (file_name, file_path, duration) VALUES (%s, %s, %s)",
-                (normalized_filename, file_path, 0)
+                (normalized_filename, file_path, duracao)
             )
             audio_id = cursor.lastrowid
 
@@ -306,6 +348,10 @@ class ProjectosService:
             cursor.close()
             conn.close()
 
+            if indice:
+                Mp3FrameService.salvar_indice(audio_id, file_path, indice)
+            ProjectosService._agendar_intermediario(user_id, project_id, normalized_filename)
+
             # Registrar atividade no histórico
             HistoricoService.registrar_atividade(user_id, project_id, "carregamento", "Carregou áudio novo")
             return {"status": "sucesso", "message": "Áudio salvo com sucesso", "file_path": file_path}
@@ -314,83 +360,191 @@ class ProjectosService:
             return {"status": "erro", "message": str(e)}
 
     @staticmethod
-    def retroceder_edicao(token, project_id, file_name):
+    def _salvar_upload(audio_file, file_path):
+        """Move o arquivo recebido para `file_path`, reaproveitando o hash calculado no recebimento"""
+        audio_file.salvar(file_path)
+        if audio_file.sha256:
+            PcmCacheService.registrar_hash(file_path, audio_file.sha256)
+
+    @staticmethod
+    def _agendar_intermediario(user_id, project_id, file_name):
+        """
+        Converte o áudio enviado para o intermediário num job em segundo plano. Se a fila
+        estiver cheia, as edições usam o original até o próximo reinício do servidor
+        (agendar_intermediarios_faltantes)
+        """
+        job = JobService.submeter(user_id, project_id, "intermediario",
+                                  {"project_id": project_id, "file_name": file_name, "user_id": user_id})
+        if job["status"] != "pendente":
+            print(f"Intermediário de {file_name} não agendado: {job['message']}")
+
+    @staticmethod
+    def agendar_intermediarios_faltantes():
+        """
+        Chamado na subida do servidor: agenda a conversão dos áudios que nunca tiveram um job
+        de intermediário concluído (fila cheia no upload, job interrompido ou que falhou, áudios
+        de antes do intermediário). Os jobs são enviados numa thread, à medida que a fila tem
+        espaço, para não atrasar a subida.
+        """
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT p.user_id, paf.project_id, af.file_name FROM audio_files af
+            JOIN projectos_audio_files paf ON af.id = paf.audio_id
+            JOIN projectos p ON paf.project_id = p.id
+            WHERE p.user_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM render_jobs rj
+                WHERE rj.operacao = 'intermediario' AND rj.status <> 'falhou' AND rj.projeto_id = paf.project_id
+                  AND JSON_UNQUOTE(JSON_EXTRACT(rj.parametros, '$.file_name')) = af.file_name
+            )
+        """)
+        faltantes = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        if not faltantes:
+            return
+
+        def agendar():
+            for user_id, project_id, file_name in faltantes:
+                parametros = {"project_id": project_id, "file_name": file_name, "user_id": user_id}
+                while JobService.submeter(user_id, project_id, "intermediario", parametros)["status"] == "ocupado":
+                    time.sleep(RETRY_AFTER)
+            print(f"🔹 {len(faltantes)} intermediário(s) faltante(s) agendado(s).")
+
+        threading.Thread(target=agendar, name="intermediarios", daemon=True).start()
+
+    @staticmethod
+    def definir_codec(token, project_id, codec):
+        """Define o codec em que os áudios do projeto são entregues (reprodução e download)"""
         auth_response = AuthService.verificar_token(token)
         if auth_response["status"] == "erro":
             return {"status": "erro", "message": "Acesso negado"}
 
-        user_id = auth_response["user_id"]
+        if codec not in CODECS_SAIDA:
+            return {"status": "erro", "message": f"Codec inválido. Use um de: {', '.join(CODECS_SAIDA)}"}
 
         try:
             conn = conectar()
-            cursor = conn.cursor(dictionary=True, buffered=True)
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM projectos WHERE id = %s AND user_id = %s",
+                           (project_id, auth_response["user_id"]))
+            if not cursor.fetchone():
+                cursor.close()
+                conn.close()
+                return {"status": "erro", "message": "Projeto não encontrado"}
 
-            # 🔹 1️⃣ Buscar o arquivo específico
-            cursor.execute("""
-                SELECT af.id, af.file_name, af.file_path
-                FROM projectos_audio_files paf
-                JOIN audio_files af ON paf.audio_id = af.id
-                WHERE paf.project_id = %s AND af.file_name = %s
-            """, (project_id, file_name))
+            cursor.execute("UPDATE projectos SET codec_saida = %s WHERE id = %s", (codec, project_id))
+            conn.commit()
+            cursor.close()
+            conn.close()
 
-            arquivo = cursor.fetchone()
+            HistoricoService.registrar_atividade(auth_response["user_id"], project_id, "edição",
+                                                 f"Definiu o codec de saída como {codec}")
+            return {"status": "sucesso", "message": "Codec atualizado", "codec_saida": codec}
 
-            if not arquivo:
-                cursor.close()
-                conn.close()
-                return {"status": "erro", "message": "Arquivo não encontrado para este projeto"}
+        except Exception as e:
+            return {"status": "erro", "message": str(e)}
 
-            audio_id = arquivo["id"]
-            caminho_arquivo = arquivo["file_path"]
+    @staticmethod
+    def _indexar_upload(file_path):
+        """Indexa os frames do MP3 enviado; retorna None para outros formatos ou arquivos inválidos"""
+        try:
+            return Mp3FrameService.indexar(file_path)
+        except Exception as e:
+            print(f"Erro ao indexar {file_path}: {e}")
+            return None
 
-            # 🔎 2️⃣ Verificar se o arquivo tem timestamp no início (para evitar deletar o original)
-            if not re.search(r"^\d{14}_", os.path.basename(caminho_arquivo)):
-                cursor.close()
-                conn.close()
-                return {"status": "erro", "message": "Já não pode retroceder."}
+    @staticmethod
+    def _duracao_upload(file_path, indice):
+        """Duração do arquivo enviado: do índice de frames, ou do cabeçalho para outros formatos"""
+        if indice:
+            DuracaoService.registrar(file_path, indice["duracao"])
+            return round(indice["duracao"], 2)
+        try:
+            return round(DuracaoService.obter(file_path), 2)
+        except Exception as e:
+            print(f"Erro ao obter duração de {file_path}: {e}")
+            return 0
 
-            # 🔥 3️⃣ Apagar o arquivo do sistema
-            if os.path.exists(caminho_arquivo):
-                os.remove(caminho_arquivo)
+    @staticmethod
+    def _loudness(linha):
+        """Níveis gravados em audio_loudness (None se o áudio ainda não foi analisado)"""
+        if linha["integrado_lufs"] is None and linha["true_peak_dbtp"] is None:
+            return None
+        return {campo: float(linha[campo]) if linha[campo] is not None else None
+                for campo in ("integrado_lufs", "true_peak_dbtp", "lra")}
 
-            # 🔥 4️⃣ Remover o registro do áudio do banco de dados
-            cursor.execute("DELETE FROM projectos_audio_files WHERE audio_id = %s", (audio_id,))
-            conn.commit()
+    @staticmethod
+    def _audio_url(file_path, versao=None):
+        """URL de reprodução; `versao` (id da edição na cabeça) evita que o navegador use uma versão antiga"""
+        url = f"http://localhost:8000/uploads/{os.path.basename(file_path)}"
+        return f"{url}?v={versao}" if versao else url
 
-            cursor.execute("DELETE FROM audio_files WHERE id = %s", (audio_id,))
-            conn.commit()
+    @staticmethod
+    def retroceder_edicao(token, project_id, file_name):
+        """Desfaz a última edição: a cabeça do áudio volta para a versão anterior"""
+        return ProjectosService._mover_cabeca(token, project_id, file_name, EdlService.desfazer, "retroceder",
+                                              "Retrocedeu edição", "Retrocedido com sucesso", "Já não pode retroceder.")
 
-            # 🔹 5️⃣ Fechar e reabrir cursor antes da nova consulta
-            cursor.close()
-            cursor = conn.cursor(dictionary=True, buffered=True)
+    @staticmethod
+    def avancar_edicao(token, project_id, file_name):
+        """Refaz uma edição desfeita: a cabeça do áudio avança para a versão seguinte"""
+        return ProjectosService._mover_cabeca(token, project_id, file_name, EdlService.refazer, "avançar",
+                                              "Refez edição", "Avançado com sucesso", "Não há edição para refazer.")
 
+    @staticmethod
+    def _mover_cabeca(token, project_id, file_name, mover, acao, descricao, mensagem, mensagem_limite):
+        """
+        Move o ponteiro da versão atual no grafo de versões. Nenhum arquivo é apagado nem
+        renderizado aqui: se a versão de destino já não estiver em cache, é renderizada por
+        um job (`job_url`), como depois de uma edição.
+        """
+        auth_response = AuthService.verificar_token(token)
+        if auth_response["status"] == "erro":
+            return {"status": "erro", "message": "Acesso negado"}
+
+        user_id = auth_response["user_id"]
+
+        try:
+            conn = conectar()
+            cursor = conn.cursor(dictionary=True, buffered=True)
             cursor.execute("""
-                SELECT af.file_name, af.file_path
+                SELECT af.id, af.file_path
                 FROM projectos_audio_files paf
                 JOIN audio_files af ON paf.audio_id = af.id
-                WHERE paf.project_id = %s
-                ORDER BY af.created_at DESC
-            """, (project_id,))
-
-            novo_arquivo = cursor.fetchone()
-
+                JOIN projectos p ON paf.project_id = p.id
+                WHERE paf.project_id = %s AND af.file_name = %s AND p.user_id = %s
+            """, (project_id, file_name, user_id))
+            arquivo = cursor.fetchone()
             cursor.close()
             conn.close()
 
-            # Registrar atividade no histórico
-            HistoricoService.registrar_atividade(user_id, project_id, "retroceder", "Retrocedeu edição")
-
-            if novo_arquivo:
-                return {
-                    "status": "sucesso",
-                    "message": "Retrocedido com sucesso",
-                    "novo_audio_url": f"http://localhost:8000/uploads/{os.path.basename(novo_arquivo['file_path'])}"
-                }
-            else:
-                return {
-                    "status": "sucesso",
-                    "message": "Retrocedido, mas não há mais áudios para este projeto"
-                }
+            if not arquivo:
+                return {"status": "erro", "message": "Arquivo não encontrado para este projeto"}
+
+            audio_id = arquivo["id"]
+            caminho_arquivo = arquivo["file_path"]
+
+            if not mover(audio_id):
+                return {"status": "erro", "message": mensagem_limite}
+
+            HistoricoService.registrar_atividade(user_id, project_id, acao, descricao)
+            edicoes = EdlService.listar(audio_id)
+            EdlService.atualizar_duracao(audio_id, caminho_arquivo, edicoes)
+            resultado = {
+                "status": "sucesso",
+                "message": mensagem,
+                "novo_audio_url": ProjectosService._audio_url(
+                    caminho_arquivo, edicoes[-1]["id"] if edicoes else None)
+            }
+
+            codec = EdlService.codec_saida(audio_id)
+            if not EdlService.renderizar(audio_id, caminho_arquivo, edicoes, codec, somente_cache=True):
+                job = JobService.submeter_unico(user_id, project_id, "renderizar",
+                                                {"project_id": project_id, "file_name": file_name, "user_id": user_id})
+                if job["status"] == "pendente":
+                    resultado["job_url"] = job["job_url"]
+            return resultado
 
         except Exception as e:
             return {"status": "erro", "message": str(e)}
@@ -408,18 +562,41 @@ class ProjectosService:
             cursor = conn.cursor(dictionary=True)
 
             cursor.execute("""
-                SELECT af.file_name, af.file_path
+                SELECT af.id, af.file_name, af.file_path, p.codec_saida
                 FROM projectos p
                 LEFT JOIN projectos_audio_files paf ON p.id = paf.project_id
                 LEFT JOIN audio_files af ON paf.audio_id = af.id
                 WHERE p.id = %s AND p.user_id = %s
             """, (project_id, user_id))
 
-            arquivos = cursor.fetchall()
+            arquivos = [arquivo for arquivo in cursor.fetchall() if arquivo["id"] is not None]
+            cursor.close()
+            conn.close()
 
             if not arquivos:
                 return {"status": "erro", "message": "Projeto não encontrado ou sem arquivos"}
 
+            # As versões editadas que ainda não estão em cache são renderizadas por jobs, não
+            # aqui: o ZIP só é montado quando todas estiverem prontas
+            editados = {}
+            jobs = []
+            for arquivo in arquivos:
+                editado = EdlService.renderizar(arquivo["id"], arquivo["file_path"],
+                                                codec=arquivo["codec_saida"], somente_cache=True)
+                if editado:
+                    editados[arquivo["id"]] = editado
+                    continue
+                job = JobService.submeter_unico(user_id, project_id, "renderizar",
+                                                {"project_id": project_id, "file_name": arquivo["file_name"],
+                                                 "user_id": user_id})
+                if job["status"] != "pendente":
+                    return job
+                jobs.append(job["job_url"])
+
+            if jobs:
+                return {"status": "pendente", "message": "Versões editadas em renderização, tente novamente em instantes",
+                        "jobs": jobs, "retry_after": RETRY_AFTER}
+
             # Criar diretório para ZIPs (se não existir)
             zip_dir = "zips"
             os.makedirs(zip_dir, exist_ok=True)
@@ -427,15 +604,28 @@ class ProjectosService:
             # Caminho do ZIP
             zip_file_path = os.path.join(zip_dir, f"projeto_{project_id}.zip")
 
-            # Criar o ZIP
-            with zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                for arquivo in arquivos:
-                    file_name = os.path.basename(arquivo["file_path"])
-                    zip_subdir = "audios_originais/" if not re.match(r"^\d{14}_", file_name) else ""
-                    zipf.write(arquivo["file_path"], os.path.join(zip_subdir, file_name))
-
-            cursor.close()
-            conn.close()
+            # Criar o ZIP num arquivo temporário e só então substituir o anterior: um download
+            # em andamento continua lendo o ZIP antigo, que é enviado em streaming
+            tmp_path = f"{zip_file_path}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+                    for arquivo in arquivos:
+                        file_name = os.path.basename(arquivo["file_path"])
+
+                        # Áudios com edições (ou num codec diferente do original): a versão editada vai
+                        # na raiz e o original em audios_originais/
+                        editado = editados[arquivo["id"]]
+                        if editado != arquivo["file_path"]:
+                            zipf.write(editado, os.path.splitext(file_name)[0] + os.path.splitext(editado)[1])
+                            zipf.write(arquivo["file_path"], os.path.join("audios_originais/", file_name))
+                            continue
+
+                        zip_subdir = "audios_originais/" if not re.match(r"^\d{14}_", file_name) else ""
+                        zipf.write(arquivo["file_path"], os.path.join(zip_subdir, file_name))
+                os.replace(tmp_path, zip_file_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
 
             return {"status": "sucesso", "message": "Download pronto", "zip_file_path": zip_file_path}
 
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from services.blob_store_service import BlobStoreService
+from services.pcm_cache_service import PcmCacheService
+
+CACHE_DIR = os.path.join("cache", "render")
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 5 * 1024 ** 3))  # 5 GB por padrão
+ENCODER_PADRAO = {"format": "mp3"}  # Configuração de saída usada pelas renderizações
+VERSAO = 3  # Incrementar quando a forma de renderizar mudar, para não servir resultados antigos
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+class RenderCacheService:
+    """
+    Cache de renderizações endereçado por conteúdo.
+
+    A chave de cada resultado é o hash do conteúdo dos arquivos de origem, da operação, dos
+    parâmetros e da configuração do encoder: a mesma edição sobre o mesmo áudio, refeita ou
+    desfeita e refeita, é servida do cache sem executar o FFmpeg, não importa o nome do
+    arquivo ou o projeto. O espaço total é limitado por RENDER_CACHE_MAX_BYTES e as entradas
+    menos usadas recentemente são removidas primeiro.
+
+    As versões editadas de um áudio também são guardadas, deduplicadas, no BlobStoreService:
+    uma versão removida daqui por falta de espaço é remontada de lá em vez de renderizada.
+    """
+
+    @staticmethod
+    def chave(fontes, operacao, parametros, encoder=None):
+        """Calcula a chave de uma renderização a partir dos caminhos dos arquivos de origem"""
+        descricao = json.dumps({
+            "versao": VERSAO,
+            "fontes": [PcmCacheService.calcular_hash(fonte) for fonte in fontes],
+            "operacao": operacao,
+            "parametros": parametros,
+            "encoder": encoder or ENCODER_PADRAO,
+        }, sort_keys=True)
+        return hashlib.sha256(descricao.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def obter(chave, extensao="mp3"):
+        """Retorna o caminho do resultado em cache, ou None se ainda não foi renderizado"""
+        caminho = RenderCacheService._caminho(chave, extensao)
+        try:
+            # Marca como usado recentemente (LRU) pelo atime: o mtime fica com a data da
+            # renderização, de onde vêm o ETag e o Last-Modified da resposta (estaticos.py)
+            os.utime(caminho, ns=(time.time_ns(), os.stat(caminho).st_mtime_ns))
+        except FileNotFoundError:
+            return None
+        return caminho
+
+    @staticmethod
+    def obter_ou_restaurar(chave, extensao="mp3"):
+        """
+        Como obter, para versões de áudios: uma versão que saiu do cache por falta de espaço é
+        remontada do BlobStoreService. None se ela nunca foi renderizada.
+        """
+        caminho = RenderCacheService.obter(chave, extensao)
+        if caminho:
+            return caminho
+
+        caminho = RenderCacheService._caminho(chave, extensao)
+        tmp_path = f"{caminho}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            if not BlobStoreService.restaurar(chave, tmp_path):
+                return None
+            os.replace(tmp_path, caminho)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        RenderCacheService._despejar(manter=caminho)
+        return caminho
+
+    @staticmethod
+    def obter_ou_renderizar(chave, renderizar, extensao="mp3", audio_id=None, edit_id=None):
+        """
+        Retorna o caminho do resultado em cache. Se não estiver lá, chama renderizar(destino),
+        que deve gravar o resultado em `destino`, e guarda o arquivo gerado no cache. Com
+        `audio_id`, o resultado é uma versão desse áudio (cabeça `edit_id`) e também fica no
+        BlobStoreService, de onde é remontado antes de se tentar renderizar de novo.
+        """
+        if audio_id is None:
+            caminho = RenderCacheService.obter(chave, extensao)
+        else:
+            caminho = RenderCacheService.obter_ou_restaurar(chave, extensao)
+        if caminho:
+            return caminho
+
+        caminho = RenderCacheService._caminho(chave, extensao)
+        tmp_path = f"{caminho}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            renderizar(tmp_path)
+            if audio_id is not None:
+                BlobStoreService.guardar(chave, tmp_path, audio_id, edit_id)
+            os.replace(tmp_path, caminho)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        RenderCacheService._despejar(manter=caminho)
+        return caminho
+
+    @staticmethod
+    def _caminho(chave, extensao):
+        return os.path.join(CACHE_DIR, f"{chave}.{extensao}")
+
+    @staticmethod
+    def _despejar(manter=None):
+        """Remove as entradas menos usadas recentemente até o cache caber na cota"""
+        entradas = []
+        total = 0
+        for nome in os.listdir(CACHE_DIR):
+            if nome.endswith(".tmp"):
+                continue  # Renderização em andamento
+            caminho = os.path.join(CACHE_DIR, nome)
+            try:
+                stat = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            entradas.append((stat.st_atime, stat.st_size, caminho))
+
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= RENDER_CACHE_MAX_BYTES:
+                break
+            if caminho == manter:
+                continue
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+            total -= tamanho
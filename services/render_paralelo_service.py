@@ -0,0 +1,141 @@
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from services.efeitos_service import EFEITOS, EfeitosService
+
+RENDER_PARALELO_PROCESSOS = int(os.environ.get("RENDER_PARALELO_PROCESSOS", os.cpu_count() or 2))
+RENDER_PARALELO_MIN_SEGUNDOS = float(os.environ.get("RENDER_PARALELO_MIN_SEGUNDOS", 120))
+SEGMENTO_MIN_SEGUNDOS = 30  # Segmentos menores gastam mais com o aquecimento do que ganham
+QUADRO = 1152  # Amostras por frame MP3: as fronteiras dos segmentos caem em múltiplos disso
+BLOCO_SEGMENTO = 256 * 1024  # Amostras por bloco dentro de um segmento
+
+
+def _processar_segmento(pcm_path, canais, intervalos, nome, parametros, taxa, total, inicio, fim, saida_path):
+    """
+    Executa num processo do pool: aplica o efeito às amostras [inicio, fim) da saída do
+    estágio e grava o resultado (PCM s16le) em `saida_path`. Fica fora da classe para
+    poder ser enviado ao pool.
+    """
+    amostras = np.memmap(pcm_path, dtype=np.int16, mode="r").reshape(-1, canais)
+
+    def gerar_trecho(a, b):
+        for x, y in RenderParaleloService.recortar(intervalos, a, b):
+            for pos in range(x, y, BLOCO_SEGMENTO):
+                yield amostras[pos:min(pos + BLOCO_SEGMENTO, y)]
+
+    with open(saida_path, "wb") as f:
+        for bloco in EfeitosService.aplicar_trecho(nome, parametros, gerar_trecho, taxa, canais, total,
+                                                   inicio, fim, alinhamento=QUADRO):
+            f.write(bloco.tobytes())
+
+
+class RenderParaleloService:
+    """
+    Renderização de efeitos em segmentos paralelos, para áudios longos.
+
+    A saída do estágio é dividida em um segmento por processo, com as fronteiras em
+    múltiplos de um frame MP3. Cada segmento começa a aplicar o efeito um pouco antes da
+    fronteira (Efeito.aquecimento) para chegar nela com o estado de uma renderização
+    contínua, e o trecho de aquecimento é descartado. Os segmentos são gravados como PCM e
+    entregues em ordem ao mesmo encoder, então não há emendas na codificação.
+
+    O resultado difere da renderização contínua em no máximo 1 LSB: o resto da cauda do
+    reverb (abaixo de -100 dB) e o arredondamento das FFTs do equalizador, que têm outro
+    tamanho nos segmentos. O compressor sai igual, porque as suas janelas seguem a posição
+    absoluta no áudio, e os efeitos que analisam o áudio inteiro não são divididos.
+    """
+
+    _pool = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def aplicavel(amostras, nome, total, taxa):
+        """Se vale a pena (e é possível) renderizar o efeito em segmentos"""
+        return (
+            RENDER_PARALELO_PROCESSOS > 1
+            and isinstance(amostras, np.memmap)
+            and not EFEITOS[nome].analisa  # A análise precisaria do áudio inteiro antes
+            and total >= RENDER_PARALELO_MIN_SEGUNDOS * taxa
+        )
+
+    @staticmethod
+    def aplicar(amostras, intervalos, nome, parametros, taxa, prefixo):
+        """
+        Gera os blocos int16 do efeito aplicado à concatenação de `intervalos` de `amostras`
+        (np.memmap), na ordem. Os segmentos são gravados em `{prefixo}_segmentoN.pcm` e
+        removidos à medida que são entregues.
+        """
+        canais = amostras.shape[1]
+        total = sum(b - a for a, b in intervalos)
+        segmentos = max(min(RENDER_PARALELO_PROCESSOS, int(total / (SEGMENTO_MIN_SEGUNDOS * taxa))), 1)
+        tamanho = math.ceil(total / segmentos / QUADRO) * QUADRO
+
+        futuros = []
+        try:
+            for k, inicio in enumerate(range(0, total, tamanho)):
+                saida_path = f"{prefixo}_segmento{k}.pcm"
+                futuro, pool = RenderParaleloService._submeter(
+                    amostras.filename, canais, intervalos, nome, parametros, taxa, total, inicio,
+                    min(inicio + tamanho, total), saida_path)
+                futuros.append((futuro, pool, saida_path))
+
+            for futuro, pool, saida_path in futuros:
+                try:
+                    futuro.result()
+                except BrokenProcessPool:
+                    # Um processo do pool morreu (ex.: OOM): esta renderização falha, mas as
+                    # próximas usam um pool novo
+                    RenderParaleloService._descartar_pool(pool)
+                    raise
+                if os.path.getsize(saida_path):
+                    segmento = np.memmap(saida_path, dtype=np.int16, mode="r").reshape(-1, canais)
+                    for pos in range(0, len(segmento), BLOCO_SEGMENTO):
+                        yield segmento[pos:pos + BLOCO_SEGMENTO]
+                    del segmento
+                os.remove(saida_path)
+        finally:
+            for futuro, _, _ in futuros:
+                futuro.cancel()
+
+    @staticmethod
+    def recortar(intervalos, inicio, fim):
+        """Intervalos da fonte que formam as amostras [inicio, fim) da concatenação de `intervalos`"""
+        resultado = []
+        pos = 0
+        for a, b in intervalos:
+            x = max(inicio - pos, 0)
+            y = min(fim - pos, b - a)
+            if y > x:
+                resultado.append((a + x, a + y))
+            pos += b - a
+        return resultado
+
+    @staticmethod
+    def _submeter(*args):
+        """Envia um segmento ao pool, recriando-o se estiver quebrado; retorna (futuro, pool)"""
+        pool = RenderParaleloService._obter_pool()
+        try:
+            return pool.submit(_processar_segmento, *args), pool
+        except BrokenProcessPool:
+            RenderParaleloService._descartar_pool(pool)
+            pool = RenderParaleloService._obter_pool()
+            return pool.submit(_processar_segmento, *args), pool
+
+    @staticmethod
+    def _descartar_pool(pool):
+        with RenderParaleloService._lock:
+            if RenderParaleloService._pool is pool:
+                RenderParaleloService._pool = None
+        pool.shutdown(wait=False)
+
+    @staticmethod
+    def _obter_pool():
+        with RenderParaleloService._lock:
+            if RenderParaleloService._pool is None:
+                RenderParaleloService._pool = ProcessPoolExecutor(max_workers=RENDER_PARALELO_PROCESSOS)
+            return RenderParaleloService._pool
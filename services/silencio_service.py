@@ -0,0 +1,149 @@
+import os
+import re
+
+import numpy as np
+
+from database import conectar
+from services.edl_service import EdlService
+from services.ffmpeg_service import RETRY_AFTER
+from services.job_service import JobService
+from services.render_cache_service import RenderCacheService
+
+UPLOAD_DIR = "uploads"
+CACHE_DIR = os.path.join("cache", "silencios")
+JANELA_RMS_S = 0.01  # Resolução do envelope: um valor de RMS a cada 10 ms
+BLOCO_JANELAS = 8192  # Janelas calculadas por leitura do PCM
+LIMIAR_PADRAO_DB = -40.0
+MINIMO_PADRAO_S = 0.5
+MARGEM_PADRAO_S = 0.1  # Áudio mantido de cada lado de um silêncio removido, para não cortar a fala
+PISO_DB = -100.0
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+class SilencioService:
+    """
+    Índice de silêncios de um áudio.
+
+    O envelope de RMS (dBFS, uma janela a cada JANELA_RMS_S) da versão atual é calculado uma
+    vez, com NumPy sobre o PCM, e guardado em cache/silencios (chave = original + lista de
+    edições). O cálculo é feito pelo job "analisar", junto com os picos da forma de onda, e
+    não na requisição. Os intervalos de silêncio para um limiar e uma duração mínima saem do
+    envelope com algumas operações vetorizadas, sem ler o áudio de novo.
+    """
+
+    @staticmethod
+    def obter_audio(audio_id, user_id, limiar_db=LIMIAR_PADRAO_DB, minimo_s=MINIMO_PADRAO_S):
+        """Silêncios da versão atual de um áudio que pertence ao usuário"""
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT af.file_path, af.file_name, paf.project_id FROM audio_files af
+            JOIN projectos_audio_files paf ON af.id = paf.audio_id
+            JOIN projectos p ON paf.project_id = p.id
+            WHERE af.id = %s AND p.user_id = %s
+        """, (audio_id, user_id))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if not result:
+            return {"status": "erro", "message": "Áudio não encontrado"}
+
+        file_path = re.sub(r'^https?://localhost:\d+/', '', result[0])
+        if not file_path.startswith(UPLOAD_DIR):
+            file_path = os.path.join(UPLOAD_DIR, file_path.lstrip("/"))
+        if not os.path.exists(file_path):
+            return {"status": "erro", "message": "Arquivo de áudio não encontrado."}
+
+        if minimo_s <= 0:
+            return {"status": "erro", "message": "minimo deve ser maior que zero"}
+
+        envelope = SilencioService.envelope(audio_id, file_path)
+        if envelope is None:
+            return SilencioService.analisar(result[2], result[1], user_id)
+        silencios = SilencioService.detectar(envelope, limiar_db, minimo_s)
+        return {
+            "status": "sucesso",
+            "audio_id": audio_id,
+            "limiar_db": limiar_db,
+            "minimo_s": minimo_s,
+            "duracao": round(len(envelope) * JANELA_RMS_S, 2),
+            "total_silencio": round(sum(b - a for a, b in silencios), 2),
+            "silencios": silencios,
+        }
+
+    @staticmethod
+    def envelope(audio_id, file_path, edicoes=None):
+        """Envelope de RMS (dBFS, float32) da versão atual, ou None se ainda não foi calculado"""
+        caminho = SilencioService.caminho(audio_id, file_path, edicoes)
+        if not os.path.exists(caminho):
+            return None
+        return np.load(caminho, mmap_mode="r")
+
+    @staticmethod
+    def caminho(audio_id, file_path, edicoes=None):
+        """Arquivo do envelope da versão com as `edicoes` (as atuais, por padrão)"""
+        if edicoes is None:
+            edicoes = EdlService.listar(audio_id)
+        chave = RenderCacheService.chave(
+            [file_path], "silencios",
+            {"edicoes": [[e["edit_type"], e["start_time"], e["end_time"], e["parametros"]] for e in edicoes],
+             "janela": JANELA_RMS_S})
+        return os.path.join(CACHE_DIR, chave[:32] + ".npy")
+
+    @staticmethod
+    def analisar(project_id, file_name, user_id):
+        """Envia o job que calcula o envelope da versão atual; resposta "pendente" com o `job_url`"""
+        job = JobService.submeter_unico(user_id, project_id, "analisar",
+                                        {"project_id": project_id, "file_name": file_name, "user_id": user_id})
+        if job["status"] != "pendente":
+            return job
+        return {"status": "pendente", "message": "Silêncios em cálculo, tente novamente em instantes",
+                "job_url": job["job_url"], "retry_after": RETRY_AFTER}
+
+    @staticmethod
+    def detectar(envelope, limiar_db, minimo_s, margem_s=0.0):
+        """
+        Intervalos [inicio, fim] (segundos) em que o envelope fica abaixo de `limiar_db` por
+        pelo menos `minimo_s`. Com `margem_s`, cada intervalo encolhe esse tanto de cada lado,
+        exceto no começo e no fim do áudio.
+        """
+        abaixo = np.concatenate([[False], np.asarray(envelope) < limiar_db, [False]])
+        bordas = np.flatnonzero(np.diff(abaixo.astype(np.int8)))
+        inicios, fins = bordas[0::2], bordas[1::2]  # Em janelas; fins exclusivos
+
+        longos = (fins - inicios) * JANELA_RMS_S >= minimo_s
+        inicios = inicios[longos] * JANELA_RMS_S
+        fins = fins[longos] * JANELA_RMS_S
+        duracao = len(envelope) * JANELA_RMS_S
+
+        inicios = np.where(inicios > 0, inicios + margem_s, inicios)
+        fins = np.where(fins < duracao, fins - margem_s, fins)
+        validos = fins > inicios
+        return [[round(float(a), 3), round(float(b), 3)] for a, b in zip(inicios[validos], fins[validos])]
+
+    @staticmethod
+    def calcular(amostras, taxa, caminho):
+        """Calcula o RMS de cada janela das amostras (PCM int16, uma linha por amostra)"""
+        janela = max(int(round(JANELA_RMS_S * taxa)), 1)
+        canais = amostras.shape[1]
+
+        partes = []
+        passo = janela * BLOCO_JANELAS
+        for pos in range(0, len(amostras), passo):
+            bloco = amostras[pos:pos + passo].astype(np.float32) / 32768
+            completos = len(bloco) - len(bloco) % janela
+            energia = np.square(bloco)
+            if completos:
+                partes.append(energia[:completos].reshape(-1, janela * canais).mean(axis=1))
+            if completos < len(bloco):  # Última janela parcial (só no fim do áudio)
+                partes.append(energia[completos:].mean(keepdims=True).reshape(1))
+
+        energia = np.concatenate(partes) if partes else np.zeros(0, dtype=np.float32)
+        envelope = np.maximum(10 * np.log10(np.maximum(energia, 1e-12)), PISO_DB).astype(np.float32)
+
+        tmp_path = f"{caminho}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, envelope)
+        os.replace(tmp_path, caminho)
@@ -0,0 +1,277 @@
+import math
+
+import ffmpeg
+import numpy as np
+
+from services.ffmpeg_service import FfmpegService
+from services.mp3_frame_service import Mp3FrameService
+
+ATRASO_ENCODER = 1105  # 576 (LAME) + 529 (decodificador), como o FFmpeg reporta em initial_padding
+FRAMES_AQUECIMENTO = 4  # Frames decodificados antes do trecho para encher o bit reservoir
+BITRATE_PONTE = {1152: "320k", 576: "160k"}  # Bitrate máximo: sobra espaço para o reservoir
+
+
+class SmartRenderService:
+    """
+    Renderização "inteligente" de MP3: os frames que não são afetados pela edição são
+    copiados byte a byte, e só os frames nos pontos de corte são decodificados e
+    codificados de novo (as "pontes").
+
+    As pontes são codificadas sem bit reservoir, então nenhum frame da ponte depende de
+    bytes de outro frame. Quando o primeiro frame copiado depois de uma ponte usa o
+    reservoir (main_data_begin > 0), os bytes que ele espera são gravados no espaço livre
+    do último frame da ponte. A precisão dos cortes é de um frame (~26 ms a 44,1 kHz).
+    """
+
+    @staticmethod
+    def renderizar(file_path, trechos, novo_path, indice=None):
+        """
+        Gera `novo_path` com os trechos (inicio, fim) de `file_path` concatenados, copiando os
+        frames intactos. `indice` é o índice de frames já gravado do arquivo, se houver.
+        Retorna a duração do resultado, ou None se o arquivo não puder ser renderizado
+        assim (o chamador deve fazer a renderização completa).
+        """
+        if indice is None:
+            indice = Mp3FrameService.indexar(file_path)
+        if indice is None or len(indice["offsets"]) == 0:
+            return None
+
+        with open(file_path, "rb") as f:
+            dados = f.read()
+
+        entradas = SmartRenderService._planejar(indice, trechos)
+        if entradas is None:
+            return None
+
+        partes = []
+        total_frames = 0
+        for i, entrada in enumerate(entradas):
+            if entrada[0] == "copia":
+                _, k0, k1 = entrada
+                inicio = int(indice["offsets"][k0])
+                fim = int(indice["offsets"][k1 - 1] + indice["tamanhos"][k1 - 1])
+                partes.append(dados[inicio:fim])
+                total_frames += k1 - k0
+                continue
+
+            anterior = entradas[i - 1] if i > 0 else None
+            seguinte = entradas[i + 1] if i + 1 < len(entradas) else None
+            frames = SmartRenderService._codificar_ponte(dados, indice, entrada[1], anterior, seguinte)
+            if frames is None:
+                return None
+            partes.extend(frames)
+            total_frames += len(frames)
+
+        with open(novo_path, "wb") as f:
+            for parte in partes:
+                f.write(parte)
+
+        return round(total_frames * indice["amostras_por_frame"] / indice["taxa"], 2)
+
+    @staticmethod
+    def _planejar(indice, trechos):
+        """
+        Converte os trechos em segundos numa lista de entradas ("copia", k0, k1) com frames
+        copiados e ("ponte", [(s0, s1), ...]) com intervalos de amostras a recodificar.
+        As amostras estão na linha do tempo do fluxo MP3 (inclui o atraso do encoder).
+        """
+        spf = indice["amostras_por_frame"]
+        taxa = indice["taxa"]
+        atraso = indice["atraso"]
+        n_frames = len(indice["offsets"])
+        total = n_frames * spf
+
+        entradas = []
+
+        def adicionar_pcm(s0, s1):
+            if s1 <= s0:
+                return
+            if entradas and entradas[-1][0] == "ponte":
+                entradas[-1][1].append((s0, s1))
+            else:
+                entradas.append(("ponte", [(s0, s1)]))
+
+        for inicio, fim in trechos:
+            s0 = 0 if inicio <= 0 else min(int(round(inicio * taxa)) + atraso, total)
+            s1 = total if fim is None else min(int(round(fim * taxa)) + atraso, total)
+            if s1 <= s0:
+                continue
+
+            k0 = -(-s0 // spf)
+            k1 = s1 // spf
+            if k1 <= k0:
+                adicionar_pcm(s0, s1)
+                continue
+
+            adicionar_pcm(s0, k0 * spf)
+            if entradas and entradas[-1][0] == "copia" and entradas[-1][2] == k0:
+                entradas[-1] = ("copia", entradas[-1][1], k1)  # Continua exatamente de onde parou
+            else:
+                entradas.append(("copia", k0, k1))
+            adicionar_pcm(k1 * spf, s1)
+
+        # Todo frame copiado que usa o reservoir precisa de uma ponte antes dele para guardar
+        # esses bytes; se não houver, o primeiro frame copiado passa a fazer parte da ponte.
+        i = 0
+        while i < len(entradas):
+            entrada = entradas[i]
+            if entrada[0] == "copia":
+                _, k0, k1 = entrada
+                anterior = entradas[i - 1] if i > 0 else None
+                ponte_ok = anterior is not None and anterior[0] == "ponte" and \
+                    SmartRenderService._amostras(anterior[1]) >= spf
+                if indice["main_data_begin"][k0] > 0 and not ponte_ok:
+                    if anterior is None or anterior[0] != "ponte":
+                        entradas.insert(i, ("ponte", []))
+                        i += 1
+                    entradas[i - 1][1].append((k0 * spf, (k0 + 1) * spf))
+                    if k0 + 1 == k1:
+                        del entradas[i]
+                        if i < len(entradas) and entradas[i][0] == "ponte":
+                            entradas[i - 1][1].extend(entradas.pop(i)[1])
+                        continue
+                    entradas[i] = ("copia", k0 + 1, k1)
+                    continue
+            i += 1
+
+        # Cada ponte precisa ter um número inteiro de frames: as amostras que sobram são
+        # removidas do ponto de corte (fim do primeiro intervalo)
+        for entrada in entradas:
+            if entrada[0] != "ponte":
+                continue
+            intervalos = entrada[1]
+            sobra = SmartRenderService._amostras(intervalos) % spf
+            while sobra > 0:
+                s0, s1 = intervalos[0]
+                remover = min(sobra, s1 - s0)
+                intervalos[0] = (s0, s1 - remover)
+                sobra -= remover
+                if intervalos[0][1] <= intervalos[0][0]:
+                    intervalos.pop(0)
+
+        entradas = [e for e in entradas if e[0] == "copia" or e[1]]
+        if not any(e[0] == "copia" for e in entradas):
+            return None  # Nada a copiar: a renderização completa é mais simples
+        return entradas
+
+    @staticmethod
+    def _codificar_ponte(dados, indice, intervalos, anterior, seguinte):
+        """Recodifica os intervalos de uma ponte e retorna a lista de frames (bytes)"""
+        spf = indice["amostras_por_frame"]
+        taxa = indice["taxa"]
+        canais = indice["canais"]
+        total = len(indice["offsets"]) * spf
+
+        # O encoder atrasa a saída em ATRASO_ENCODER amostras: com um pré-roll do áudio que
+        # antecede a ponte, o primeiro intervalo cai exatamente no início de um frame.
+        descartar = math.ceil(ATRASO_ENCODER / spf)
+        tamanho_pre_roll = descartar * spf - ATRASO_ENCODER
+
+        if anterior is None:
+            pre_roll = np.zeros((tamanho_pre_roll, canais), dtype=np.int16)
+        else:
+            fim_anterior = anterior[2] * spf if anterior[0] == "copia" else anterior[1][-1][1]
+            pre_roll = SmartRenderService._decodificar(
+                dados, indice, max(fim_anterior - tamanho_pre_roll, 0), fim_anterior)
+            if len(pre_roll) < tamanho_pre_roll:
+                faltando = np.zeros((tamanho_pre_roll - len(pre_roll), canais), dtype=np.int16)
+                pre_roll = np.concatenate([faltando, pre_roll])
+
+        # Pós-roll: o áudio que vem depois da ponte, para o encoder fechar o último frame
+        if seguinte is not None and seguinte[1] * spf + spf <= total:
+            pos_roll = SmartRenderService._decodificar(dados, indice, seguinte[1] * spf, seguinte[1] * spf + spf)
+        else:
+            pos_roll = np.zeros((spf, canais), dtype=np.int16)
+
+        blocos = [pre_roll]
+        for s0, s1 in intervalos:
+            blocos.append(SmartRenderService._decodificar(dados, indice, s0, s1))
+        blocos.append(pos_roll)
+        pcm = np.concatenate(blocos)
+
+        saida = FfmpegService.executar(
+            ffmpeg
+            .input("pipe:", format="s16le", ac=canais, ar=taxa)
+            .output("pipe:", format="mp3", acodec="libmp3lame", audio_bitrate=BITRATE_PONTE[spf],
+                    reservoir=0, write_xing=0, id3v2_version=0),
+            input=pcm.tobytes(), capture_stdout=True
+        )
+
+        indice_ponte = Mp3FrameService.indexar_bytes(saida)
+        n_frames = SmartRenderService._amostras(intervalos) // spf
+        if indice_ponte is None or len(indice_ponte["offsets"]) < descartar + n_frames:
+            return None
+
+        frames = []
+        for k in range(descartar, descartar + n_frames):
+            inicio = int(indice_ponte["offsets"][k])
+            frames.append(bytearray(saida[inicio:inicio + int(indice_ponte["tamanhos"][k])]))
+
+        if seguinte is not None and indice["main_data_begin"][seguinte[1]] > 0:
+            if not SmartRenderService._gravar_reservatorio(dados, indice, seguinte[1], frames[-1]):
+                return None
+
+        return [bytes(frame) for frame in frames]
+
+    @staticmethod
+    def _gravar_reservatorio(dados, indice, k, frame):
+        """
+        Copia para o final do `frame` (último da ponte) os bytes de main data que o frame
+        original `k` espera encontrar nos frames anteriores. Retorna False se não couber.
+        """
+        necessario = int(indice["main_data_begin"][k])
+        cabecalho = Mp3FrameService.ler_cabecalho(frame, 0)
+        livre = len(frame) - Mp3FrameService.inicio_payload(0, cabecalho) - \
+            Mp3FrameService.tamanho_main_data(frame, 0, cabecalho)
+        if necessario > livre:
+            return False
+
+        partes = []
+        j = k - 1
+        while necessario > 0 and j >= 0:
+            pos = int(indice["offsets"][j])
+            cabecalho_j = Mp3FrameService.ler_cabecalho(dados, pos)
+            payload = dados[Mp3FrameService.inicio_payload(pos, cabecalho_j):pos + int(indice["tamanhos"][j])]
+            pedaco = payload[-necessario:] if necessario < len(payload) else payload
+            partes.insert(0, pedaco)
+            necessario -= len(pedaco)
+            j -= 1
+        if necessario > 0:
+            return False
+
+        reservatorio = b"".join(partes)
+        frame[len(frame) - len(reservatorio):] = reservatorio
+        return True
+
+    @staticmethod
+    def _decodificar(dados, indice, s0, s1):
+        """Decodifica as amostras [s0, s1) da linha do tempo do MP3 a partir dos frames originais"""
+        spf = indice["amostras_por_frame"]
+        canais = indice["canais"]
+        if s1 <= s0:
+            return np.zeros((0, canais), dtype=np.int16)
+
+        k0 = s0 // spf
+        k1 = -(-s1 // spf)
+        ki = max(k0 - FRAMES_AQUECIMENTO, 0)
+        inicio = int(indice["offsets"][ki])
+        fim = int(indice["offsets"][k1 - 1] + indice["tamanhos"][k1 - 1])
+
+        saida = FfmpegService.executar(
+            ffmpeg
+            .input("pipe:", format="mp3")
+            .output("pipe:", format="s16le", acodec="pcm_s16le", ac=canais, ar=indice["taxa"]),
+            input=dados[inicio:fim], capture_stdout=True
+        )
+        pcm = np.frombuffer(saida, dtype=np.int16).reshape(-1, canais)
+
+        # Os frames de aquecimento podem sair incompletos; o final do bloco é sempre exato
+        necessario = (k1 - k0) * spf
+        if len(pcm) < necessario:
+            pcm = np.concatenate([np.zeros((necessario - len(pcm), canais), dtype=np.int16), pcm])
+        pcm = pcm[len(pcm) - necessario:]
+        return pcm[s0 - k0 * spf:s1 - k0 * spf]
+
+    @staticmethod
+    def _amostras(intervalos):
+        return sum(s1 - s0 for s0, s1 in intervalos)
@@ -0,0 +1,288 @@
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+
+from database import conectar
+from multipart import BLOCO_LEITURA, ArquivoEnviado
+from services.projectos_service import ProjectosService
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos, só o modo threads é suportado
+    fcntl = None
+
+UPLOAD_DIR = "uploads"
+UPLOAD_SESSOES_DIR = os.path.join("cache", "uploads")  # Fora de uploads: /uploads serve o que estiver lá
+UPLOAD_RETOMAVEL_TAMANHO_MAX = int(os.environ.get("UPLOAD_RETOMAVEL_TAMANHO_MAX", 16 * 1024 ** 3))  # 16 GiB
+UPLOAD_SESSAO_EXPIRACAO_HORAS = 24  # Sem receber nenhum trecho nesse tempo, a sessão é apagada
+UPLOAD_SESSOES_MAX_POR_USUARIO = int(os.environ.get("UPLOAD_SESSOES_MAX_POR_USUARIO", 5))  # Em andamento
+
+os.makedirs(os.path.dirname(UPLOAD_SESSOES_DIR), exist_ok=True)
+if os.path.isdir(os.path.join(UPLOAD_DIR, "sessoes")) and not os.path.exists(UPLOAD_SESSOES_DIR):
+    # Local antigo, acessível por /uploads/sessoes; as sessões em andamento continuam valendo
+    os.replace(os.path.join(UPLOAD_DIR, "sessoes"), UPLOAD_SESSOES_DIR)
+os.makedirs(UPLOAD_SESSOES_DIR, exist_ok=True)
+
+
+class UploadService:
+    """
+    Uploads retomáveis, para gravações grandes.
+
+    O cliente cria uma sessão informando o tamanho total e envia o arquivo em trechos
+    (PATCH com o deslocamento de cada um). Se a conexão cair, consulta quantos bytes o
+    servidor já tem e continua dali. No fim, a sessão é finalizada e o arquivo segue o mesmo
+    caminho de um upload comum (ProjectosService.upload_audio ou criar_projecto).
+
+    O estado fica todo em disco, em cache/uploads: {id}.json com os dados da sessão e
+    {id}.part com os bytes recebidos, cujo tamanho é o deslocamento atual. Qualquer worker
+    continua qualquer upload; uma trava (flock no .part, entre processos, e um Lock por
+    sessão, entre as threads do processo) impede que duas requisições escrevam na mesma
+    sessão ao mesmo tempo. Cada usuário tem no máximo UPLOAD_SESSOES_MAX_POR_USUARIO sessões
+    em andamento.
+    """
+
+    _travas = weakref.WeakValueDictionary()  # upload_id -> Lock, enquanto alguma requisição o usa
+    _travas_lock = threading.Lock()
+
+    @staticmethod
+    def criar_sessao(user_id, file_name, tamanho, project_id=None, titulo=None):
+        """Cria a sessão de upload de um áudio para o projeto `project_id` ou para um projeto novo (`titulo`)"""
+        if not file_name or not (project_id or titulo):
+            return {"status": "erro", "message": "Informe file_name e project_id (ou titulo, para um projeto novo)"}
+        if not isinstance(tamanho, int) or tamanho <= 0:
+            return {"status": "erro", "message": "Tamanho inválido"}
+        if tamanho > UPLOAD_RETOMAVEL_TAMANHO_MAX:
+            return {"status": "erro",
+                    "message": f"Upload maior que o limite de {UPLOAD_RETOMAVEL_TAMANHO_MAX // 1024 ** 2} MB"}
+
+        # Conferir o nome antes de receber gigabytes que seriam recusados na finalização
+        normalized_filename = ProjectosService.normalizar_nome(os.path.basename(file_name))
+        if project_id:
+            try:
+                conn = conectar()
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id FROM audio_files WHERE file_name = %s AND file_path = %s",
+                    (normalized_filename, os.path.join(UPLOAD_DIR, normalized_filename))
+                )
+                existe = cursor.fetchone()
+                cursor.close()
+                conn.close()
+            except Exception as e:
+                return {"status": "erro", "message": str(e)}
+            if existe:
+                return {"status": "insucesso", "message": "Áudio já existe, tente com outro nome"}
+
+        if UploadService._contar_sessoes(user_id) >= UPLOAD_SESSOES_MAX_POR_USUARIO:
+            return {"status": "limite",
+                    "message": f"Limite de {UPLOAD_SESSOES_MAX_POR_USUARIO} uploads em andamento; "
+                               "finalize ou cancele um deles"}
+
+        upload_id = uuid.uuid4().hex
+        sessao = {
+            "user_id": user_id,
+            "project_id": project_id,
+            "titulo": titulo,
+            "file_name": os.path.basename(file_name),
+            "tamanho": tamanho,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        open(UploadService._caminho(upload_id, "part"), "wb").close()
+        tmp_path = UploadService._caminho(upload_id, "json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(sessao, f)
+        os.replace(tmp_path, UploadService._caminho(upload_id, "json"))
+
+        print(f"🔹 Sessão de upload {upload_id} criada: {sessao['file_name']} ({tamanho} bytes).")
+        return {"status": "sucesso", "upload_id": upload_id, "upload_url": f"/api/uploads/{upload_id}",
+                "offset": 0, "tamanho": tamanho}
+
+    @staticmethod
+    def obter_sessao(upload_id, user_id):
+        """Progresso da sessão: quantos bytes o servidor já recebeu"""
+        sessao = UploadService._carregar(upload_id, user_id)
+        if not sessao:
+            return {"status": "erro", "message": "Upload não encontrado"}
+
+        try:
+            offset = os.path.getsize(UploadService._caminho(upload_id, "part"))
+        except FileNotFoundError:
+            return {"status": "erro", "message": "Upload não encontrado"}
+
+        return {"status": "sucesso", "upload_id": upload_id, "file_name": sessao["file_name"],
+                "offset": offset, "tamanho": sessao["tamanho"]}
+
+    @staticmethod
+    def enviar_trecho(upload_id, user_id, offset, entrada, tamanho):
+        """
+        Acrescenta `tamanho` bytes de `entrada` à sessão, a partir de `offset`, que precisa
+        ser o deslocamento atual (status "conflito" se não for, com o deslocamento certo).
+        Se a conexão cair no meio, o que chegou fica gravado e o cliente continua dali.
+        """
+        sessao = UploadService._carregar(upload_id, user_id)
+        if not sessao:
+            return {"status": "erro", "message": "Upload não encontrado"}
+
+        f = UploadService._abrir(upload_id)
+        if not f:
+            return {"status": "erro", "message": "Upload não encontrado"}
+        with f, UploadService._travar(upload_id, f) as travado:
+            if not travado:
+                return {"status": "conflito", "message": "Outra requisição está enviando este upload",
+                        "offset": os.fstat(f.fileno()).st_size}
+
+            atual = os.fstat(f.fileno()).st_size
+            if offset != atual:
+                return {"status": "conflito", "message": "Upload-Offset diferente do recebido até agora",
+                        "offset": atual}
+            if atual + tamanho > sessao["tamanho"]:
+                return {"status": "erro", "message": "O trecho passa do tamanho declarado do upload",
+                        "offset": atual}
+
+            f.seek(atual)
+            recebidos = 0
+            try:
+                while recebidos < tamanho:
+                    dados = entrada.read(min(BLOCO_LEITURA, tamanho - recebidos))
+                    if not dados:
+                        break
+                    f.write(dados)
+                    recebidos += len(dados)
+            except OSError:
+                pass  # Conexão interrompida: o cliente consulta o deslocamento e reenvia o resto
+            f.flush()
+            atual = os.fstat(f.fileno()).st_size
+
+        return {"status": "sucesso", "upload_id": upload_id, "offset": atual, "tamanho": sessao["tamanho"],
+                "completo": atual == sessao["tamanho"]}
+
+    @staticmethod
+    def finalizar(upload_id, user_id, token):
+        """Entrega o arquivo completo a ProjectosService, como um upload comum, e apaga a sessão"""
+        sessao = UploadService._carregar(upload_id, user_id)
+        if not sessao:
+            return {"status": "erro", "message": "Upload não encontrado"}
+
+        part_path = UploadService._caminho(upload_id, "part")
+        f = UploadService._abrir(upload_id)
+        if not f:
+            return {"status": "erro", "message": "Upload não encontrado"}
+        with f, UploadService._travar(upload_id, f) as travado:
+            if not travado:
+                return {"status": "conflito", "message": "Outra requisição está enviando este upload",
+                        "offset": os.fstat(f.fileno()).st_size}
+
+            recebidos = os.fstat(f.fileno()).st_size
+            if recebidos != sessao["tamanho"]:
+                return {"status": "erro", "message": f"Upload incompleto: {recebidos} de {sessao['tamanho']} bytes",
+                        "offset": recebidos}
+
+            audio_file = ArquivoEnviado(sessao["file_name"], None, caminho=part_path)
+            if sessao["titulo"]:
+                resultado = ProjectosService.criar_projecto(token, sessao["titulo"], audio_file)
+            else:
+                resultado = ProjectosService.upload_audio(token, sessao["project_id"], audio_file)
+
+        # Se o serviço recusou antes de mover o arquivo, a sessão continua e pode ser finalizada de novo
+        if not os.path.exists(part_path):
+            UploadService._remover(upload_id)
+        return resultado
+
+    @staticmethod
+    def cancelar(upload_id, user_id):
+        if not UploadService._carregar(upload_id, user_id):
+            return {"status": "erro", "message": "Upload não encontrado"}
+
+        UploadService._remover(upload_id)
+        return {"status": "sucesso", "message": "Upload cancelado"}
+
+    @staticmethod
+    def limpar_expiradas(expiracao_horas=UPLOAD_SESSAO_EXPIRACAO_HORAS):
+        """Apaga as sessões abandonadas (chamado na subida do servidor)"""
+        limite = time.time() - expiracao_horas * 3600
+        removidas = 0
+        for nome in os.listdir(UPLOAD_SESSOES_DIR):
+            upload_id, extensao = os.path.splitext(nome)
+            if extensao != ".json":
+                continue
+            try:
+                part_path = UploadService._caminho(upload_id, "part")
+                ultima = os.path.getmtime(part_path if os.path.exists(part_path)
+                                          else UploadService._caminho(upload_id, "json"))
+                if ultima < limite:
+                    UploadService._remover(upload_id)
+                    removidas += 1
+            except OSError:
+                pass
+        if removidas:
+            print(f"🔹 {removidas} sessão(ões) de upload abandonada(s) removida(s).")
+
+    @staticmethod
+    def _carregar(upload_id, user_id):
+        """Dados da sessão, se ela existir e for do usuário"""
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(UploadService._caminho(upload_id, "json")) as f:
+                sessao = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return sessao if sessao["user_id"] == user_id else None
+
+    @staticmethod
+    def _abrir(upload_id):
+        """Abre o .part para escrita sem recriá-lo (se a sessão acabou de ser finalizada ou cancelada)"""
+        try:
+            return open(UploadService._caminho(upload_id, "part"), "r+b")
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    @contextmanager
+    def _travar(upload_id, arquivo):
+        """
+        Trava exclusiva e não bloqueante da sessão: entrega True se conseguiu. O Lock vale
+        entre as threads do processo (e é a única trava sem fcntl); o flock no arquivo, entre
+        processos, é solto quando o arquivo é fechado.
+        """
+        with UploadService._travas_lock:
+            trava = UploadService._travas.setdefault(upload_id, threading.Lock())
+        if not trava.acquire(blocking=False):
+            yield False
+            return
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+        finally:
+            trava.release()
+
+    @staticmethod
+    def _contar_sessoes(user_id):
+        """Quantas sessões de upload do usuário estão em andamento"""
+        total = 0
+        for nome in os.listdir(UPLOAD_SESSOES_DIR):
+            upload_id, extensao = os.path.splitext(nome)
+            if extensao == ".json" and UploadService._carregar(upload_id, user_id):
+                total += 1
+        return total
+
+    @staticmethod
+    def _remover(upload_id):
+        for extensao in ("part", "json"):
+            try:
+                os.remove(UploadService._caminho(upload_id, extensao))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _caminho(upload_id, extensao):
+        return os.path.join(UPLOAD_SESSOES_DIR, f"{upload_id}.{extensao}")
@@ -0,0 +1,358 @@
+"""
+Servidor WSGI de produção para a `application` de server.py.
+
+O wsgiref.simple_server atende uma requisição de cada vez: uma edição demorada trava os
+logins, as listagens e os áudios de todos. Aqui cada processo atende as conexões com um
+pool de threads (SERVIDOR_THREADS), com keep-alive do HTTP/1.1, e no modo prefork vários
+processos (SERVIDOR_PROCESSOS) aceitam conexões no mesmo socket. Arquivos devolvidos pelo
+wsgi.file_wrapper (estaticos.py) são enviados com sendfile, sem passar pelo Python.
+
+Modos (variável SERVIDOR_MODO):
+    - threads: um processo com o pool de threads (padrão em `python server.py`).
+    - prefork: um processo supervisor que abre o socket e cria os workers, cada um com o
+      seu pool de threads. Só em sistemas com fork (Linux, macOS).
+
+Uso em produção:
+    SERVIDOR_PROCESSOS=4 python servidor.py
+
+No modo prefork, SIGHUP faz um reload gracioso: o supervisor cria uma nova geração de
+workers, que importa o código de novo, e pede às antigas (SIGTERM) que parem de aceitar
+conexões e terminem as requisições em andamento. SIGTERM ou SIGINT no supervisor encerram
+todos os workers da mesma forma. O supervisor nunca importa a aplicação, então cada
+geração carrega a versão atual do código.
+"""
+
+import importlib
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+SERVIDOR_HOST = os.environ.get("SERVIDOR_HOST", "")
+SERVIDOR_PORTA = int(os.environ.get("SERVIDOR_PORTA", 8000))
+SERVIDOR_MODO = os.environ.get("SERVIDOR_MODO", "prefork" if hasattr(os, "fork") else "threads")
+SERVIDOR_THREADS = int(os.environ.get("SERVIDOR_THREADS", 32))  # Requisições simultâneas por processo
+SERVIDOR_PROCESSOS = int(os.environ.get("SERVIDOR_PROCESSOS", os.cpu_count() or 2))
+KEEPALIVE_TIMEOUT = float(os.environ.get("KEEPALIVE_TIMEOUT", 5))  # Segundos de conexão ociosa
+KEEPALIVE_MAX_REQUISICOES = 100  # Requisições por conexão antes de fechá-la
+CORPO_DESCARTE_MAX = 1024 * 1024  # Corpo não lido pela aplicação que ainda vale descartar para reusar a conexão
+WORKER_VIDA_MINIMA = 10  # Segundos: um worker que cai antes disso provavelmente falha na subida
+WORKER_REINICIO_ESPERA_MAX = 60  # Espera máxima (segundos) antes de recriar um worker que cai na subida
+APLICACAO = "server"  # Módulo com `application`, `inicializar` (uma vez na subida) e `finalizar`
+
+
+class _Entrada:
+    """wsgi.input limitado ao Content-Length, para saber quanto do corpo a aplicação não leu"""
+
+    def __init__(self, arquivo, tamanho):
+        self.arquivo = arquivo
+        self.restante = tamanho
+
+    def read(self, tamanho=-1):
+        if tamanho is None or tamanho < 0 or tamanho > self.restante:
+            tamanho = self.restante
+        dados = self.arquivo.read(tamanho) if tamanho else b""
+        self.restante -= len(dados)
+        return dados
+
+    def readline(self, tamanho=-1):
+        if tamanho is None or tamanho < 0 or tamanho > self.restante:
+            tamanho = self.restante
+        dados = self.arquivo.readline(tamanho) if tamanho else b""
+        self.restante -= len(dados)
+        return dados
+
+    def readlines(self, dica=-1):
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+class _ServerHandler(ServerHandler):
+    """Responde em HTTP/1.1; sem Content-Length a conexão é fechada no fim da resposta"""
+
+    http_version = "1.1"
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        if "Content-Length" not in self.headers or self.request_handler.close_connection:
+            self.request_handler.close_connection = True
+            self.headers["Connection"] = "close"
+
+    def sendfile(self):
+        """Envia o arquivo do wsgi.file_wrapper com sendfile, sem copiar o conteúdo para o Python"""
+        corpo = self.result.filelike
+        arquivo = getattr(corpo, "arquivo", corpo)  # estaticos.TrechoArquivo: o arquivo e o intervalo
+        try:
+            arquivo.fileno()
+            inicio = getattr(corpo, "inicio", None)
+            if inicio is None:
+                inicio = arquivo.tell()
+            tamanho = getattr(corpo, "tamanho", None)
+        except (AttributeError, OSError):
+            return False  # Não é um arquivo do sistema: o corpo é lido em blocos
+
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+        enviados = self.request_handler.connection.sendfile(arquivo, inicio, tamanho)
+        self.bytes_sent += enviados
+        return True
+
+
+class _RequisicaoHandler(WSGIRequestHandler):
+    """Atende várias requisições na mesma conexão (keep-alive) até o cliente ou o servidor fechar"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def handle(self):
+        self.close_connection = True
+        for atendidas in range(KEEPALIVE_MAX_REQUISICOES):
+            try:
+                if not self._atender():
+                    return
+            except (socket.timeout, ConnectionError):
+                return
+            if self.close_connection or self.server.encerrando:
+                return
+
+    def _atender(self):
+        """Lê e atende uma requisição. Retorna False se a conexão terminou antes dela"""
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline:
+            return False
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            return False
+        if not self.parse_request():
+            return False
+
+        environ = self.get_environ()
+        tamanho = int(environ.get("CONTENT_LENGTH") or 0)
+        if environ.get("HTTP_TRANSFER_ENCODING"):
+            self.close_connection = True  # Corpo chunked não é suportado: não dá para achar a próxima requisição
+        entrada = _Entrada(self.rfile, tamanho)
+
+        handler = _ServerHandler(entrada, self.wfile, self.get_stderr(), environ, multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+        # O que a aplicação não leu do corpo precisa sair do socket antes da próxima requisição
+        if entrada.restante > CORPO_DESCARTE_MAX:
+            self.close_connection = True
+        elif entrada.restante:
+            entrada.read()
+        return True
+
+    def log_message(self, format, *args):
+        pass  # Cada requisição já é registrada pela aplicação quando relevante
+
+
+class ServidorThreads(WSGIServer):
+    """WSGIServer que atende cada conexão numa thread de um pool de tamanho fixo"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, endereco, threads=SERVIDOR_THREADS, sock=None):
+        super().__init__(endereco, _RequisicaoHandler, bind_and_activate=sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            # Vários processos esperam no mesmo socket: quem perder a corrida pelo accept não
+            # pode ficar bloqueado nele (e surdo ao SIGTERM)
+            self.socket.setblocking(False)
+            self.server_address = sock.getsockname()
+            self.setup_environ()
+        self.encerrando = False
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="requisicao")
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        super().server_bind()
+
+    def setup_environ(self):
+        # Sem server_bind (socket herdado), server_name/server_port vêm do próprio socket
+        if not hasattr(self, "server_name"):
+            host, porta = self.socket.getsockname()[:2]
+            self.server_name = socket.getfqdn(host)
+            self.server_port = porta
+        super().setup_environ()
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def encerrar(self):
+        """Para de aceitar conexões e espera as requisições em andamento terminarem"""
+        self.encerrando = True
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def servir_threads(application, host=SERVIDOR_HOST, porta=SERVIDOR_PORTA, sock=None):
+    """Atende num único processo, com o pool de threads, até receber SIGTERM/SIGINT"""
+    servidor = ServidorThreads((host, porta), sock=sock)
+    servidor.set_app(application)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: servidor.encerrar())
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+def _worker(sock, pronto=None):
+    """
+    Processo worker: importa a aplicação e atende no socket herdado do supervisor. Com
+    `pronto` (o lado de escrita de um pipe), roda antes a inicialização da aplicação e
+    fecha o pipe quando ela termina.
+    """
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C chega ao supervisor, que encerra os workers
+    modulo = importlib.import_module(APLICACAO)
+    if pronto is not None:
+        if hasattr(modulo, "inicializar"):
+            modulo.inicializar()
+        os.close(pronto)
+    try:
+        servir_threads(modulo.application, sock=sock)
+    finally:
+        if hasattr(modulo, "finalizar"):
+            modulo.finalizar()
+
+
+def servir_prefork(host=SERVIDOR_HOST, porta=SERVIDOR_PORTA, processos=SERVIDOR_PROCESSOS):
+    """Supervisor do modo prefork: abre o socket, mantém `processos` workers e trata os sinais"""
+    # Os slots do FFmpeg são criados antes do fork, compartilhados por todos os workers
+    from services.ffmpeg_service import FfmpegService
+
+    sock = socket.create_server((host, porta), backlog=ServidorThreads.request_queue_size, reuse_port=False)
+    geracao = {}  # PID -> início de cada worker da geração atual
+    eventos = []
+    primeira = [True]
+    reinicios = []  # Quando recriar os workers que caíram
+    espera = [0]  # Atraso do próximo reinício, dobrado a cada worker que cai logo na subida
+
+    def criar_worker(inicializar=False):
+        leitura, pronto = os.pipe() if inicializar else (None, None)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                if leitura is not None:
+                    os.close(leitura)
+                _worker(sock, pronto)
+            finally:
+                os._exit(0)
+        geracao[pid] = time.monotonic()
+        if leitura is not None:
+            # Os outros workers só são criados depois da inicialização (que, por exemplo, dá
+            # como interrompidos os jobs que estavam executando): EOF quando ela termina ou
+            # se o worker cair
+            os.close(pronto)
+            os.read(leitura, 1)
+            os.close(leitura)
+
+    def criar_geracao():
+        antiga = list(geracao)
+        geracao.clear()
+        reinicios.clear()
+        espera[0] = 0
+        for i in range(processos):
+            criar_worker(inicializar=primeira[0] and i == 0)
+        primeira[0] = False
+        for pid in antiga:
+            _sinalizar(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGHUP, lambda *_: eventos.append("reload"))
+    signal.signal(signal.SIGTERM, lambda *_: eventos.append("parar"))
+    signal.signal(signal.SIGINT, lambda *_: eventos.append("parar"))
+
+    criar_geracao()
+    print(f"Servidor rodando na porta {porta} com {processos} processos x {SERVIDOR_THREADS} threads...")
+
+    while True:
+        if "parar" in eventos:
+            break
+        if "reload" in eventos:
+            eventos.remove("reload")
+            print("🔹 Reload: iniciando uma nova geração de workers.")
+            criar_geracao()
+
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid:
+            FfmpegService.liberar_processo(pid)  # O que um worker morto segurava volta para os outros
+        if pid and pid in geracao:  # Worker da geração atual caiu: substituir
+            if time.monotonic() - geracao.pop(pid) < WORKER_VIDA_MINIMA:
+                # Caiu logo na subida (erro de import, banco fora do ar): recriar na hora viraria
+                # um laço de fork; espera cada vez mais, até WORKER_REINICIO_ESPERA_MAX
+                espera[0] = min(max(espera[0] * 2, 1), WORKER_REINICIO_ESPERA_MAX)
+            else:
+                espera[0] = 0
+            print(f"Worker {pid} terminou inesperadamente; iniciando outro em {espera[0]}s.")
+            reinicios.append(time.monotonic() + espera[0])
+
+        for quando in [quando for quando in reinicios if quando <= time.monotonic()]:
+            reinicios.remove(quando)
+            criar_worker()
+        if not pid:
+            time.sleep(0.5)
+
+    for pid in geracao:
+        _sinalizar(pid, signal.SIGTERM)
+    sock.close()
+    while True:
+        try:
+            os.wait()
+        except ChildProcessError:
+            break
+    print("Servidor encerrado.")
+
+
+def _sinalizar(pid, sinal):
+    try:
+        os.kill(pid, sinal)
+    except ProcessLookupError:
+        pass
+
+
+def main():
+    if SERVIDOR_MODO == "prefork" and hasattr(os, "fork"):
+        servir_prefork()
+    else:
+        modulo = importlib.import_module(APLICACAO)
+        if hasattr(modulo, "inicializar"):
+            modulo.inicializar()
+        print(f"Servidor rodando na porta {SERVIDOR_PORTA} com {SERVIDOR_THREADS} threads...")
+        try:
+            servir_threads(modulo.application)
+        finally:
+            if hasattr(modulo, "finalizar"):
+                modulo.finalizar()
+
+
+if __name__ == "__main__":
+    main()